@@ -21,7 +21,13 @@ import subprocess
 import shlex
 import ctypes
 import subprocess
-from dataclasses import dataclass, field
+import heapq
+import sqlite3
+import zlib
+import itertools
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field, fields
 from dotenv import load_dotenv
 from discord.ext import commands, tasks
 from discord import ButtonStyle, app_commands, Interaction
@@ -34,11 +40,1090 @@ from typing import Optional
 from flask import Flask, request
 from flask_cors import CORS
 from threading import Thread
+import threading
+from queue import SimpleQueue
 from playwright.async_api import async_playwright
 from pathlib import Path
 from urllib.parse import urlparse
 
 
+# ============================================================================
+# Shared HTTP client (Riot API)
+#
+# One long-lived aiohttp session for every Riot call site instead of a fresh
+# ClientSession + certifi SSL context per request/poll:
+# - keep-alive pooling per routing host (americas.api..., na1.api..., ...)
+# - SSL context is built once (certifi bundle is parsed once per process)
+# - DNS results are cached, responses are requested gzip'd
+# The bot owns the instance and closes it on shutdown (see JeffBot.close).
+# ============================================================================
+
+RIOT_HTTP_LIMIT_PER_HOST = 8
+RIOT_HTTP_DNS_CACHE_SECONDS = 300
+RIOT_HTTP_KEEPALIVE_SECONDS = 60
+
+_SHARED_SSL_CONTEXT: ssl.SSLContext | None = None
+
+
+def _shared_ssl_context() -> ssl.SSLContext:
+    """certifi-backed SSL context, built once and reused by every pooled session."""
+    global _SHARED_SSL_CONTEXT
+    if _SHARED_SSL_CONTEXT is None:
+        _SHARED_SSL_CONTEXT = ssl.create_default_context(cafile=certifi.where())
+    return _SHARED_SSL_CONTEXT
+
+
+class SharedHTTPClient:
+    """Lazily-created, long-lived aiohttp session with per-host connection pooling."""
+
+    def __init__(self, *, limit_per_host: int = RIOT_HTTP_LIMIT_PER_HOST, headers: dict | None = None):
+        self._limit_per_host = int(limit_per_host)
+        self._headers = dict(headers or {})
+        self._session: aiohttp.ClientSession | None = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # Created on first use so it binds to the running event loop (not import time).
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                ssl=_shared_ssl_context(),
+                limit=0,
+                limit_per_host=self._limit_per_host,
+                ttl_dns_cache=RIOT_HTTP_DNS_CACHE_SECONDS,
+                keepalive_timeout=RIOT_HTTP_KEEPALIVE_SECONDS,
+            )
+            headers = {"Accept-Encoding": "gzip, deflate"}
+            headers.update(self._headers)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=20),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+_riot_http = SharedHTTPClient()
+
+
+# ============================================================================
+# Riot rate-limit scheduler
+#
+# Every Riot request goes through one token-bucket scheduler per routing host
+# (americas / na1 / ...). Budgets are learned from the response headers
+# (X-App-Rate-Limit / X-Method-Rate-Limit + their -Count twins) and 429s block
+# the offending scope for Retry-After seconds. Waiting requests are served by
+# priority, so live spectator checks jump ahead of rank lookups / backfills.
+# ============================================================================
+
+RIOT_PRIORITY_LIVE = 0       # spectator-v5 (prediction poller, auto-spectate)
+RIOT_PRIORITY_NORMAL = 1     # account/summoner lookups, match results
+RIOT_PRIORITY_RANK = 2       # league-v4 rank lookups (role table, Josh LP)
+RIOT_PRIORITY_BACKFILL = 3   # history / backfill jobs
+
+# Used until Riot tells us the real budget (personal/dev key defaults).
+RIOT_DEFAULT_APP_RATE_LIMIT = os.getenv("RIOT_APP_RATE_LIMIT", "20:1,100:120")
+RIOT_MAX_429_RETRIES = 2
+RIOT_RATE_LIMIT_SAFETY_SECONDS = 0.05
+
+_RIOT_METHOD_PATTERNS = [
+    (re.compile(r"/by-riot-id/[^/]+/[^/]+"), "/by-riot-id/{id}"),
+    (re.compile(r"/(by-puuid|by-summoner|by-account|by-name)/[^/]+"), r"/\1/{id}"),
+    (re.compile(r"/matches/(?!by-)[^/]+"), "/matches/{id}"),
+]
+
+
+def _riot_parse_rate_limit_header(value: str | None) -> list[tuple[int, int]]:
+    """'20:1,100:120' -> [(20, 1), (100, 120)] (count, window_seconds)."""
+    out: list[tuple[int, int]] = []
+    for part in str(value or "").split(","):
+        try:
+            count_s, window_s = part.strip().split(":", 1)
+            count, window = int(count_s), int(window_s)
+        except Exception:
+            continue
+        if count > 0 and window > 0:
+            out.append((count, window))
+    return out
+
+
+def _riot_method_key(url: str) -> tuple[str, str]:
+    """Return (routing host, method template) for a Riot API URL."""
+    parsed = urlparse(url)
+    path = parsed.path or "/"
+    for pattern, repl in _RIOT_METHOD_PATTERNS:
+        path = pattern.sub(repl, path)
+    return (parsed.netloc or "").lower(), path
+
+
+def _riot_default_priority(method: str) -> int:
+    if "/spectator/" in method:
+        return RIOT_PRIORITY_LIVE
+    if "/league/" in method:
+        return RIOT_PRIORITY_RANK
+    return RIOT_PRIORITY_NORMAL
+
+
+class RiotRateLimiter:
+    """Per-host priority queue in front of sliding-window app/method budgets."""
+
+    def __init__(self, default_app_limits: str = RIOT_DEFAULT_APP_RATE_LIMIT):
+        self._default_app_limits = _riot_parse_rate_limit_header(default_app_limits)
+        self._limits: dict[str, list[tuple[int, int]]] = {}    # scope -> [(count, window)]
+        self._hits: dict[str, deque] = {}                      # scope -> monotonic timestamps
+        self._blocked_until: dict[str, float] = {}             # scope -> monotonic deadline
+        self._queues: dict[str, list[tuple[int, int, str]]] = {}  # host -> heap of (priority, seq, method)
+        self._seq = itertools.count()
+        self._cond: asyncio.Condition | None = None
+
+    @staticmethod
+    def _app_scope(host: str) -> str:
+        return f"app:{host}"
+
+    @staticmethod
+    def _method_scope(host: str, method: str) -> str:
+        return f"method:{host}{method}"
+
+    def _condition(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    def _scope_limits(self, scope: str) -> list[tuple[int, int]]:
+        limits = self._limits.get(scope)
+        if limits is None and scope.startswith("app:"):
+            return self._default_app_limits
+        return limits or []
+
+    def _scope_delay(self, scope: str, now: float) -> float:
+        delay = max(0.0, self._blocked_until.get(scope, 0.0) - now)
+        hits = self._hits.get(scope)
+        if not hits:
+            return delay
+        for count, window in self._scope_limits(scope):
+            if len(hits) < count:
+                continue
+            # The count-th most recent hit must fall out of the window before we may fire again.
+            oldest = hits[-count]
+            if oldest > now - window:
+                delay = max(delay, oldest + window - now + RIOT_RATE_LIMIT_SAFETY_SECONDS)
+        return delay
+
+    def _delay_for(self, host: str, method: str, now: float) -> float:
+        return max(
+            self._scope_delay(self._app_scope(host), now),
+            self._scope_delay(self._method_scope(host, method), now),
+        )
+
+    def _record_hit(self, scope: str, now: float, n: int = 1) -> None:
+        hits = self._hits.setdefault(scope, deque())
+        for _ in range(max(0, int(n))):
+            hits.append(now)
+        longest = max((w for _c, w in self._scope_limits(scope)), default=120)
+        while hits and hits[0] <= now - longest:
+            hits.popleft()
+
+    def _next_ready(self, host: str, queue: list[tuple[int, int, str]], now: float) -> tuple[tuple | None, float | None]:
+        """(highest-priority ticket that may fire now, else None; shortest wait otherwise).
+
+        A ticket held back only by its own method budget (or a method-scope 429) doesn't
+        stall other methods on the same host; the shared app budget still applies to all.
+        """
+        delays: dict[str, float] = {}
+        shortest = None
+        for ticket in sorted(queue):
+            method = ticket[2]
+            if method not in delays:
+                delays[method] = self._delay_for(host, method, now)
+            if delays[method] <= 0:
+                return ticket, None
+            shortest = delays[method] if shortest is None else min(shortest, delays[method])
+        return None, shortest
+
+    async def acquire(self, host: str, method: str, priority: int = RIOT_PRIORITY_NORMAL) -> None:
+        """Wait until (host, method) has budget and no higher-priority request that could fire is queued ahead."""
+        cond = self._condition()
+        async with cond:
+            ticket = (int(priority), next(self._seq), method)
+            queue = self._queues.setdefault(host, [])
+            heapq.heappush(queue, ticket)
+            cond.notify_all()
+            try:
+                while True:
+                    now = time.monotonic()
+                    ready, timeout = self._next_ready(host, queue, now)
+                    if ready == ticket:
+                        queue.remove(ticket)
+                        heapq.heapify(queue)
+                        self._record_hit(self._app_scope(host), now)
+                        self._record_hit(self._method_scope(host, method), now)
+                        cond.notify_all()
+                        return
+                    if ready is not None:
+                        timeout = None  # someone else goes first; they notify when done
+                    try:
+                        await asyncio.wait_for(cond.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                if ticket in queue:
+                    queue.remove(ticket)
+                    heapq.heapify(queue)
+                    cond.notify_all()
+                raise
+
+    def observe(self, host: str, method: str, status: int, headers) -> None:
+        """Learn budgets/counts from a Riot response and honour Retry-After on 429."""
+        now = time.monotonic()
+        app_scope = self._app_scope(host)
+        method_scope = self._method_scope(host, method)
+
+        for scope, limit_hdr, count_hdr in (
+            (app_scope, "X-App-Rate-Limit", "X-App-Rate-Limit-Count"),
+            (method_scope, "X-Method-Rate-Limit", "X-Method-Rate-Limit-Count"),
+        ):
+            limits = _riot_parse_rate_limit_header(headers.get(limit_hdr))
+            if limits:
+                self._limits[scope] = limits
+            # Riot's own counters win if they are ahead of ours (restart / shared key).
+            hits = self._hits.get(scope) or deque()
+            for server_count, window in _riot_parse_rate_limit_header(headers.get(count_hdr)):
+                local = sum(1 for t in hits if t > now - window)
+                if server_count > local:
+                    self._record_hit(scope, now, server_count - local)
+
+        if int(status) == 429:
+            try:
+                retry_after = float(headers.get("Retry-After") or 0)
+            except Exception:
+                retry_after = 0.0
+            limit_type = str(headers.get("X-Rate-Limit-Type") or "").lower()
+            scope = app_scope if limit_type == "application" else method_scope
+            retry_after = retry_after if retry_after > 0 else 5.0
+            self._blocked_until[scope] = max(self._blocked_until.get(scope, 0.0), now + retry_after)
+            print(f"[RiotRL] 429 ({limit_type or 'service'}) on {host}{method}; backing off {retry_after:.0f}s")
+
+
+_riot_limiter = RiotRateLimiter()
+
+
+# Single-flight: concurrent callers of the same URL share one in-flight request.
+# Spectator answers (in game / not in game) are additionally reused for a few seconds,
+# so the prediction poller, auto-spectate and role-table refreshes don't double-spend.
+RIOT_SPECTATOR_MICRO_TTL_SECONDS = 10
+
+_riot_inflight: dict[str, asyncio.Future] = {}
+_riot_inflight_waiters: dict[asyncio.Future, int] = {}
+_riot_micro_cache: dict[str, tuple[float, int, object]] = {}  # url -> (expires_monotonic, status, payload)
+
+
+def _riot_request_done(url: str, fut: asyncio.Future) -> None:
+    _riot_inflight.pop(url, None)
+    if fut.cancelled() or fut.exception() is not None:
+        return
+    status, payload = fut.result()
+    _host, method = _riot_method_key(url)
+    if "/spectator/" in method and status in (200, 404):
+        now = time.monotonic()
+        for k in [k for k, v in _riot_micro_cache.items() if v[0] <= now]:
+            _riot_micro_cache.pop(k, None)
+        _riot_micro_cache[url] = (now + RIOT_SPECTATOR_MICRO_TTL_SECONDS, status, payload)
+
+
+async def _riot_request(
+    session: aiohttp.ClientSession,
+    url: str,
+    api_key: str,
+    *,
+    priority: int | None = None,
+    timeout: float = 20,
+) -> tuple[int, object]:
+    """Scheduled, coalesced Riot GET. Returns (status, payload); payload is JSON when parseable, else text.
+
+    Payloads may be shared between callers: treat them as read-only.
+    """
+    cached = _riot_micro_cache.get(url)
+    if cached and cached[0] > time.monotonic():
+        return cached[1], cached[2]
+
+    fut = _riot_inflight.get(url)
+    if fut is None:
+        fut = asyncio.ensure_future(_riot_request_uncoalesced(session, url, api_key, priority=priority, timeout=timeout))
+        _riot_inflight[url] = fut
+        fut.add_done_callback(lambda f, u=url: _riot_request_done(u, f))
+    # shield: one caller being cancelled must not cancel the request for the others.
+    _riot_inflight_waiters[fut] = _riot_inflight_waiters.get(fut, 0) + 1
+    try:
+        return await asyncio.shield(fut)
+    finally:
+        left = _riot_inflight_waiters.get(fut, 1) - 1
+        if left > 0:
+            _riot_inflight_waiters[fut] = left
+        else:
+            _riot_inflight_waiters.pop(fut, None)
+            # Nobody is interested any more (e.g. a cancelled platform probe): drop the request too.
+            if not fut.done():
+                fut.cancel()
+
+
+async def _riot_request_uncoalesced(
+    session: aiohttp.ClientSession,
+    url: str,
+    api_key: str,
+    *,
+    priority: int | None = None,
+    timeout: float = 20,
+) -> tuple[int, object]:
+    """Scheduled Riot GET (no coalescing).
+
+    429s are retried (after the scheduler's Retry-After block) up to RIOT_MAX_429_RETRIES times.
+    """
+    host, method = _riot_method_key(url)
+    prio = _riot_default_priority(method) if priority is None else int(priority)
+    headers = {"X-Riot-Token": api_key}
+
+    attempt = 0
+    while True:
+        await _riot_limiter.acquire(host, method, prio)
+        async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            _riot_limiter.observe(host, method, resp.status, resp.headers)
+            try:
+                payload = await resp.json()
+            except Exception:
+                payload = await resp.text()
+            status = int(resp.status)
+
+        if status == 429 and attempt < RIOT_MAX_429_RETRIES:
+            attempt += 1
+            continue
+        return status, payload
+
+
+# ============================================================================
+# Local match-v5 store
+#
+# Finished matches never change, so each match id is downloaded once and kept as
+# zlib-compressed JSON in SQLite, with a (puuid, game_creation) index of who played
+# in it. Prediction scoring, /match and anything else that wants a match-v5 payload
+# goes through _match_store.fetch().
+# ============================================================================
+
+MATCH_STORE_FILE = os.getenv(
+    "MATCH_STORE_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "match_store.sqlite3"),
+)
+# How long a by-puuid id list is reused before asking Riot again
+MATCH_IDS_CACHE_SECONDS = 60
+
+
+class MatchStore:
+    def __init__(self, path: str):
+        self._path = path
+        self._conn: sqlite3.Connection | None = None
+        self._ids_cache: dict[tuple, tuple[float, list[str]]] = {}
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self._path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS matches (
+                    match_id      TEXT PRIMARY KEY,
+                    game_creation INTEGER,
+                    queue_id      INTEGER,
+                    fetched_at    INTEGER,
+                    payload       BLOB
+                );
+                CREATE TABLE IF NOT EXISTS participants (
+                    puuid         TEXT,
+                    match_id      TEXT,
+                    game_creation INTEGER,
+                    PRIMARY KEY (puuid, match_id)
+                );
+                CREATE INDEX IF NOT EXISTS participants_by_time
+                    ON participants (puuid, game_creation DESC);
+                CREATE TABLE IF NOT EXISTS champion_positions (
+                    champion_id INTEGER,
+                    position    TEXT,
+                    games       INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (champion_id, position)
+                );
+                """
+            )
+            self._conn = conn
+            if not conn.execute("SELECT 1 FROM champion_positions LIMIT 1").fetchone():
+                self._backfill_champion_positions()
+        return self._conn
+
+    @staticmethod
+    def _position_rows(payload: dict) -> list[tuple[int, str]]:
+        rows = []
+        for p in ((payload.get("info") or {}).get("participants") or []):
+            role = _MATCH_POSITION_ROLES.get(str(p.get("teamPosition") or "").upper())
+            champ_id = int(p.get("championId") or 0)
+            if role and champ_id:
+                rows.append((champ_id, role))
+        return rows
+
+    def _count_positions(self, db: sqlite3.Connection, payload: dict) -> None:
+        db.executemany(
+            "INSERT INTO champion_positions (champion_id, position, games) VALUES (?, ?, 1)"
+            " ON CONFLICT(champion_id, position) DO UPDATE SET games = games + 1",
+            self._position_rows(payload),
+        )
+
+    def _backfill_champion_positions(self) -> None:
+        db = self._conn
+        try:
+            n = 0
+            with db:
+                for (blob,) in db.execute("SELECT payload FROM matches").fetchall():
+                    try:
+                        self._count_positions(db, json.loads(zlib.decompress(blob).decode("utf-8")))
+                        n += 1
+                    except Exception:
+                        continue
+            if n:
+                print(f"[MatchStore] counted champion positions from {n} stored match(es)")
+        except Exception as e:
+            print(f"[MatchStore] champion position backfill failed: {type(e).__name__}: {e}")
+
+    def champion_position_counts(self) -> dict[int, dict[str, int]]:
+        """{championId: {role: games}} over every stored match (roles as in ROLE_ORDER)."""
+        out: dict[int, dict[str, int]] = {}
+        try:
+            for champ_id, role, games in self._db().execute("SELECT champion_id, position, games FROM champion_positions"):
+                out.setdefault(int(champ_id), {})[str(role)] = int(games)
+        except Exception as e:
+            print(f"[MatchStore] position query failed: {type(e).__name__}: {e}")
+        return out
+
+    def get(self, match_id: str) -> dict | None:
+        try:
+            row = self._db().execute("SELECT payload FROM matches WHERE match_id = ?", (match_id,)).fetchone()
+            if row:
+                return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+        except Exception as e:
+            print(f"[MatchStore] read failed for {match_id}: {type(e).__name__}: {e}")
+        return None
+
+    def put(self, match_id: str, payload: dict) -> None:
+        info = payload.get("info") or {}
+        game_creation = int(info.get("gameCreation") or 0)
+        puuids = (payload.get("metadata") or {}).get("participants") or [
+            p.get("puuid") for p in (info.get("participants") or [])
+        ]
+        try:
+            blob = zlib.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+            db = self._db()
+            known = db.execute("SELECT 1 FROM matches WHERE match_id = ?", (match_id,)).fetchone()
+            with db:
+                if not known:
+                    self._count_positions(db, payload)
+                db.execute(
+                    "INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?)",
+                    (match_id, game_creation, int(info.get("queueId") or 0), int(time.time()), blob),
+                )
+                db.executemany(
+                    "INSERT OR IGNORE INTO participants VALUES (?, ?, ?)",
+                    [(p, match_id, game_creation) for p in puuids if p],
+                )
+        except Exception as e:
+            print(f"[MatchStore] write failed for {match_id}: {type(e).__name__}: {e}")
+
+    def iter_payloads(self, queue_ids: tuple[int, ...] | None = None):
+        """Yield (match_id, payload) for every stored match (optionally only these queues),
+        oldest first. Uses its own read connection, so it is safe to run in a worker thread."""
+        self._db()  # make sure the schema exists
+        sql = "SELECT match_id, payload FROM matches"
+        args: list = []
+        if queue_ids:
+            sql += f" WHERE queue_id IN ({','.join('?' * len(queue_ids))})"
+            args.extend(int(q) for q in queue_ids)
+        sql += " ORDER BY game_creation"
+        conn = sqlite3.connect(self._path)
+        try:
+            for match_id, blob in conn.execute(sql, args):
+                try:
+                    payload = json.loads(zlib.decompress(blob).decode("utf-8"))
+                except Exception as e:
+                    print(f"[MatchStore] read failed for {match_id}: {type(e).__name__}: {e}")
+                    continue
+                if isinstance(payload, dict):
+                    yield match_id, payload
+        finally:
+            conn.close()
+
+    def match_ids_for_puuid(self, puuid: str, limit: int = 20, queue_id: int | None = None) -> list[str]:
+        """Locally known matches for a player, newest first."""
+        sql = (
+            "SELECT p.match_id FROM participants p JOIN matches m ON m.match_id = p.match_id"
+            " WHERE p.puuid = ?"
+        )
+        args: list = [puuid]
+        if queue_id is not None:
+            sql += " AND m.queue_id = ?"
+            args.append(int(queue_id))
+        sql += " ORDER BY p.game_creation DESC LIMIT ?"
+        args.append(int(limit))
+        try:
+            return [r[0] for r in self._db().execute(sql, args).fetchall()]
+        except Exception as e:
+            print(f"[MatchStore] index query failed: {type(e).__name__}: {e}")
+            return []
+
+    async def fetch(
+        self, session: aiohttp.ClientSession, api_key: str, region: str, match_id: str, *, priority: int | None = None
+    ) -> tuple[int, object]:
+        """(status, payload) like _riot_request, but served locally once a match is stored."""
+        cached = self.get(match_id)
+        if cached is not None:
+            return 200, cached
+        url = f"https://{region}.api.riotgames.com/lol/match/v5/matches/{match_id}"
+        status, payload = await _riot_request(session, url, api_key, priority=priority)
+        if status == 200 and isinstance(payload, dict) and payload.get("info"):
+            self.put(match_id, payload)
+        return status, payload
+
+    async def recent_ids(
+        self,
+        session: aiohttp.ClientSession,
+        api_key: str,
+        region: str,
+        puuid: str,
+        count: int = 20,
+        *,
+        priority: int | None = None,
+        max_age: float | None = None,
+        queue: int | None = None,
+    ) -> list[str]:
+        """matches/by-puuid/ids, reused for max_age seconds (default MATCH_IDS_CACHE_SECONDS)."""
+        key = (region, puuid, int(count), queue)
+        hit = self._ids_cache.get(key)
+        if max_age is None:
+            max_age = MATCH_IDS_CACHE_SECONDS
+        if hit and time.time() - hit[0] < max_age:
+            return list(hit[1])
+        url = (
+            f"https://{region}.api.riotgames.com/lol/match/v5/"
+            f"matches/by-puuid/{quote(puuid, safe='')}/ids?start=0&count={int(count)}"
+        )
+        if queue is not None:
+            url += f"&queue={int(queue)}"
+        ids = await _riot_get_json(session, url, api_key, priority=priority)
+        if not isinstance(ids, list):
+            raise RuntimeError(f"Unexpected match id list: {str(ids)[:200]}")
+        self._ids_cache[key] = (time.time(), list(ids))
+        return list(ids)
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+_match_store = MatchStore(MATCH_STORE_FILE)
+
+
+# ============================================================================
+# Tiered TTL cache (memory LRU + SQLite) for Riot / Data Dragon reference data
+#
+# get_or_load() serves fresh entries straight from memory (or disk after a
+# restart), serves stale entries while refreshing them in the background
+# (stale-while-revalidate), and only makes callers wait on a real miss. Memory is
+# bounded by entry count and approximate JSON size; disk rows are dropped once
+# they're past their stale window. path=None gives a memory-only cache.
+# ============================================================================
+
+REFERENCE_CACHE_FILE = os.getenv(
+    "REFERENCE_CACHE_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "reference_cache.sqlite3"),
+)
+
+
+class TieredTTLCache:
+    def __init__(self, path: str | None, *, max_entries: int = 2048, max_bytes: int = 8 * 1024 * 1024):
+        self._path = path
+        self._conn: sqlite3.Connection | None = None
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        # key -> (expires_at, stale_until, value, size)
+        self._mem: OrderedDict[str, tuple[float, float, object, int]] = OrderedDict()
+        self._mem_bytes = 0
+        self._loading: dict[str, asyncio.Future] = {}
+        self._refreshing: set[str] = set()
+
+    def _db(self) -> sqlite3.Connection | None:
+        if self._path is None:
+            return None
+        if self._conn is None:
+            conn = sqlite3.connect(self._path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY, expires_at REAL, stale_until REAL, value TEXT)"
+            )
+            conn.execute("DELETE FROM cache WHERE stale_until < ?", (time.time(),))
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _remember(self, key: str, expires_at: float, stale_until: float, value, size: int) -> None:
+        old = self._mem.pop(key, None)
+        if old:
+            self._mem_bytes -= old[3]
+        self._mem[key] = (expires_at, stale_until, value, size)
+        self._mem_bytes += size
+        while self._mem and (len(self._mem) > self._max_entries or self._mem_bytes > self._max_bytes):
+            _k, evicted = self._mem.popitem(last=False)
+            self._mem_bytes -= evicted[3]
+
+    def _lookup(self, key: str):
+        """(value, expires_at, stale_until) from memory, then disk; None if missing/expired."""
+        now = time.time()
+        hit = self._mem.get(key)
+        if hit:
+            if now < hit[1]:
+                self._mem.move_to_end(key)
+                return hit[2], hit[0], hit[1]
+            self._mem_bytes -= hit[3]
+            del self._mem[key]
+
+        db = self._db()
+        if db is None:
+            return None
+        try:
+            row = db.execute(
+                "SELECT expires_at, stale_until, value FROM cache WHERE key = ? AND stale_until >= ?",
+                (key, now),
+            ).fetchone()
+        except Exception as e:
+            print(f"[Cache] disk read failed for {key}: {type(e).__name__}: {e}")
+            return None
+        if not row:
+            return None
+        value = json.loads(row[2])
+        self._remember(key, float(row[0]), float(row[1]), value, len(row[2]))
+        return value, float(row[0]), float(row[1])
+
+    def get(self, key: str, default=None, *, allow_stale: bool = True):
+        hit = self._lookup(key)
+        if not hit or (not allow_stale and time.time() >= hit[1]):
+            return default
+        return hit[0]
+
+    def __contains__(self, key: str) -> bool:
+        return self._lookup(key) is not None
+
+    def set(self, key: str, value, ttl: float, stale_ttl: float = 0.0) -> None:
+        now = time.time()
+        expires_at = now + ttl
+        stale_until = expires_at + stale_ttl
+        raw = json.dumps(value, separators=(",", ":"))
+        self._remember(key, expires_at, stale_until, value, len(raw))
+        db = self._db()
+        if db is None:
+            return
+        try:
+            with db:
+                db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)", (key, expires_at, stale_until, raw))
+        except Exception as e:
+            print(f"[Cache] disk write failed for {key}: {type(e).__name__}: {e}")
+
+    def delete(self, key: str) -> None:
+        old = self._mem.pop(key, None)
+        if old:
+            self._mem_bytes -= old[3]
+        db = self._db()
+        if db is not None:
+            try:
+                with db:
+                    db.execute("DELETE FROM cache WHERE key = ?", (key,))
+            except Exception as e:
+                print(f"[Cache] disk delete failed for {key}: {type(e).__name__}: {e}")
+
+    def prune(self) -> None:
+        """Drop expired-and-stale entries (memory-only caches never touch them otherwise)."""
+        now = time.time()
+        for key in [k for k, v in self._mem.items() if now >= v[1]]:
+            self._mem_bytes -= self._mem.pop(key)[3]
+
+    async def get_or_load(self, key: str, loader, ttl: float, stale_ttl: float = 0.0):
+        """Return the cached value, calling `await loader()` only when needed.
+
+        Loader exceptions propagate on a miss; on a stale hit they're logged and the
+        stale value keeps being served.
+        """
+        hit = self._lookup(key)
+        if hit:
+            value, expires_at, _stale_until = hit
+            if time.time() >= expires_at and key not in self._refreshing:
+                self._refreshing.add(key)
+                asyncio.create_task(self._refresh(key, loader, ttl, stale_ttl))
+            return value
+
+        fut = self._loading.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(self._load(key, loader, ttl, stale_ttl))
+            self._loading[key] = fut
+        return await asyncio.shield(fut)
+
+    async def _load(self, key: str, loader, ttl: float, stale_ttl: float):
+        try:
+            value = await loader()
+            self.set(key, value, ttl, stale_ttl)
+            return value
+        finally:
+            self._loading.pop(key, None)
+
+    async def _refresh(self, key: str, loader, ttl: float, stale_ttl: float) -> None:
+        try:
+            self.set(key, await loader(), ttl, stale_ttl)
+        except Exception as e:
+            print(f"[Cache] background refresh failed for {key}: {type(e).__name__}: {e}")
+        finally:
+            self._refreshing.discard(key)
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+_reference_cache = TieredTTLCache(REFERENCE_CACHE_FILE, max_entries=4096, max_bytes=16 * 1024 * 1024)
+
+
+# ============================================================================
+# Durable timer wheel (message expiry, voting deadlines)
+#
+# One scheduler task replaces per-message `asyncio.sleep` tasks. Timers are
+# persisted to SQLite so they survive a restart, keyed so re-scheduling the same
+# thing is idempotent, and everything due in the same tick is handed to its
+# kind's handler as one batch (e.g. message deletes are grouped per channel).
+# ============================================================================
+
+TIMER_WHEEL_FILE = os.getenv(
+    "TIMER_WHEEL_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "timers.sqlite3"),
+)
+# Discord only bulk-deletes messages younger than 14 days; keep a margin.
+_BULK_DELETE_MAX_AGE = timedelta(days=13, hours=23)
+
+
+class TimerWheel:
+    def __init__(self, path: str):
+        self._path = path
+        self._conn: sqlite3.Connection | None = None
+        self._timers: dict[str, tuple[float, str, dict]] = {}  # key -> (due, kind, payload)
+        self._heap: list[tuple[float, str]] = []
+        self._handlers: dict[str, object] = {}
+        self._wake: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self._path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS timers ("
+                " key TEXT PRIMARY KEY, due REAL NOT NULL, kind TEXT NOT NULL, payload TEXT NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+            for key, due, kind, payload in conn.execute("SELECT key, due, kind, payload FROM timers"):
+                try:
+                    self._push(key, float(due), kind, json.loads(payload))
+                except Exception:
+                    continue
+        return self._conn
+
+    def _push(self, key: str, due: float, kind: str, payload: dict) -> None:
+        self._timers[key] = (due, kind, payload)
+        heapq.heappush(self._heap, (due, key))
+
+    def register(self, kind: str, handler) -> None:
+        """handler: async (payloads: list[dict]) -> None, called with every timer of
+        this kind that came due in the same tick."""
+        self._handlers[kind] = handler
+        if self._wake is not None:
+            self._wake.set()
+
+    def schedule_at(self, kind: str, due: float, payload: dict, *, key: str | None = None) -> str:
+        key = key or f"{kind}:{json.dumps(payload, sort_keys=True)}"
+        db = self._db()
+        try:
+            with db:
+                db.execute(
+                    "INSERT OR REPLACE INTO timers (key, due, kind, payload) VALUES (?, ?, ?, ?)",
+                    (key, float(due), kind, json.dumps(payload)),
+                )
+        except Exception as e:
+            print(f"[Timers] could not persist {key}: {type(e).__name__}: {e}")
+        self._push(key, float(due), kind, payload)
+        if self._wake is not None:
+            self._wake.set()
+        return key
+
+    def schedule(self, kind: str, delay_seconds: float, payload: dict, *, key: str | None = None) -> str:
+        return self.schedule_at(kind, time.time() + max(0.0, float(delay_seconds or 0)), payload, key=key)
+
+    def cancel(self, key: str) -> None:
+        # Heap entries are dropped lazily when they surface without a matching timer.
+        if self._timers.pop(key, None) is None:
+            return
+        try:
+            db = self._db()
+            with db:
+                db.execute("DELETE FROM timers WHERE key = ?", (key,))
+        except Exception as e:
+            print(f"[Timers] could not cancel {key}: {type(e).__name__}: {e}")
+
+    def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._db()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        if self._timers:
+            print(f"[Timers] {len(self._timers)} pending timer(s) restored")
+
+    async def _run(self) -> None:
+        while True:
+            now = time.time()
+            due: dict[str, list[tuple[str, float, dict]]] = {}
+            while self._heap and self._heap[0][0] <= now:
+                when, key = heapq.heappop(self._heap)
+                timer = self._timers.get(key)
+                if timer is None or timer[0] != when:
+                    continue  # cancelled or rescheduled
+                due.setdefault(timer[1], []).append((key, when, timer[2]))
+
+            for kind, items in due.items():
+                handler = self._handlers.get(kind)
+                if handler is None:
+                    # Nobody has registered for this kind yet (startup); look again shortly.
+                    for key, _when, payload in items:
+                        self._push(key, now + 30.0, kind, payload)
+                    continue
+                asyncio.create_task(self._fire(kind, handler, items))
+
+            timeout = max(0.0, self._heap[0][0] - time.time()) if self._heap else None
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, kind: str, handler, items: list[tuple[str, float, dict]]) -> None:
+        try:
+            await handler([payload for _key, _when, payload in items])
+        except Exception as e:
+            print(f"[Timers] {kind} handler failed for {len(items)} timer(s): {type(e).__name__}: {e}")
+
+        # Done (or failed; timers are not retried). Keep any that were re-scheduled meanwhile.
+        done = [key for key, when, _p in items if (self._timers.get(key) or (None,))[0] == when]
+        for key in done:
+            self._timers.pop(key, None)
+        try:
+            db = self._db()
+            with db:
+                db.executemany("DELETE FROM timers WHERE key = ?", [(k,) for k in done])
+        except Exception as e:
+            print(f"[Timers] could not clear fired timers: {type(e).__name__}: {e}")
+
+    def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+async def _timer_delete_messages(client: discord.Client, payloads: list[dict]) -> None:
+    """Delete messages by id (no fetch first). Per channel, messages young enough for
+    bulk delete go out 100 at a time; the rest (or everything, without Manage
+    Messages) are deleted one by one. Already-deleted messages are ignored."""
+    by_channel: dict[int, set[int]] = {}
+    for p in payloads:
+        try:
+            by_channel.setdefault(int(p["channel_id"]), set()).add(int(p["message_id"]))
+        except Exception:
+            continue
+
+    cutoff = discord.utils.time_snowflake(datetime.now(timezone.utc) - _BULK_DELETE_MAX_AGE)
+    for channel_id, message_ids in by_channel.items():
+        channel = client.get_channel(channel_id) or client.get_partial_messageable(channel_id)
+        singles = sorted(message_ids)
+
+        if len(singles) >= 2 and hasattr(channel, "delete_messages"):
+            bulk = [mid for mid in singles if mid > cutoff]
+            singles = [mid for mid in singles if mid <= cutoff]
+            for i in range(0, len(bulk), 100):
+                chunk = bulk[i:i + 100]
+                try:
+                    await channel.delete_messages([discord.Object(id=mid) for mid in chunk])
+                except (discord.Forbidden, discord.HTTPException) as e:
+                    # No Manage Messages, or one of them is already gone: fall back to singles.
+                    print(f"[Timers] bulk delete in {channel_id} failed ({type(e).__name__}); deleting individually")
+                    singles.extend(chunk)
+
+        for mid in singles:
+            try:
+                await channel.get_partial_message(mid).delete()
+            except discord.NotFound:
+                pass
+            except Exception as e:
+                print(f"[Timers] could not delete message {mid} in {channel_id}: {type(e).__name__}: {e}")
+
+
+_timers = TimerWheel(TIMER_WHEEL_FILE)
+
+
+def _schedule_message_delete(channel_id: int, message_id: int, delay_seconds: float) -> None:
+    _timers.schedule("delete_message", delay_seconds, {"channel_id": int(channel_id), "message_id": int(message_id)})
+
+
+# ============================================================================
+# OP.GG headless browser pool
+#
+# One long-lived headless Chromium, owned by the bot and closed in JeffBot.close(),
+# serves every OP.GG scrape. Pages are pre-warmed and handed out with
+# `async with _opgg_browser.page() as page:`. A page goes back to the pool
+# (parked on about:blank) until it has served OPGG_BROWSER_PAGE_MAX_USES scrapes,
+# then it is replaced. If Chromium crashes or stops answering a health check, the
+# next checkout relaunches it.
+# ============================================================================
+
+OPGG_BROWSER_HEADLESS = os.getenv("OPGG_BROWSER_HEADLESS", "1").strip().lower() not in ("0", "false", "no")
+OPGG_BROWSER_MAX_PAGES = int(os.getenv("OPGG_BROWSER_MAX_PAGES", "4"))
+OPGG_BROWSER_WARM_PAGES = int(os.getenv("OPGG_BROWSER_WARM_PAGES", "2"))
+OPGG_BROWSER_PAGE_MAX_USES = int(os.getenv("OPGG_BROWSER_PAGE_MAX_USES", "25"))
+# A connected browser is re-probed at most this often (one CDP round trip)
+OPGG_BROWSER_HEALTHCHECK_SECONDS = 60
+# Scrape mode: pool pages only load OP.GG documents/scripts/XHR; everything else is aborted.
+OPGG_BROWSER_BLOCK_RESOURCES = os.getenv("OPGG_BROWSER_BLOCK_RESOURCES", "1").strip().lower() not in ("0", "false", "no")
+_OPGG_BLOCKED_RESOURCE_TYPES = {"image", "media", "font", "stylesheet", "texttrack", "eventsource", "websocket", "manifest", "other"}
+
+
+def _opgg_first_party(url: str) -> bool:
+    host = (urlparse(url).hostname or "").lower()
+    return host == "op.gg" or host.endswith(".op.gg") or "opgg" in host
+
+
+async def _opgg_scrape_route(route) -> None:
+    req = route.request
+    if req.resource_type in _OPGG_BLOCKED_RESOURCE_TYPES or not _opgg_first_party(req.url):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+class OPGGBrowserPool:
+    def __init__(self):
+        self._playwright = None
+        self._browser = None
+        self._context = None
+        self._generation = 0
+        self._idle: list[tuple[object, int]] = []  # (page, uses)
+        self._slots = asyncio.Semaphore(OPGG_BROWSER_MAX_PAGES)
+        self._lock = asyncio.Lock()
+        self._last_healthy = 0.0
+
+    async def _healthy(self) -> bool:
+        if self._browser is None or self._context is None or not self._browser.is_connected():
+            return False
+        if time.time() - self._last_healthy < OPGG_BROWSER_HEALTHCHECK_SECONDS:
+            return True
+        try:
+            await asyncio.wait_for(self._context.cookies(), timeout=5)
+        except Exception as e:
+            print(f"[OPGG][browser] health check failed: {type(e).__name__}: {e}")
+            return False
+        self._last_healthy = time.time()
+        return True
+
+    async def _ensure(self) -> None:
+        async with self._lock:
+            if await self._healthy():
+                return
+            if self._browser is not None:
+                print("[OPGG][browser] relaunching Chromium")
+            await self._shutdown()
+            t0 = time.perf_counter()
+            self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch(headless=OPGG_BROWSER_HEADLESS)
+            self._browser.on("disconnected", lambda _b: print("[OPGG][browser] Chromium disconnected"))
+            self._context = await self._browser.new_context(locale="en-US")
+            if OPGG_BROWSER_BLOCK_RESOURCES:
+                await self._context.route("**/*", _opgg_scrape_route)
+            self._generation += 1
+            self._last_healthy = time.time()
+            for _ in range(max(0, min(OPGG_BROWSER_WARM_PAGES, OPGG_BROWSER_MAX_PAGES))):
+                self._idle.append((await self._context.new_page(), 0))
+            print(f"[OPGG][browser] Chromium ready in {time.perf_counter() - t0:.1f}s ({len(self._idle)} warm page(s))")
+
+    @asynccontextmanager
+    async def page(self):
+        """Check out a page (waits while OPGG_BROWSER_MAX_PAGES are busy). Callers must
+        remove any listeners they add before the block ends."""
+        async with self._slots:
+            await self._ensure()
+            generation = self._generation
+            page, uses = self._idle.pop() if self._idle else (await self._context.new_page(), 0)
+            reusable = False
+            try:
+                yield page
+                reusable = True
+            finally:
+                uses += 1
+                if reusable and generation == self._generation and uses < OPGG_BROWSER_PAGE_MAX_USES and not page.is_closed():
+                    try:
+                        # Park it so OP.GG's scripts stop running while idle.
+                        await page.goto("about:blank", timeout=5_000)
+                        self._idle.append((page, uses))
+                        page = None
+                    except Exception:
+                        pass
+                if page is not None:
+                    try:
+                        await page.close()
+                    except Exception:
+                        pass
+
+    async def _shutdown(self) -> None:
+        idle, self._idle = self._idle, []
+        for page, _uses in idle:
+            try:
+                await page.close()
+            except Exception:
+                pass
+        for closer in (self._context, self._browser):
+            if closer is not None:
+                try:
+                    await closer.close()
+                except Exception:
+                    pass
+        if self._playwright is not None:
+            try:
+                await self._playwright.stop()
+            except Exception:
+                pass
+        self._playwright = self._browser = self._context = None
+
+    async def close(self) -> None:
+        async with self._lock:
+            await self._shutdown()
+
+
+_opgg_browser = OPGGBrowserPool()
+
+
 # ============================================================================
 # Prediction system (Riot spectator -> poll -> match-v5 result -> leaderboard)
 #
@@ -65,6 +1150,24 @@ PREDICTION_CHANNEL_ID = 768133564385460254
 # Channel for SoloQ prediction messages
 SOLOQ_PREDICTION_CHANNEL_ID = 768133564385460254
 PREDICTION_POLL_INTERVAL_SECONDS = 20
+# Per-tick fan-out: how many accounts are checked at once, and how long a tick may take
+# before slow accounts are abandoned until the next tick.
+PREDICTION_POLL_CONCURRENCY = int(os.getenv("PREDICTION_POLL_CONCURRENCY", "6"))
+PREDICTION_POLL_TICK_DEADLINE_SECONDS = 15
+
+# Adaptive per-account cadence (the loop still ticks every PREDICTION_POLL_INTERVAL_SECONDS,
+# but each account is only spectator-checked once its own interval is due).
+# - hot:  in game, or finished one within PREDICTION_POLL_HOT_WINDOW_SECONDS (likely requeueing)
+# - warm: played recently, or usually plays around this hour of day
+# - cold: everyone else. Voting closes PREDICTION_VOTING_OPEN_SECONDS after game start,
+#   so a cold player's game found late just gets a shorter (or, past 270s, no) voting
+#   window. That's the price of idle accounts costing one call per 5 minutes; people
+#   actually queueing are caught by the warm/learned-hour tiers and presence pokes.
+PREDICTION_POLL_HOT_SECONDS = PREDICTION_POLL_INTERVAL_SECONDS
+PREDICTION_POLL_WARM_SECONDS = 60
+PREDICTION_POLL_COLD_SECONDS = 300
+PREDICTION_POLL_HOT_WINDOW_SECONDS = 30 * 60
+PREDICTION_POLL_WARM_WINDOW_SECONDS = 6 * 3600
 
 # Prediction message timing (requested behavior)
 # - Prediction message is posted and voting is open for 4m30s
@@ -74,6 +1177,10 @@ PREDICTION_VOTING_OPEN_SECONDS = 270
 PREDICTION_VOTING_LOCK_SECONDS = 30
 PREDICTION_PREDICTION_MESSAGE_DELETE_AFTER_SECONDS = PREDICTION_VOTING_OPEN_SECONDS + PREDICTION_VOTING_LOCK_SECONDS
 PREDICTION_RESULT_MESSAGE_DELETE_AFTER_SECONDS = 60
+# While roster ranks are still loading, re-render the posted matchup table at most this often.
+PREDICTION_ROLE_FILL_EDIT_INTERVAL_SECONDS = 1.5
+# Vote bursts: at most one prediction message edit per this many seconds (latest state wins).
+PREDICTION_EDIT_MIN_INTERVAL_SECONDS = 1.5
 
 # SoloQ channel behavior: keep the original prediction message and do not delete/repost.
 # After the match is scored, the SAME message is updated to the result view and deleted 90s later.
@@ -107,7 +1214,20 @@ PREDICTION_QUEUE_CONFIG = {
 
 PREDICTION_REMAKE_THRESHOLD_SECONDS = 360
 PREDICTION_RESULT_TIMEOUT_SECONDS = 5400
+# Reference data TTLs (fresh, then served stale while refreshing in the background)
+PREDICTION_DDRAGON_VERSIONS_TTL_SECONDS = 6 * 3600
+PREDICTION_LEAGUE_ENTRIES_TTL_SECONDS = 15 * 60
+PREDICTION_LEAGUE_ENTRIES_STALE_SECONDS = 6 * 3600
+# After the game ends, poll for the match-v5 result at 10s, 20s, then every 30s (the old fixed
+# cadence was 10s; results usually land within a minute or two of the end).
+PREDICTION_RESULT_BACKOFF_START_SECONDS = 10
+PREDICTION_RESULT_BACKOFF_MAX_SECONDS = 30
 PREDICTION_SCORES_FILE = os.getenv("PREDICTION_SCORES_FILE", os.path.join(_PREDICTION_BASE_DIR, "prediction_scores.json"))
+# Vote-level ledger + per-user aggregates (PREDICTION_SCORES_FILE is only read once, to migrate)
+PREDICTION_LEDGER_FILE = os.getenv("PREDICTION_LEDGER_FILE", os.path.join(_PREDICTION_BASE_DIR, "prediction_ledger.sqlite3"))
+# Append-only log of session events (create/message/vote/lock/end), replayed on startup
+PREDICTION_JOURNAL_FILE = os.getenv("PREDICTION_JOURNAL_FILE", os.path.join(_PREDICTION_BASE_DIR, "prediction_sessions.jsonl"))
+PREDICTION_POLL_SCHEDULE_FILE = os.getenv("PREDICTION_POLL_SCHEDULE_FILE", os.path.join(_PREDICTION_BASE_DIR, "prediction_poll_schedule.json"))
 
 _PRED_PLATFORM_TO_REGION = {
     # Americas
@@ -144,144 +1264,1348 @@ def _prediction_trunc_name_10(name: str) -> str:
     return s if len(s) <= 10 else (s[:9] + '.')
 
 
-def _prediction_trunc_name10(name: str) -> str:
-    """Truncate to 10 chars; if over 10, cut to 9 and add '.' (single-dot truncation)."""
-    s = str(name or '')
-    return s if len(s) <= 10 else (s[:9] + '.')
+def _prediction_trunc_name10(name: str) -> str:
+    """Truncate to 10 chars; if over 10, cut to 9 and add '.' (single-dot truncation)."""
+    s = str(name or '')
+    return s if len(s) <= 10 else (s[:9] + '.')
+
+
+
+def _prediction_load_scores() -> dict:
+    base = {"version": 1, "users": {}}  # users: {str(user_id): {name, correct, wrong}}
+    try:
+        if not os.path.exists(PREDICTION_SCORES_FILE):
+            return base
+        with open(PREDICTION_SCORES_FILE, "r", encoding="utf-8") as f:
+            raw = json.load(f) or {}
+        if isinstance(raw, dict) and "users" in raw:
+            return raw
+        # Back-compat if you ever stored flat dict
+        if isinstance(raw, dict):
+            return {"version": 1, "users": raw}
+        return base
+    except Exception:
+        return base
+
+
+class PredictionJournal:
+    """Append-only JSONL journal of prediction sessions.
+
+    One line per event. Appends are handed to a writer thread, which writes whatever
+    has queued up and fsyncs once per batch, so a burst of votes never waits on the
+    disk inside an interaction. The trade-off: records still queued when the process
+    is killed or crashes (normally just the last few milliseconds' worth) are lost;
+    close() flushes the queue (bounded wait) on a clean shutdown. replay() folds the
+    log into the sessions that were still open; after every "end" (and at startup)
+    the file is rewritten with just those, so it never grows past the live sessions.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._open: dict[str, dict] = {}  # folded live sessions, as replay() would return them
+        self._queue: SimpleQueue = SimpleQueue()
+        self._writer: threading.Thread | None = None
+
+    @staticmethod
+    def _fold(open_sessions: dict[str, dict], rec: dict) -> None:
+        kind = rec.get("t")
+        mid = str(rec.get("match_id") or "")
+        if kind == "create":
+            open_sessions[mid] = dict(rec.get("session") or {})
+            return
+        sess = open_sessions.get(mid)
+        if sess is None:
+            return
+        if kind == "message":
+            sess["message_id"] = rec.get("message_id")
+        elif kind == "vote":
+            sess.setdefault("votes", {})[str(rec.get("user_id"))] = rec.get("choice")
+            if rec.get("name"):
+                sess.setdefault("voter_names", {})[str(rec.get("user_id"))] = rec.get("name")
+        elif kind == "lock":
+            sess["voting_open"] = False
+            sess["voting_closed_at_ms"] = rec.get("at_ms")
+        elif kind == "end":
+            open_sessions.pop(mid, None)
+
+    def _submit(self, item) -> None:
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._write_loop, name="prediction-journal", daemon=True)
+            self._writer.start()
+        self._queue.put(item)
+
+    def append(self, kind: str, match_id: str, **data) -> None:
+        record = {"t": kind, "match_id": match_id, "ts": int(time.time()), **data}
+        self._fold(self._open, record)
+        self._submit(("append", record))
+        if kind == "end":
+            self._submit(("compact", copy.deepcopy(self._open)))
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get())
+            lines: list[dict] = []
+            for op, arg in batch:
+                if op == "append":
+                    lines.append(arg)
+                    continue
+                self._write_lines(lines)
+                lines = []
+                if op == "compact":
+                    self._rewrite(arg)
+                elif op == "stop":
+                    return
+            self._write_lines(lines)
+
+    def _write_lines(self, records: list[dict]) -> None:
+        if not records:
+            return
+        try:
+            with open(self._path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception as e:
+            print(f"[Predict] journal write failed ({len(records)} record(s)): {type(e).__name__}: {e}")
+
+    def _rewrite(self, sessions: dict[str, dict]) -> None:
+        try:
+            tmp_path = self._path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for mid, sess in sessions.items():
+                    f.write(json.dumps({"t": "create", "match_id": mid, "ts": int(time.time()), "session": sess}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._path)
+        except Exception as e:
+            print(f"[Predict] journal compaction failed: {type(e).__name__}: {e}")
+
+    def replay(self) -> dict[str, dict]:
+        """match_id -> session record (with votes/message/lock applied) for open sessions."""
+        open_sessions: dict[str, dict] = {}
+        if not os.path.exists(self._path):
+            return open_sessions
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except Exception:
+                        continue  # torn last line after a crash
+                    self._fold(open_sessions, rec)
+        except Exception as e:
+            print(f"[Predict] journal replay failed: {type(e).__name__}: {e}")
+        return open_sessions
+
+    def compact(self, sessions: dict[str, dict]) -> None:
+        """Start over from exactly these open sessions (startup, after replay)."""
+        self._open = copy.deepcopy(sessions)
+        self._submit(("compact", copy.deepcopy(sessions)))
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Flush everything queued and stop the writer thread."""
+        if self._writer is None or not self._writer.is_alive():
+            return
+        self._queue.put(("stop", None))
+        self._writer.join(timeout)
+
+
+class PredictionLedger:
+    """SQLite prediction ledger: one row per scored vote plus per-user aggregates.
+
+    Scoring a match is one transaction touching only that match's voters, and the
+    all-time leaderboard is an indexed read of the aggregate table. Per-queue and
+    per-period boards are computed from the vote rows. The old scores JSON is
+    imported once (as all-time aggregates) the first time the ledger is opened.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._conn: sqlite3.Connection | None = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self._path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS votes (
+                    user_id  INTEGER NOT NULL,
+                    match_id TEXT    NOT NULL,
+                    queue_id INTEGER NOT NULL,
+                    choice   TEXT    NOT NULL,
+                    correct  INTEGER NOT NULL,
+                    ts       INTEGER NOT NULL,
+                    PRIMARY KEY (user_id, match_id)
+                );
+                CREATE INDEX IF NOT EXISTS votes_by_queue_ts ON votes (queue_id, ts);
+                CREATE INDEX IF NOT EXISTS votes_by_ts ON votes (ts);
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id INTEGER PRIMARY KEY,
+                    name    TEXT,
+                    correct INTEGER NOT NULL DEFAULT 0,
+                    wrong   INTEGER NOT NULL DEFAULT 0,
+                    score   INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS users_by_score ON users (score DESC, correct DESC);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+                """
+            )
+            self._conn = conn
+            self._migrate_json()
+        return self._conn
+
+    def _migrate_json(self) -> None:
+        db = self._conn
+        if db.execute("SELECT 1 FROM meta WHERE key = 'migrated_scores_json'").fetchone():
+            return
+        users = (_prediction_load_scores().get("users") or {})
+        with db:
+            for uid, entry in users.items():
+                try:
+                    correct = int(entry.get("correct", 0))
+                    wrong = int(entry.get("wrong", 0))
+                    db.execute(
+                        "INSERT OR IGNORE INTO users (user_id, name, correct, wrong, score) VALUES (?, ?, ?, ?, ?)",
+                        (int(uid), str(entry.get("name") or f"User-{uid}"), correct, wrong, correct - wrong),
+                    )
+                except Exception:
+                    continue
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('migrated_scores_json', ?)", (str(int(time.time())),))
+        if users:
+            print(f"[Predict] imported {len(users)} user(s) from {PREDICTION_SCORES_FILE} into the ledger")
+
+    def record_match(
+        self, match_id: str, queue_id: int, votes: dict[int, str], win: bool, names: dict[int, str] | None = None
+    ) -> tuple[list[int], list[int]]:
+        """Score every vote on a match in one transaction. Re-recording a match is a no-op
+        for votes already stored. `names` (display names captured at vote time; no
+        fetch_user later) are upserted in the same transaction. Returns (correct_ids, wrong_ids)."""
+        correct_ids: list[int] = []
+        wrong_ids: list[int] = []
+        now = int(time.time())
+        db = self._db()
+        with db:
+            db.executemany(
+                "INSERT INTO users (user_id, name) VALUES (?, ?)"
+                " ON CONFLICT(user_id) DO UPDATE SET name = excluded.name",
+                [(int(uid), str(name)) for uid, name in (names or {}).items() if name],
+            )
+            for uid, choice in votes.items():
+                is_correct = (choice == "WIN" and win) or (choice == "LOSE" and not win)
+                (correct_ids if is_correct else wrong_ids).append(uid)
+                cur = db.execute(
+                    "INSERT OR IGNORE INTO votes VALUES (?, ?, ?, ?, ?, ?)",
+                    (int(uid), match_id, int(queue_id or 0), choice, int(is_correct), now),
+                )
+                if cur.rowcount != 1:
+                    continue
+                db.execute(
+                    "INSERT INTO users (user_id, name) VALUES (?, ?) ON CONFLICT(user_id) DO NOTHING",
+                    (int(uid), f"User-{uid}"),
+                )
+                db.execute(
+                    "UPDATE users SET correct = correct + ?, wrong = wrong + ?, score = score + ? WHERE user_id = ?",
+                    (int(is_correct), int(not is_correct), 1 if is_correct else -1, int(uid)),
+                )
+        return correct_ids, wrong_ids
+
+    def names(self, user_ids) -> dict[int, str]:
+        ids = [int(u) for u in user_ids]
+        if not ids:
+            return {}
+        rows = self._db().execute(
+            f"SELECT user_id, name FROM users WHERE user_id IN ({','.join('?' * len(ids))})", ids
+        ).fetchall()
+        return {int(uid): str(name or f"User-{uid}") for uid, name in rows}
+
+    def leaderboard(self, limit: int, queue_id: int | None = None, since_ts: int | None = None) -> list[dict]:
+        """rows: [{user_id, name, score, correct, wrong, acc}] best first."""
+        db = self._db()
+        if queue_id is None and since_ts is None:
+            rows = db.execute(
+                "SELECT user_id, name, correct, wrong FROM users WHERE correct + wrong > 0"
+                " ORDER BY score DESC, CAST(correct AS REAL) / (correct + wrong) DESC, correct DESC LIMIT ?",
+                (int(limit),),
+            ).fetchall()
+        else:
+            where, args = [], []
+            if queue_id is not None:
+                where.append("v.queue_id = ?")
+                args.append(int(queue_id))
+            if since_ts is not None:
+                where.append("v.ts >= ?")
+                args.append(int(since_ts))
+            rows = db.execute(
+                "SELECT v.user_id, u.name, SUM(v.correct) AS c, SUM(1 - v.correct) AS w"
+                " FROM votes v LEFT JOIN users u ON u.user_id = v.user_id"
+                f" WHERE {' AND '.join(where)} GROUP BY v.user_id"
+                " ORDER BY c - w DESC, CAST(c AS REAL) / (c + w) DESC, c DESC LIMIT ?",
+                (*args, int(limit)),
+            ).fetchall()
+
+        out = []
+        for uid, name, correct, wrong in rows:
+            correct, wrong = int(correct or 0), int(wrong or 0)
+            total = correct + wrong
+            out.append({
+                "user_id": int(uid),
+                "name": str(name or f"User-{uid}"),
+                "score": correct - wrong,
+                "correct": correct,
+                "wrong": wrong,
+                "acc": (correct / total) * 100.0 if total else 0.0,
+            })
+        return out
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+_prediction_ledger = PredictionLedger(PREDICTION_LEDGER_FILE)
+
+
+def _prediction_truncate_name_10(name: str) -> str:
+    """Truncate names to max 10 chars; if longer, cut to 9 and add a single '.'"""
+    s = str(name or '')
+    return s if len(s) <= 10 else (s[:9] + '.')
+
+
+
+def _prediction_embed_for_match(
+    title_line: str,
+    team_id: int,
+    game_start_ms: int,
+    voting_open: bool,
+    voting_closed_at_ms: int | None,
+    win_votes: int,
+    lose_votes: int,
+    tracked_names: list[str],
+    role_lines: list[str] | None = None,
+    model_win_pct: float | None = None,
+) -> discord.Embed:
+    start_unix = int(game_start_ms // 1000)
+    now_ms = int(time.time() * 1000)
+
+    if voting_open:
+        close_at_ms = game_start_ms + (PREDICTION_VOTING_OPEN_SECONDS * 1000)
+        remaining_ms = max(0, close_at_ms - now_ms)
+        remaining_s = remaining_ms // 1000
+
+        close_unix = int(close_at_ms // 1000)
+
+        if remaining_s >= 60:
+            m = remaining_s // 60
+            s = remaining_s % 60
+            vote_line = f'Voting closes {_prediction_fmt_ts_discord(close_unix)}.'
+        else:
+            vote_line = f'Voting closes {_prediction_fmt_ts_discord(close_unix)}.'
+    else:
+        closed_unix = int((voting_closed_at_ms // 1000) if voting_closed_at_ms else start_unix)
+        vote_line = f'Voting closed {_prediction_fmt_ts_discord(closed_unix)}.'
+
+
+    roster = ', '.join(tracked_names) if tracked_names else '(none)'
+    desc = (
+        f'**Prediction time!** {title_line}\n'
+        f'Tracked in match: **{roster}**\n'
+        f'Team: **{_prediction_fmt_team(team_id)}**\n'
+    )
+    if model_win_pct is not None:
+        desc += f'Model says **{model_win_pct:.0f}%** to win\n'
+    desc += (
+        f'\nMatch started {_prediction_fmt_ts_discord(start_unix)}\n'
+        f'{vote_line}\n\n'
+        f'Current votes: ✅ WIN **{win_votes}** | ❌ LOSE **{lose_votes}**'
+    )
+
+    # Champs-only matchup table (5 lines: TOP/JG/MID/ADC/SPP).
+    if role_lines:
+        table = '```text\n' + '\n'.join(role_lines) + '\n```'
+        desc += '\n\n' + table
+
+    return discord.Embed(description=desc)
+
+
+
+def _prediction_result_embed(
+    title_line: str,
+    team_id: int,
+    win: bool,
+    correct_lines: list[str],
+    incorrect_lines: list[str],
+    tracked_names: list[str],
+    leaderboard_text: str | None = None,
+) -> discord.Embed:
+    roster = ", ".join(tracked_names) if tracked_names else "(none)"
+    result_line = f"**{title_line}** on **{_prediction_fmt_team(team_id)}** **{'WON ✅' if win else 'LOST ❌'}**"
+
+    desc = f"{result_line}\n\nTracked in match: **{roster}**"
+    if leaderboard_text:
+        # Put leaderboard table where the matchup table used to be.
+        desc += "\n\n" + leaderboard_text
+
+    e = discord.Embed(description=desc)
+    e.add_field(
+        name="Who was right (+1)",
+        value="\n".join(correct_lines) if correct_lines else "Nobody 😅",
+        inline=True,
+    )
+    e.add_field(
+        name="Who was wrong (-1)",
+        value="\n".join(incorrect_lines) if incorrect_lines else "Nobody 🎉",
+        inline=True,
+    )
+    return e
+
+
+class AdaptivePollScheduler:
+    """Decides how often each tracked account is spectator-checked.
+
+    Keeps per-account activity (last time seen in game, last poll) in memory and a
+    learned hour-of-day histogram of game starts on disk, so a player who always queues
+    around 9pm is polled faster around 9pm even right after a restart.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._last_in_game: dict[str, float] = {}
+        self._in_game: dict[str, bool] = {}
+        self._last_polled: dict[str, float] = {}
+        self._hours: dict[str, list[int]] = {}
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            if not os.path.exists(self._path):
+                return
+            with open(self._path, "r", encoding="utf-8") as f:
+                raw = json.load(f) or {}
+            for key, entry in (raw.get("accounts") or {}).items():
+                hours = entry.get("hours") or []
+                if isinstance(hours, list) and len(hours) == 24:
+                    self._hours[key] = [int(h or 0) for h in hours]
+                if entry.get("last_in_game"):
+                    self._last_in_game[key] = float(entry["last_in_game"])
+        except Exception as e:
+            print(f"[Predict] failed to load poll schedule: {type(e).__name__}: {e}")
+
+    def _save(self) -> None:
+        try:
+            accounts = {
+                key: {"hours": hours, "last_in_game": int(self._last_in_game.get(key) or 0)}
+                for key, hours in self._hours.items()
+            }
+            tmp_path = self._path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "accounts": accounts}, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self._path)
+        except Exception as e:
+            print(f"[Predict] failed to save poll schedule: {type(e).__name__}: {e}")
+
+    def _usually_plays_now(self, key: str, now: float) -> bool:
+        hours = self._hours.get(key)
+        if not hours:
+            return False
+        total = sum(hours)
+        h = time.localtime(now).tm_hour
+        near = hours[(h - 1) % 24] + hours[h] + hours[(h + 1) % 24]
+        # Needs a few observations before we trust it, and a fair share of all game starts.
+        return near >= 2 and near * 8 >= total
+
+    def state(self, key: str, now: float) -> str:
+        if self._in_game.get(key):
+            return "hot"
+        last = self._last_in_game.get(key) or 0.0
+        if now - last < PREDICTION_POLL_HOT_WINDOW_SECONDS:
+            return "hot"
+        if now - last < PREDICTION_POLL_WARM_WINDOW_SECONDS or self._usually_plays_now(key, now):
+            return "warm"
+        return "cold"
+
+    def interval(self, key: str, now: float) -> float:
+        return {
+            "hot": PREDICTION_POLL_HOT_SECONDS,
+            "warm": PREDICTION_POLL_WARM_SECONDS,
+        }.get(self.state(key, now), PREDICTION_POLL_COLD_SECONDS)
+
+    def due(self, key: str, now: float) -> bool:
+        # Small slack so a 20s loop doesn't drift a whole tick past a 20s interval.
+        last = self._last_polled.get(key) or 0.0
+        return now - last >= self.interval(key, now) - 2
+
+    def mark_polled(self, key: str, now: float) -> None:
+        self._last_polled[key] = now
+
+    def poke(self, key: str) -> None:
+        """Make an account due on the next tick (e.g. they just opened League)."""
+        self._last_polled.pop(key, None)
+
+    def in_game(self, key: str) -> bool:
+        return bool(self._in_game.get(key))
+
+    def observe(self, key: str, in_game: bool, now: float) -> None:
+        was_in_game = self._in_game.get(key, False)
+        self._in_game[key] = in_game
+        if not in_game:
+            return
+        self._last_in_game[key] = now
+        if was_in_game:
+            return
+        # New game start: learn the hour. Halve old counts occasionally so habits can change.
+        hours = self._hours.setdefault(key, [0] * 24)
+        hours[time.localtime(now).tm_hour] += 1
+        if sum(hours) > 200:
+            self._hours[key] = [h // 2 for h in hours]
+        self._save()
+
+    def summary(self, keys, now: float) -> dict[str, int]:
+        counts = {"hot": 0, "warm": 0, "cold": 0}
+        for key in keys:
+            counts[self.state(key, now)] += 1
+        return counts
+
+
+# ----------------------------------------------------------------------------
+# Live game tracker
+#
+# One service owns spectator/league polling for every tracked Riot account and
+# emits typed events. PredictionCog, auto-spectate and the Josh LP nickname all
+# subscribe instead of running their own loops, so an account costs at most one
+# spectator call per tick no matter how many features care about it (and only one
+# account per ongoing game is polled to see that game end).
+# ----------------------------------------------------------------------------
+
+TRACKER_RANK_SWEEP_SECONDS = 10 * 60
+TRACKER_RANK_AFTER_GAME_SECONDS = 90  # league-v4 LP lags the end of a game a little
+
+
+@dataclass
+class GameStarted:
+    match_id: str
+    platform: str
+    platform_id: str
+    region: str
+    game_id: int
+    queue_id: int
+    game_start_time_ms: int
+    participants: list[dict]
+    info: dict  # raw spectator-v5 payload
+    accounts: list[dict]  # tracked accounts in the game: [{key, puuid, teamId}]
+
+
+@dataclass
+class GameEnded:
+    match_id: str
+    platform: str
+    region: str
+    game_id: int
+    queue_id: int
+    accounts: list[dict]
+
+
+@dataclass
+class RankChanged:
+    key: str
+    puuid: str
+    platform: str
+    queue_type: str
+    entry: dict | None  # league-v4 entry; None if no longer ranked in this queue
+    previous: dict | None  # None on the first observation after a restart
+
+
+class LiveGameTracker:
+    def __init__(self):
+        # riot key ("name#tag" lower) -> {game_name, tag_line}
+        self._accounts: dict[str, dict] = {}
+        self._rank_keys: set[str] = set()
+        self._subscribers: dict[type, list] = {}
+
+        self._schedule = AdaptivePollScheduler(PREDICTION_POLL_SCHEDULE_FILE)
+        self._games: dict[str, GameStarted] = {}
+        self._account_game: dict[str, str] = {}
+        self._ended_events: dict[str, asyncio.Event] = {}
+
+        self._ranks: dict[str, dict[str, dict]] = {}
+        self._rank_due: dict[str, float] = {}
+
+        self._tick_durations: deque[float] = deque(maxlen=180)
+        self._tick_count = 0
+
+        self._loop = tasks.loop(seconds=PREDICTION_POLL_INTERVAL_SECONDS)(self._tick)
+        self._loop.before_loop(self._before_tick)
+
+    def watch(self, game_name: str, tag_line: str, *, ranks: bool = False) -> str:
+        key = _spectate_cache_key(game_name, tag_line)
+        self._accounts.setdefault(key, {"game_name": game_name, "tag_line": tag_line})
+        if ranks:
+            self._rank_keys.add(key)
+        return key
+
+    def subscribe(self, event_type: type, callback) -> None:
+        self._subscribers.setdefault(event_type, []).append(callback)
+
+    def start(self) -> None:
+        if self._accounts and not self._loop.is_running():
+            self._loop.start()
+
+    def poke(self, key: str) -> None:
+        """Check an account on the next tick (e.g. they just opened League)."""
+        self._schedule.poke(key)
+
+    async def wait_game_ended(self, match_id: str, timeout: float) -> bool:
+        """Wait until the tracker sees a game end. Returns immediately for games it isn't
+        tracking (already over, or started before a restart)."""
+        if match_id not in self._games:
+            return True
+        event = self._ended_events.setdefault(match_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout=max(0.0, timeout))
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def current_game(self, key: str) -> GameStarted | None:
+        match_id = self._account_game.get(key)
+        return self._games.get(match_id) if match_id else None
+
+    async def _before_tick(self):
+        await bot.wait_until_ready()
+
+    def _emit(self, event) -> None:
+        for callback in self._subscribers.get(type(event), []):
+            asyncio.create_task(self._deliver(callback, event))
+
+    async def _deliver(self, callback, event) -> None:
+        try:
+            await callback(event)
+        except Exception as e:
+            name = getattr(callback, "__qualname__", repr(callback))
+            print(f"[Tracker] {type(event).__name__} subscriber {name} failed: {type(e).__name__}: {e}")
+
+    async def _tick(self):
+        api_key = os.getenv("RIOT_API_KEY")
+        if not api_key:
+            return
+
+        now = time.time()
+        http = _riot_http.session
+
+        try:
+            # Everyone else in an ongoing game rides on its first account's check.
+            covered: set[str] = set()
+            for game in self._games.values():
+                covered.update(a["key"] for a in game.accounts[1:])
+
+            # Presence gating never blocks an account we believe is still in game,
+            # otherwise we'd never see that game end.
+            due_keys = [
+                key for key in self._accounts
+                if key not in covered
+                and self._schedule.due(key, now)
+                and (self._schedule.in_game(key) or _presence_gate.allows("tracker", key, now))
+            ]
+            for key in due_keys:
+                self._schedule.mark_polled(key, now)
+
+            if due_keys:
+                results, deferred = await self._check_accounts(http, api_key, due_keys)
+                # Apply in roster order so events don't depend on which request finished first.
+                for key in due_keys:
+                    if key in results:
+                        ident, info = results[key]
+                        self._apply(key, ident, info, now)
+                self._record_tick(now, len(due_keys), deferred)
+
+            await self._check_ranks(http, api_key, now)
+        except Exception as e:
+            print(f"[Tracker] tick error: {type(e).__name__}: {e}")
+
+    async def _check_accounts(self, http: aiohttp.ClientSession, api_key: str, keys: list[str]):
+        sem = asyncio.Semaphore(max(1, PREDICTION_POLL_CONCURRENCY))
+
+        async def check(key: str):
+            acct = self._accounts[key]
+            # Errors stay local to one account so a bad Riot ID never stalls the tick.
+            try:
+                async with sem:
+                    ident = await _riot_identities.resolve(http, api_key, acct["game_name"], acct["tag_line"])
+                    in_game, info = await _spectate_check_active_game(http, api_key, ident["platform"], ident["puuid"])
+                return ident, (info if in_game else None)
+            except SpectateAPIError as e:
+                print(f"[Tracker] Riot error for {key}: {e}")
+            except Exception as e:
+                print(f"[Tracker] Error checking {key}: {type(e).__name__}: {e}")
+            return None
+
+        tasks_by_key = {key: asyncio.create_task(check(key)) for key in keys}
+        _done, pending = await asyncio.wait(
+            tasks_by_key.values(), timeout=PREDICTION_POLL_TICK_DEADLINE_SECONDS
+        )
+        for t in pending:
+            t.cancel()
+        if pending:
+            late = [k for k, t in tasks_by_key.items() if t in pending]
+            for k in late:
+                self._schedule.poke(k)
+            print(f"[Tracker] tick deadline hit; deferred {len(late)} account(s): {', '.join(late)}")
+
+        results: dict[str, tuple[dict, dict | None]] = {}
+        for key, task in tasks_by_key.items():
+            if task in pending or task.cancelled():
+                continue
+            result = task.result()
+            if result:
+                results[key] = result
+        return results, len(pending)
+
+    def _apply(self, key: str, ident: dict, info: dict | None, now: float) -> None:
+        previous = self._account_game.get(key)
+        if not info:
+            self._schedule.observe(key, False, now)
+            if previous:
+                self._end_game(previous, now)
+            return
+
+        platform = ident["platform"]
+        try:
+            platform_id = str(info.get("platformId") or platform).upper()
+            game_id = int(info.get("gameId"))
+        except Exception as e:
+            print(f"[Tracker] bad spectator payload for {key}: {type(e).__name__}: {e}")
+            return
+
+        match_id = _prediction_make_match_id(platform_id, game_id)
+        if previous and previous != match_id:
+            self._end_game(previous, now)
+        self._schedule.observe(key, True, now)
+        if match_id in self._games:
+            return
+
+        # Mark every tracked account in the lobby from this one payload.
+        participants = info.get("participants") or []
+        by_puuid = {p.get("puuid"): p for p in participants if p.get("puuid")}
+        accounts: list[dict] = []
+        for k, acct in self._accounts.items():
+            known = ident if k == key else _riot_identities.get(acct["game_name"], acct["tag_line"])
+            p = by_puuid.get((known or {}).get("puuid"))
+            if p:
+                accounts.append({"key": k, "puuid": known["puuid"], "teamId": int(p.get("teamId") or 0)})
+
+        game = GameStarted(
+            match_id=match_id,
+            platform=platform,
+            platform_id=platform_id,
+            region=_prediction_match_region_for_platform(platform),
+            game_id=game_id,
+            queue_id=int(info.get("gameQueueConfigId") or 0),
+            game_start_time_ms=int(info.get("gameStartTime") or int(now * 1000)),
+            participants=participants,
+            info=info,
+            accounts=accounts,
+        )
+        self._games[match_id] = game
+        for a in accounts:
+            self._account_game[a["key"]] = match_id
+            self._schedule.observe(a["key"], True, now)
+        print(f"[Tracker] game started {match_id} (queue {game.queue_id}): {', '.join(a['key'] for a in accounts)}")
+        self._emit(game)
+
+    def _end_game(self, match_id: str, now: float) -> None:
+        game = self._games.pop(match_id, None)
+        if game is None:
+            return
+        for a in game.accounts:
+            if self._account_game.get(a["key"]) == match_id:
+                self._account_game.pop(a["key"], None)
+                self._schedule.observe(a["key"], False, now)
+            if a["key"] in self._rank_keys:
+                self._rank_due[a["key"]] = now + TRACKER_RANK_AFTER_GAME_SECONDS
+        print(f"[Tracker] game ended {match_id}")
+        ended = self._ended_events.pop(match_id, None)
+        if ended is not None:
+            ended.set()
+        self._emit(GameEnded(
+            match_id=match_id,
+            platform=game.platform,
+            region=game.region,
+            game_id=game.game_id,
+            queue_id=game.queue_id,
+            accounts=game.accounts,
+        ))
+
+    @staticmethod
+    def _rank_fingerprint(entry: dict | None):
+        if not entry:
+            return None
+        return entry.get("tier"), entry.get("rank"), entry.get("leaguePoints")
+
+    async def _check_ranks(self, http: aiohttp.ClientSession, api_key: str, now: float) -> None:
+        for key in sorted(self._rank_keys):
+            if now < (self._rank_due.get(key) or 0.0):
+                continue
+            self._rank_due[key] = now + TRACKER_RANK_SWEEP_SECONDS
+            acct = self._accounts[key]
+            try:
+                ident = await _riot_identities.resolve(http, api_key, acct["game_name"], acct["tag_line"])
+                url = (
+                    f"https://{ident['platform']}.api.riotgames.com"
+                    f"/lol/league/v4/entries/by-puuid/{quote(ident['puuid'], safe='')}"
+                )
+                entries = await _riot_get_json(http, url, api_key, priority=RIOT_PRIORITY_RANK)
+            except Exception as e:
+                print(f"[Tracker] rank check failed for {key}: {type(e).__name__}: {e}")
+                continue
+            if not isinstance(entries, list):
+                print(f"[Tracker] unexpected league response for {key}: {str(entries)[:200]}")
+                continue
+
+            current = {str(e["queueType"]): e for e in entries if isinstance(e, dict) and e.get("queueType")}
+            previous = self._ranks.get(key)
+            self._ranks[key] = current
+            for queue_type in sorted(set(current) | set(previous or {})):
+                old = (previous or {}).get(queue_type)
+                new = current.get(queue_type)
+                if previous is not None and self._rank_fingerprint(old) == self._rank_fingerprint(new):
+                    continue
+                self._emit(RankChanged(
+                    key=key,
+                    puuid=ident["puuid"],
+                    platform=ident["platform"],
+                    queue_type=queue_type,
+                    entry=new,
+                    previous=old,
+                ))
+
+    def _record_tick(self, started: float, accounts: int, deferred: int) -> None:
+        elapsed = time.time() - started
+        self._tick_durations.append(elapsed)
+        self._tick_count += 1
+        # Summarize every 90 ticks, and immediately when a tick runs long.
+        if elapsed > PREDICTION_POLL_INTERVAL_SECONDS / 2 or self._tick_count % 90 == 0:
+            recent = sorted(self._tick_durations)
+            p50 = recent[len(recent) // 2]
+            states = self._schedule.summary(self._accounts.keys(), started)
+            print(
+                f"[Tracker] tick {elapsed:.2f}s for {accounts} account(s)"
+                f" (deferred={deferred}, p50={p50:.2f}s, max={recent[-1]:.2f}s over {len(recent)} ticks;"
+                f" hot={states['hot']} warm={states['warm']} cold={states['cold']}, live games={len(self._games)})"
+            )
+
+
+live_game_tracker = LiveGameTracker()
+
+
+class MatchResultWaiter:
+    """Waits for finished matches to show up in match-v5, for every open session at once.
+
+    Each round makes one matches/by-puuid/ids call per player (any pending match that
+    player was in is covered by it), then fetches only the matches that appeared.
+    Per-match polling backs off while the result isn't out yet (capped near the old
+    fixed cadence: the game has already ended, so the result is usually close). A 403
+    (key invalid/expired) fails every waiter at once instead of polling to the timeout.
+    """
+
+    def __init__(self):
+        # match_id -> {region, puuids, future, next_at, delay}
+        self._pending: dict[str, dict] = {}
+        self._task: asyncio.Task | None = None
+
+    async def wait(self, region: str, match_id: str, puuids: list[str], timeout: float) -> dict | None:
+        entry = self._pending.get(match_id)
+        if entry is None:
+            entry = {
+                "region": region,
+                "puuids": [p for p in puuids if p],
+                "future": asyncio.get_running_loop().create_future(),
+                "next_at": time.time(),
+                "delay": PREDICTION_RESULT_BACKOFF_START_SECONDS,
+            }
+            self._pending[match_id] = entry
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        try:
+            return await asyncio.wait_for(asyncio.shield(entry["future"]), timeout=max(0.0, timeout))
+        except asyncio.TimeoutError:
+            if self._pending.get(match_id) is entry:
+                self._pending.pop(match_id, None)
+            return None
+
+    async def _run(self) -> None:
+        http = _riot_http.session
+        while self._pending:
+            api_key = os.getenv("RIOT_API_KEY")
+            now = time.time()
+            due = [
+                (mid, e) for mid, e in self._pending.items()
+                if not e["future"].done() and e["next_at"] <= now and e["puuids"]
+            ]
+            if due and api_key:
+                try:
+                    await self._poll_round(http, api_key, due)
+                except Exception as e:
+                    print(f"[Predict] result poll error: {type(e).__name__}: {e}")
+
+            for mid in [m for m, e in self._pending.items() if e["future"].done()]:
+                self._pending.pop(mid, None)
+            if not self._pending:
+                break
+            wake = min(e["next_at"] for e in self._pending.values())
+            await asyncio.sleep(min(30.0, max(1.0, wake - time.time())))
+
+    async def _poll_round(self, http: aiohttp.ClientSession, api_key: str, due: list[tuple[str, dict]]) -> None:
+        players: dict[tuple[str, str], None] = {}
+        for _mid, e in due:
+            players.setdefault((e["region"], e["puuids"][0]), None)
+
+        finished: set[str] = set()
+        for region, puuid in players:
+            try:
+                ids = await _match_store.recent_ids(http, api_key, region, puuid, 5, max_age=0)
+                finished.update(ids)
+            except RiotAPIError as e:
+                if e.status == 403:
+                    self._fail_all(due)
+                    return
+                print(f"[Predict] match id poll failed: {type(e).__name__}: {e}")
+            except Exception as e:
+                print(f"[Predict] match id poll failed: {type(e).__name__}: {e}")
+
+        now = time.time()
+        for mid, e in due:
+            if mid in finished:
+                code, payload = await _match_store.fetch(http, api_key, e["region"], mid)
+                if code == 200 and isinstance(payload, dict):
+                    if not e["future"].done():
+                        e["future"].set_result(payload)
+                    continue
+                if code == 403:
+                    self._fail_all(due)
+                    return
+            e["next_at"] = now + e["delay"]
+            e["delay"] = min(e["delay"] * 2, PREDICTION_RESULT_BACKOFF_MAX_SECONDS)
+
+    @staticmethod
+    def _fail_all(due: list[tuple[str, dict]]) -> None:
+        print("[Predict] 403 Forbidden polling match results (Riot key invalid/expired).")
+        for _mid, e in due:
+            if not e["future"].done():
+                e["future"].set_exception(RiotAPIError(403, "Riot API key rejected (403)"))
+
 
+_match_results = MatchResultWaiter()
 
 
-def _prediction_load_scores() -> dict:
-    base = {"version": 1, "users": {}}  # users: {str(user_id): {name, correct, wrong}}
-    try:
-        if not os.path.exists(PREDICTION_SCORES_FILE):
-            return base
-        with open(PREDICTION_SCORES_FILE, "r", encoding="utf-8") as f:
-            raw = json.load(f) or {}
-        if isinstance(raw, dict) and "users" in raw:
-            return raw
-        # Back-compat if you ever stored flat dict
-        if isinstance(raw, dict):
-            return {"version": 1, "users": raw}
-        return base
-    except Exception:
-        return base
+# ============================================================================
+# Role assignment for the prediction matchup table
+#
+# Each team's players are scored against every role (summoner spells plus a
+# champion -> role prior) and placed by the best of the 5! = 120 permutations, so
+# two players can never land in the same row. Priors blend Data Dragon tags with
+# the positions champions actually played in our stored matches. Assignments are
+# cached per (match, team), so refreshing a session's table costs nothing.
+# ============================================================================
 
+ROLE_ORDER = ("TOP", "JG", "MID", "ADC", "SPP")
+# match-v5 teamPosition -> our row labels
+_MATCH_POSITION_ROLES = {"TOP": "TOP", "JUNGLE": "JG", "MIDDLE": "MID", "BOTTOM": "ADC", "UTILITY": "SPP"}
+# Data Dragon class tag -> role distribution (averaged over a champion's tags)
+_ROLE_TAG_PRIORS = {
+    "Marksman": {"TOP": 0.08, "JG": 0.02, "MID": 0.10, "ADC": 0.78, "SPP": 0.02},
+    "Support":  {"TOP": 0.05, "JG": 0.02, "MID": 0.08, "ADC": 0.05, "SPP": 0.80},
+    "Mage":     {"TOP": 0.08, "JG": 0.04, "MID": 0.58, "ADC": 0.08, "SPP": 0.22},
+    "Assassin": {"TOP": 0.18, "JG": 0.27, "MID": 0.50, "ADC": 0.02, "SPP": 0.03},
+    "Fighter":  {"TOP": 0.55, "JG": 0.33, "MID": 0.08, "ADC": 0.01, "SPP": 0.03},
+    "Tank":     {"TOP": 0.42, "JG": 0.25, "MID": 0.03, "ADC": 0.00, "SPP": 0.30},
+}
+# Stored games needed before a champion's observed positions outweigh its tags
+ROLE_PRIOR_TAG_PSEUDO_GAMES = 20
+# Spell-score points a certain (probability 1.0) prior is worth
+ROLE_PRIOR_WEIGHT = 1500
+ROLE_PRIORS_REFRESH_SECONDS = 6 * 3600
+
+SPELL_SMITE = 11
+SPELL_TELEPORT = 12
+SPELL_HEAL = 7
+SPELL_EXHAUST = 3
+SPELL_IGNITE = 14
+SPELL_BARRIER = 21
+SPELL_GHOST = 6
+
+
+def _role_spell_score(spells: set[int], role: str) -> int:
+    score = 0
+
+    # Hard identifiers
+    if role == "JG":
+        return 10_000 if SPELL_SMITE in spells else -10_000
+
+    if role == "ADC":
+        # ADC will have Barrier
+        if SPELL_BARRIER in spells:
+            score += 5000
+        # common-but-not-required signals (helps if Barrier isn't present)
+        if SPELL_HEAL in spells:
+            score += 200
+        if SPELL_EXHAUST in spells:
+            score -= 100
+        if SPELL_TELEPORT in spells:
+            score -= 200
 
-def _prediction_save_scores(data: dict) -> None:
-    try:
-        with open(PREDICTION_SCORES_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, sort_keys=True)
-    except Exception as e:
-        print(f"[Predict] Error saving scores: {e}")
+    if role == "SPP":
+        # support heal (maybe ignite or exh)
+        if SPELL_EXHAUST in spells:
+            score += 1200
+        if SPELL_IGNITE in spells:
+            score += 900
+        if SPELL_HEAL in spells:
+            score += 700
+        if SPELL_BARRIER in spells:
+            score -= 400
+        if SPELL_TELEPORT in spells:
+            score -= 200
 
+    if role == "MID":
+        # likely ignite then TP
+        if SPELL_IGNITE in spells:
+            score += 1200
+        if SPELL_TELEPORT in spells:
+            score += 500
+        if SPELL_EXHAUST in spells:
+            score += 100
+        if SPELL_BARRIER in spells:
+            score -= 300
+        if SPELL_SMITE in spells:
+            score -= 5000
 
-def _prediction_upsert_user(scores_data: dict, user: discord.abc.User) -> dict:
-    users = scores_data.setdefault("users", {})
-    uid = str(user.id)
-    entry = users.get(uid) or {"name": user.display_name, "correct": 0, "wrong": 0}
-    entry["name"] = user.display_name
-    entry["correct"] = int(entry.get("correct", 0))
-    entry["wrong"] = int(entry.get("wrong", 0))
-    users[uid] = entry
-    return entry
+    if role == "TOP":
+        # TP ignite ghost
+        if SPELL_TELEPORT in spells:
+            score += 1200
+        if SPELL_GHOST in spells:
+            score += 700
+        if SPELL_IGNITE in spells:
+            score += 500
+        if SPELL_EXHAUST in spells:
+            score -= 200
+        if SPELL_BARRIER in spells:
+            score -= 300
+        if SPELL_SMITE in spells:
+            score -= 5000
 
-def _prediction_truncate_name_10(name: str) -> str:
-    """Truncate names to max 10 chars; if longer, cut to 9 and add a single '.'"""
-    s = str(name or '')
-    return s if len(s) <= 10 else (s[:9] + '.')
+    return score
 
 
+class RoleAssigner:
+    def __init__(self):
+        # champion id -> probability per ROLE_ORDER slot
+        self._priors: dict[int, tuple[float, ...]] = {}
+        self._priors_at = 0.0
+        # "match_id:team_id" -> {player identity: role slot}
+        self._assigned = TieredTTLCache(None, max_entries=256)
+
+    def refresh_priors(self, champions: dict[str, dict]) -> None:
+        """Rebuild the prior table from Data Dragon tags + stored match positions
+        (at most every ROLE_PRIORS_REFRESH_SECONDS)."""
+        if self._priors and time.time() - self._priors_at < ROLE_PRIORS_REFRESH_SECONDS:
+            return
+        observed = _match_store.champion_position_counts()
+        priors: dict[int, tuple[float, ...]] = {}
+        for champ_id in set(observed) | {int(k) for k in champions or {}}:
+            tags = [t for t in ((champions or {}).get(str(champ_id)) or {}).get("tags") or [] if t in _ROLE_TAG_PRIORS]
+            if tags:
+                tag_prior = [sum(_ROLE_TAG_PRIORS[t][role] for t in tags) / len(tags) for role in ROLE_ORDER]
+            else:
+                tag_prior = [1.0 / len(ROLE_ORDER)] * len(ROLE_ORDER)
+            counts = observed.get(champ_id) or {}
+            total = sum(counts.values())
+            k = ROLE_PRIOR_TAG_PSEUDO_GAMES
+            priors[champ_id] = tuple(
+                (counts.get(role, 0) + k * tag_prior[i]) / (total + k) for i, role in enumerate(ROLE_ORDER)
+            )
+        self._priors = priors
+        self._priors_at = time.time()
+
+    def _score_matrix(self, team: list[dict]) -> list[list[float]]:
+        uniform = (1.0 / len(ROLE_ORDER),) * len(ROLE_ORDER)
+        matrix = []
+        for r in team:
+            spells = {int(r.get("spell1") or 0), int(r.get("spell2") or 0)}
+            prior = self._priors.get(int(r.get("champion_id") or 0), uniform)
+            matrix.append([_role_spell_score(spells, role) + ROLE_PRIOR_WEIGHT * prior[i] for i, role in enumerate(ROLE_ORDER)])
+        return matrix
+
+    @staticmethod
+    def _identity(player: dict) -> str:
+        puuid = str(player.get("puuid") or "")
+        return puuid or f"champion:{int(player.get('champion_id') or 0)}"
+
+    def assign(self, team: list[dict], cache_key: str | None = None) -> list[dict]:
+        """Return the team in ROLE_ORDER (5 rows; an empty role is {})."""
+        team = list(team)[: len(ROLE_ORDER)]
+        ids = [self._identity(p) for p in team]
+        cached = self._assigned.get(cache_key) if cache_key else None
+        # Reuse a cached assignment only for exactly the same players (order may differ).
+        if isinstance(cached, dict) and len(set(ids)) == len(ids) and set(cached) == set(ids):
+            slots = [cached[i] for i in ids]
+        else:
+            matrix = self._score_matrix(team)
+            slots = max(
+                itertools.permutations(range(len(ROLE_ORDER)), len(team)),
+                key=lambda perm: sum(matrix[i][slot] for i, slot in enumerate(perm)),
+                default=(),
+            )
+            if cache_key:
+                self._assigned.set(cache_key, dict(zip(ids, slots)), ttl=6 * 3600)
 
-def _prediction_embed_for_match(
-    title_line: str,
-    team_id: int,
-    game_start_ms: int,
-    voting_open: bool,
-    voting_closed_at_ms: int | None,
-    win_votes: int,
-    lose_votes: int,
-    tracked_names: list[str],
-    role_lines: list[str] | None = None,
-) -> discord.Embed:
-    start_unix = int(game_start_ms // 1000)
-    now_ms = int(time.time() * 1000)
+        ordered: list[dict] = [{} for _ in ROLE_ORDER]
+        for player, slot in zip(team, slots):
+            ordered[slot] = player
+        return ordered
 
-    if voting_open:
-        close_at_ms = game_start_ms + (PREDICTION_VOTING_OPEN_SECONDS * 1000)
-        remaining_ms = max(0, close_at_ms - now_ms)
-        remaining_s = remaining_ms // 1000
 
-        close_unix = int(close_at_ms // 1000)
+_role_assigner = RoleAssigner()
 
-        if remaining_s >= 60:
-            m = remaining_s // 60
-            s = remaining_s % 60
-            vote_line = f'Voting closes {_prediction_fmt_ts_discord(close_unix)}.'
-        else:
-            vote_line = f'Voting closes {_prediction_fmt_ts_discord(close_unix)}.'
-    else:
-        closed_unix = int((voting_closed_at_ms // 1000) if voting_closed_at_ms else start_unix)
-        vote_line = f'Voting closed {_prediction_fmt_ts_discord(closed_unix)}.'
 
+# ============================================================================
+# Win-probability model for prediction embeds
+#
+# A small logistic regression over stored match-v5 games (NumPy, optional). Each
+# stored ranked game gives two rows, one per team, built only from what is known
+# at game start: side, champion win rates and players' recent form. Champion/form
+# stats are accumulated in game order, so a row never sees its own result. Rank is
+# deliberately not a feature: we only have players' current ranks, which would leak
+# later results into older games. /prediction_train_model does the full fit (off
+# the event loop); every scored prediction then nudges the weights with a few
+# gradient steps.
+# ============================================================================
 
-    roster = ', '.join(tracked_names) if tracked_names else '(none)'
-    desc = (
-        f'**Prediction time!** {title_line}\n'
-        f'Tracked in match: **{roster}**\n'
-        f'Team: **{_prediction_fmt_team(team_id)}**\n\n'
-        f'Match started {_prediction_fmt_ts_discord(start_unix)}\n'
-        f'{vote_line}\n\n'
-        f'Current votes: ✅ WIN **{win_votes}** | ❌ LOSE **{lose_votes}**'
-    )
+try:
+    import numpy as np
+except ImportError:  # optional: without it the embed simply has no model line
+    np = None
+
+PREDICTION_MODEL_FILE = os.getenv("PREDICTION_MODEL_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prediction_model.json"))
+WIN_MODEL_FEATURES = ("bias", "blue_side", "champion_edge", "form_edge")
+# Recent results kept per player for the form feature
+WIN_MODEL_FORM_GAMES = 20
+# No estimate is shown until the model has been fitted on at least this many rows
+WIN_MODEL_MIN_ROWS = 200
+WIN_MODEL_L2 = 1e-3
+# observe() saves at most this often (the state holds form for every player seen)
+WIN_MODEL_SAVE_DELAY_SECONDS = 60
+
+def _fit_logistic(X, y, w0=None, *, steps: int = 800, lr: float = 0.5):
+    """Full-batch gradient descent on L2-regularised log loss (bias unpenalised)."""
+    w = np.zeros(X.shape[1]) if w0 is None else np.array(w0, dtype=float)
+    penalty = np.full(X.shape[1], WIN_MODEL_L2)
+    penalty[0] = 0.0
+    for _ in range(steps):
+        p = 1.0 / (1.0 + np.exp(-(X @ w)))
+        w -= lr * (X.T @ (p - y) / len(y) + penalty * w)
+    return w
+
+
+class WinProbabilityModel:
+    def __init__(self, path: str):
+        self._path = path
+        self._weights: list[float] | None = None
+        self._rows_trained = 0
+        self._champions: dict[str, list[int]] = {}  # championId -> [wins, games]
+        self._players: dict[str, str] = {}          # puuid -> recent results, oldest first ("WLW...")
+        self._observed: deque[str] = deque(maxlen=500)
+        self._loaded = False
+        self._training = False
+        self._save_task: asyncio.Task | None = None
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if list(data.get("features") or []) == list(WIN_MODEL_FEATURES):
+                self._weights = [float(v) for v in data.get("weights") or []] or None
+            self._rows_trained = int(data.get("rows_trained") or 0)
+            self._champions = {str(k): [int(v[0]), int(v[1])] for k, v in (data.get("champions") or {}).items()}
+            self._players = {str(k): str(v) for k, v in (data.get("players") or {}).items()}
+            self._observed.extend(data.get("observed") or [])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[Model] could not load {self._path}: {type(e).__name__}: {e}")
+
+    def _snapshot(self) -> dict:
+        return {
+            "features": list(WIN_MODEL_FEATURES),
+            "weights": list(self._weights) if self._weights else self._weights,
+            "rows_trained": self._rows_trained,
+            "trained_at": int(time.time()),
+            "champions": {k: list(v) for k, v in self._champions.items()},
+            "players": dict(self._players),
+            "observed": list(self._observed),
+        }
 
-    # Champs-only matchup table (5 lines: TOP/JG/MID/ADC/SPP).
-    if role_lines:
-        table = '```text\n' + '\n'.join(role_lines) + '\n```'
-        desc += '\n\n' + table
+    def _schedule_save(self) -> None:
+        """Debounced: a burst of scored games becomes one write, done in a worker thread."""
+        if self._save_task is not None and not self._save_task.done():
+            return
 
-    return discord.Embed(description=desc)
+        async def save_later() -> None:
+            await asyncio.sleep(WIN_MODEL_SAVE_DELAY_SECONDS)
+            await asyncio.to_thread(self._write, self._snapshot())
 
+        self._save_task = asyncio.create_task(save_later())
 
+    def _write(self, data: dict) -> None:
+        try:
+            tmp_path = self._path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, self._path)
+        except Exception as e:
+            print(f"[Model] could not save {self._path}: {type(e).__name__}: {e}")
+
+    def _features(self, team: list[dict], enemy: list[dict], team_id: int) -> list[float]:
+        def champion_logit(p: dict) -> float:
+            wins, games = self._champions.get(str(int(p.get("championId") or 0)), (0, 0))
+            rate = (wins + 5) / (games + 10)
+            return math.log(rate / (1.0 - rate))
+
+        def form(p: dict) -> float:
+            recent = self._players.get(str(p.get("puuid") or ""), "")
+            return (recent.count("W") + 2) / (len(recent) + 4)
+
+        def mean(values: list[float]) -> float:
+            return sum(values) / len(values) if values else 0.0
+
+        return [
+            1.0,
+            1.0 if int(team_id) == 100 else -1.0,
+            mean([champion_logit(p) for p in team]) - mean([champion_logit(p) for p in enemy]),
+            mean([form(p) for p in team]) - mean([form(p) for p in enemy]),
+        ]
 
-def _prediction_result_embed(
-    title_line: str,
-    team_id: int,
-    win: bool,
-    correct_lines: list[str],
-    incorrect_lines: list[str],
-    tracked_names: list[str],
-    leaderboard_text: str | None = None,
-) -> discord.Embed:
-    roster = ", ".join(tracked_names) if tracked_names else "(none)"
-    result_line = f"**{title_line}** on **{_prediction_fmt_team(team_id)}** **{'WON ✅' if win else 'LOST ❌'}**"
+    def _match_rows(self, payload: dict) -> list[tuple[list[float], float]]:
+        participants = (payload.get("info") or {}).get("participants") or []
+        teams = {tid: [p for p in participants if int(p.get("teamId") or 0) == tid] for tid in (100, 200)}
+        if not teams[100] or not teams[200]:
+            return []
+        rows = []
+        for tid, other in ((100, 200), (200, 100)):
+            label = 1.0 if any(p.get("win") for p in teams[tid]) else 0.0
+            rows.append((self._features(teams[tid], teams[other], tid), label))
+        return rows
+
+    def _absorb(self, payload: dict) -> None:
+        for p in (payload.get("info") or {}).get("participants") or []:
+            won = bool(p.get("win"))
+            stats = self._champions.setdefault(str(int(p.get("championId") or 0)), [0, 0])
+            stats[0] += int(won)
+            stats[1] += 1
+            puuid = str(p.get("puuid") or "")
+            if puuid:
+                self._players[puuid] = (self._players.get(puuid, "") + ("W" if won else "L"))[-WIN_MODEL_FORM_GAMES:]
+
+    def predict(self, participants: list[dict], team_id: int) -> float | None:
+        """Win chance (0-100) for team_id from spectator participants; None if no usable model."""
+        self._load()
+        if np is None or not self._weights or self._rows_trained < WIN_MODEL_MIN_ROWS:
+            return None
+        team = [p for p in participants or [] if int(p.get("teamId") or 0) == int(team_id)]
+        enemy = [p for p in participants or [] if int(p.get("teamId") or 0) not in (0, int(team_id))]
+        if not team or not enemy:
+            return None
+        z = float(np.dot(self._weights, self._features(team, enemy, team_id)))
+        return 100.0 / (1.0 + math.exp(-z))
 
-    desc = f"{result_line}\n\nTracked in match: **{roster}**"
-    if leaderboard_text:
-        # Put leaderboard table where the matchup table used to be.
-        desc += "\n\n" + leaderboard_text
+    def observe(self, match_id: str, payload: dict) -> None:
+        """Fold one finished game into the stats and take a few gradient steps on it."""
+        self._load()
+        if match_id in self._observed or self._training:
+            return
+        self._observed.append(match_id)
+        rows = self._match_rows(payload)
+        self._absorb(payload)
+        if np is not None and self._weights and rows:
+            X = np.array([r[0] for r in rows])
+            y = np.array([r[1] for r in rows])
+            self._weights = [float(v) for v in _fit_logistic(X, y, self._weights, steps=10, lr=0.05)]
+            self._rows_trained += len(rows)
+        self._schedule_save()
+
+    def _fit_from_store(self) -> dict:
+        """Blocking part of train(): read every stored ranked game, rebuild the stats on a
+        scratch model and fit. Runs in a worker thread; touches none of our live state."""
+        scratch = WinProbabilityModel(self._path)
+        scratch._loaded = True
+        rows: list[tuple[list[float], float]] = []
+        match_ids: list[str] = []
+        for mid, payload in _match_store.iter_payloads(queue_ids=(420, 440)):
+            match_ids.append(mid)
+            rows.extend(scratch._match_rows(payload))
+            scratch._absorb(payload)
+        if len(rows) < WIN_MODEL_MIN_ROWS:
+            raise RuntimeError(f"only {len(rows)} rows in the match store (need {WIN_MODEL_MIN_ROWS})")
+
+        X = np.array([r[0] for r in rows])
+        y = np.array([r[1] for r in rows])
+        # Hold out the newest 20% to report how it does on games it hasn't seen.
+        split = int(len(rows) * 0.8)
+        w_holdout = _fit_logistic(X[:split], y[:split])
+        holdout_acc = float((((X[split:] @ w_holdout) > 0) == (y[split:] > 0.5)).mean())
+        return {
+            "weights": [float(v) for v in _fit_logistic(X, y)],
+            "rows": len(rows),
+            "holdout_accuracy": holdout_acc,
+            "champions": scratch._champions,
+            "players": scratch._players,
+            "match_ids": match_ids,
+        }
 
-    e = discord.Embed(description=desc)
-    e.add_field(
-        name="Who was right (+1)",
-        value="\n".join(correct_lines) if correct_lines else "Nobody 😅",
-        inline=True,
-    )
-    e.add_field(
-        name="Who was wrong (-1)",
-        value="\n".join(incorrect_lines) if incorrect_lines else "Nobody 🎉",
-        inline=True,
-    )
-    return e
+    async def train(self) -> dict:
+        """Refit from scratch on every stored ranked game. Returns a short report."""
+        if np is None:
+            raise RuntimeError("numpy is not installed")
+        if self._training:
+            raise RuntimeError("training is already running")
+        self._load()
+        self._training = True
+        try:
+            fit = await asyncio.to_thread(self._fit_from_store)
+            self._weights = fit["weights"]
+            self._rows_trained = fit["rows"]
+            self._champions, self._players = fit["champions"], fit["players"]
+            self._observed.extend(fit["match_ids"][-self._observed.maxlen:])
+            await asyncio.to_thread(self._write, self._snapshot())
+            return {
+                "games": fit["rows"] // 2,
+                "rows": fit["rows"],
+                "holdout_accuracy": fit["holdout_accuracy"],
+                "weights": dict(zip(WIN_MODEL_FEATURES, self._weights)),
+            }
+        finally:
+            self._training = False
+
+
+_win_model = WinProbabilityModel(PREDICTION_MODEL_FILE)
 
 
 class PredictionView(discord.ui.View):
-    """Per-match view (not persistent across restarts)."""
+    """Per-match view. Button custom_ids carry the match id, so it can be re-registered
+    as a persistent view for the same message after a restart."""
 
     def __init__(self, cog: "PredictionCog", match_id: str):
         super().__init__(timeout=None)
         self.cog = cog
         self.match_id = match_id
+        self.predict_win.custom_id = f"prediction:win:{match_id}"
+        self.predict_lose.custom_id = f"prediction:lose:{match_id}"
 
     @discord.ui.button(label="WIN", style=discord.ButtonStyle.success)
     async def predict_win(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -317,7 +2641,11 @@ class PredictionSession:
     # Champ matchup table lines (TOP/JG/MID/ADC/SPP): each line is 'ROLE: BlueChamp | RedChamp'
     role_lines: list[str] = field(default_factory=list)
 
+    # Local model's win chance for team_id (see WinProbabilityModel); None = no estimate
+    model_win_pct: float | None = None
+
     votes: dict[int, str] = field(default_factory=dict)  # discord user id -> "WIN"/"LOSE"
+    voter_names: dict[int, str] = field(default_factory=dict)  # display name at vote time (for the ledger)
     voting_open: bool = True
     voting_closed_at_ms: int | None = None
 
@@ -328,6 +2656,35 @@ class PredictionSession:
     # Throttle role-table refresh (spectator fields can be missing early)
     last_role_refresh_ts: float = 0.0
 
+    # Live vote counts, kept in step with `votes` by PredictionCog._record_vote
+    win_votes: int = 0
+    lose_votes: int = 0
+
+    # Debounced message edits (see PredictionCog._request_message_edit)
+    message: discord.PartialMessage | None = field(default=None, repr=False)
+    edit_pending: bool = False
+    last_edit_ts: float = 0.0
+    edit_task: asyncio.Task | None = field(default=None, repr=False)
+
+    # Runtime-only state that isn't written to the journal
+    _TRANSIENT = ("message", "edit_pending", "last_edit_ts", "edit_task", "last_role_refresh_ts", "win_votes", "lose_votes")
+
+    def to_record(self) -> dict:
+        rec = {f.name: getattr(self, f.name) for f in fields(self) if f.name not in self._TRANSIENT}
+        rec["votes"] = {str(uid): v for uid, v in self.votes.items()}
+        rec["voter_names"] = {str(uid): n for uid, n in self.voter_names.items()}
+        return rec
+
+    @classmethod
+    def from_record(cls, rec: dict) -> "PredictionSession":
+        known = {f.name for f in fields(cls)} - set(cls._TRANSIENT)
+        sess = cls(**{k: v for k, v in rec.items() if k in known})
+        sess.votes = {int(uid): v for uid, v in (rec.get("votes") or {}).items()}
+        sess.voter_names = {int(uid): str(n) for uid, n in (rec.get("voter_names") or {}).items()}
+        sess.win_votes = sum(1 for v in sess.votes.values() if v == "WIN")
+        sess.lose_votes = sum(1 for v in sess.votes.values() if v == "LOSE")
+        return sess
+
 
 class PredictionCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -340,29 +2697,34 @@ class PredictionCog(commands.Cog):
             print("[Predict] WARNING: No prediction channel set. Set PREDICTION_CHANNEL_ID env var.")
 
 
-        # Cache Riot identity resolution so we don't probe every loop.
-        # key = f"{game_name}#{tag}" lower
-        self._identity_cache: dict[str, dict] = {}
-
         # Active sessions keyed by match_id
         self._sessions: dict[str, PredictionSession] = {}
 
-        # Recent matches we've already created sessions for (prevents spam if message deleted)
-        self._recent_seen: dict[str, float] = {}
+        # Recent matches we've already created sessions for (prevents spam if message deleted).
+        # Memory-only, 2h TTL, bounded.
+        self._recent_seen = TieredTTLCache(None, max_entries=512)
+
+        # Persistent user scoring lives in _prediction_ledger (SQLite)
 
-        # Persistent user scoring
-        self._scores = _prediction_load_scores()
-        self._scores_lock = asyncio.Lock()
+        # Data Dragon champions and league-v4 entries live in _reference_cache
+        # (memory LRU + disk), so restarts start warm.
 
-        # Data Dragon cache for champId -> champName (avoid repeated HTTP)
-        self._ddragon_cache = {"ts": 0.0, "map": {}}
+        # Tracked Riot accounts, deduplicated across FLEX_PROFILES and SOLOQ_PROFILES
+        # (if the same Riot ID is in both, it's only spectator-checked once):
+        # riot key -> {game_name, tag_line, display_names, allowed_queues}
+        self._accounts: dict[str, dict] = {}
+        self._add_profiles(FLEX_PROFILES, {440})
+        self._add_profiles(SOLOQ_PROFILES, {420})
 
-        # Cache ranked entries per summonerId to avoid rate limits.
-        # key: encryptedSummonerId -> {ts, best_str, strength}
-        self._league_rank_cache: dict[str, dict] = {}
+        # Polling lives in live_game_tracker; we just react to games starting.
+        live_game_tracker.subscribe(GameStarted, self._on_game_started)
 
-        # Start poll loop
-        self.prediction_poll_loop.start()
+        # Voting deadlines are durable timers (restored from disk on their own).
+        _timers.register("prediction_close", self._on_voting_deadlines)
+
+        # Sessions open at the last shutdown/crash come back from the journal.
+        self._journal = PredictionJournal(PREDICTION_JOURNAL_FILE)
+        self._resume_sessions()
 
 
     def _queue_config(self, queue_id: int) -> dict:
@@ -389,40 +2751,49 @@ class PredictionCog(commands.Cog):
         }
 
 
-    async def _ddragon_get_champ_map(self, http: aiohttp.ClientSession) -> dict[int, str]:
-        """Return cached champId -> champName map from Data Dragon."""
-        try:
-            now = time.time()
-            cached = self._ddragon_cache
-            if cached.get("map") and (now - float(cached.get("ts") or 0.0)) < 24 * 3600:
-                return cached["map"]
-
-            # versions.json -> latest patch
+    async def _ddragon_get_champions(self, http: aiohttp.ClientSession) -> dict[str, dict]:
+        """Return {champId (str): {name, tags}} for the latest patch from Data Dragon."""
+        async def load_versions():
             async with http.get("https://ddragon.leagueoflegends.com/api/versions.json", timeout=aiohttp.ClientTimeout(total=15)) as resp:
                 versions = await resp.json()
             if not versions:
-                return cached.get("map") or {}
-            ver = str(versions[0])
+                raise RuntimeError("empty Data Dragon versions list")
+            return [str(v) for v in versions[:5]]
+
+        versions = await _reference_cache.get_or_load(
+            "ddragon:versions", load_versions,
+            ttl=PREDICTION_DDRAGON_VERSIONS_TTL_SECONDS, stale_ttl=30 * 24 * 3600,
+        )
+        ver = str(versions[0])
 
+        async def load_champions():
             url = f"https://ddragon.leagueoflegends.com/cdn/{ver}/data/en_US/champion.json"
             async with http.get(url, timeout=aiohttp.ClientTimeout(total=15)) as resp:
                 payload = await resp.json()
-
-            data = (payload or {}).get("data") or {}
-            champ_map: dict[int, str] = {}
-            for _k, v in data.items():
+            champs: dict[str, dict] = {}
+            for _k, v in ((payload or {}).get("data") or {}).items():
                 try:
                     champ_id = int(v.get("key"))
                     champ_name = str(v.get("name"))
                     if champ_id and champ_name:
-                        champ_map[champ_id] = champ_name
+                        champs[str(champ_id)] = {"name": champ_name, "tags": list(v.get("tags") or [])}
                 except Exception:
                     continue
+            if not champs:
+                raise RuntimeError(f"no champions in Data Dragon {ver}")
+            return champs
 
-            self._ddragon_cache = {"ts": now, "map": champ_map}
-            return champ_map
-        except Exception:
-            return self._ddragon_cache.get("map") or {}
+        # A patch's champion.json never changes.
+        return await _reference_cache.get_or_load(f"ddragon:champions:{ver}", load_champions, ttl=30 * 24 * 3600)
+
+    async def _ddragon_get_champ_map(self, http: aiohttp.ClientSession) -> dict[int, str]:
+        """Return cached champId -> champName map from Data Dragon."""
+        try:
+            champs = await self._ddragon_get_champions(http)
+            return {int(k): v["name"] for k, v in champs.items()}
+        except Exception as e:
+            print(f"[Predict] Data Dragon lookup failed: {type(e).__name__}: {e}")
+            return {}
 
 
 
@@ -471,31 +2842,48 @@ class PredictionCog(commands.Cog):
             return f"{label}: {tier} {div} ({lp} LP)"
         return f"{label}: Ranked"
 
-    async def _fetch_league_entries_by_puuid(self, http: aiohttp.ClientSession, api_key: str, platform: str, puuid: str) -> list[dict]:
-        """Async version of rolesranks.fetch_league_entries_by_puuid."""
-        try:
-            pu = str(puuid or '')
-            if not pu:
-                return []
+    def _cached_league_entries(self, puuid: str, *, allow_stale: bool = True) -> list[dict] | None:
+        """Cached league entries without any network call; None if not cached (or only
+        stale, when allow_stale=False)."""
+        payload = _reference_cache.get(f"league:{puuid or ''}", allow_stale=allow_stale)
+        if payload is None:
+            return None
+        return payload if isinstance(payload, list) else []
 
-            # Cache per puuid (15 min)
-            cached = self._league_rank_cache.get(pu)
-            now = time.time()
-            if cached and (now - float(cached.get('ts') or 0.0)) < 15 * 60:
-                payload = cached.get('entries')
-                return payload if isinstance(payload, list) else []
+    async def _fetch_league_entries_by_puuid(self, http: aiohttp.ClientSession, api_key: str, platform: str, puuid: str, *, fresh: bool = False) -> list[dict]:
+        """Async version of rolesranks.fetch_league_entries_by_puuid.
 
+        A stale cache hit is served as-is and refreshed in the background; fresh=True
+        waits for the refetch instead (falling back to the stale entries if it fails).
+        """
+        pu = str(puuid or '')
+        if not pu:
+            return []
+
+        async def load():
             url = f"https://{platform}.api.riotgames.com/lol/league/v4/entries/by-puuid/{quote(pu, safe='')}"
             code, payload = await _spectate_http_get_json(http, url, api_key)
             if code == 200 and isinstance(payload, list):
-                self._league_rank_cache[pu] = {'ts': now, 'entries': payload}
                 return payload
-
             if code == 404:
-                self._league_rank_cache[pu] = {'ts': now, 'entries': []}
                 return []
+            raise RuntimeError(f"league-v4 {code}")
 
-            return []
+        key = f"league:{pu}"
+        if fresh and _reference_cache.get(key, allow_stale=False) is None:
+            try:
+                payload = await load()
+                _reference_cache.set(key, payload, ttl=PREDICTION_LEAGUE_ENTRIES_TTL_SECONDS, stale_ttl=PREDICTION_LEAGUE_ENTRIES_STALE_SECONDS)
+                return payload
+            except Exception:
+                return self._cached_league_entries(pu) or []
+
+        try:
+            payload = await _reference_cache.get_or_load(
+                key, load,
+                ttl=PREDICTION_LEAGUE_ENTRIES_TTL_SECONDS, stale_ttl=PREDICTION_LEAGUE_ENTRIES_STALE_SECONDS,
+            )
+            return payload if isinstance(payload, list) else []
         except Exception:
             return []
 
@@ -517,9 +2905,14 @@ class PredictionCog(commands.Cog):
             return 'TOP'
         return 'MID'
 
-    async def _build_champ_role_lines(self, http: aiohttp.ClientSession, api_key: str, platform: str, participants: list[dict], our_team_id: int, tracked: list[dict] | None = None, queue_id: int | None = None) -> list[str]:
+    async def _build_champ_role_lines(self, http: aiohttp.ClientSession, api_key: str, platform: str, participants: list[dict], our_team_id: int, tracked: list[dict] | None = None, queue_id: int | None = None, fetch_ranks: bool = True, match_id: str | None = None) -> list[str]:
         """Build a matchup table WITHOUT positions.
 
+        Rows are placed by _role_assigner (cached per match_id, so refreshes reuse it).
+
+        With fetch_ranks=False no league-v4 calls are made: ranks come from the cache
+        and anything not cached yet shows as "…" (see _fill_role_lines).
+
         Format (keeps alignment via fixed widths and a single vertical divider):
 
             ALLIES                 | ENEMIES
@@ -534,6 +2927,10 @@ class PredictionCog(commands.Cog):
           - Champ (Anon)   -> streamer mode / no rank info / missing puuid
         """
         champ_map = await self._ddragon_get_champ_map(http)
+        try:
+            _role_assigner.refresh_priors(await self._ddragon_get_champions(http))
+        except Exception as e:
+            print(f"[Predict] role priors unavailable: {type(e).__name__}: {e}")
 
         our_team_id = int(our_team_id or 0)
         enemy_team_id = 200 if our_team_id == 100 else 100
@@ -619,6 +3016,7 @@ class PredictionCog(commands.Cog):
 
                 rec = {
                     'champ': champ,
+                    'champion_id': int(p.get('championId') or 0),
                     'tracked_name': tracked_map.get(puuid),  # only set if this ally is in the tracked list
                     'summoner': str(p.get('summonerName') or ''),
                     'puuid': puuid,
@@ -633,130 +3031,24 @@ class PredictionCog(commands.Cog):
             except Exception:
                 continue
 
-        # --- Spell-based lane ordering (TOP / JG / MID / ADC / SPP) ---
-        ROLE_ORDER = ["TOP", "JG", "MID", "ADC", "SPP"]
-
-        SPELL_SMITE = 11
-        SPELL_TELEPORT = 12
-        SPELL_HEAL = 7
-        SPELL_EXHAUST = 3
-        SPELL_IGNITE = 14
-        SPELL_BARRIER = 21
-        SPELL_GHOST = 6
-
-        def _spells_set(r: dict) -> set[int]:
-            return {int(r.get("spell1") or 0), int(r.get("spell2") or 0)}
-
-        def _score_for_role(r: dict, role: str) -> int:
-            s = _spells_set(r)
-            score = 0
-
-            # Hard identifiers
-            if role == "JG":
-                return 10_000 if SPELL_SMITE in s else -10_000
-
-            if role == "ADC":
-                # Your rule: ADC will have Barrier
-                if SPELL_BARRIER in s:
-                    score += 5000
-                # common-but-not-required signals (helps if Barrier isn't present)
-                if SPELL_HEAL in s:
-                    score += 200
-                if SPELL_EXHAUST in s:
-                    score -= 100
-                if SPELL_TELEPORT in s:
-                    score -= 200
-
-            if role == "SPP":
-                # Your rule: support heal (maybe ignite or exh)
-                if SPELL_EXHAUST in s:
-                    score += 1200
-                if SPELL_IGNITE in s:
-                    score += 900
-                if SPELL_HEAL in s:
-                    score += 700
-                if SPELL_BARRIER in s:
-                    score -= 400
-                if SPELL_TELEPORT in s:
-                    score -= 200
-
-            if role == "MID":
-                # Your rule: likely ignite then TP
-                if SPELL_IGNITE in s:
-                    score += 1200
-                if SPELL_TELEPORT in s:
-                    score += 500
-                if SPELL_EXHAUST in s:
-                    score += 100
-                if SPELL_BARRIER in s:
-                    score -= 300
-                if SPELL_SMITE in s:
-                    score -= 5000
-
-            if role == "TOP":
-                # Your rule: TP ignite ghost
-                if SPELL_TELEPORT in s:
-                    score += 1200
-                if SPELL_GHOST in s:
-                    score += 700
-                if SPELL_IGNITE in s:
-                    score += 500
-                if SPELL_EXHAUST in s:
-                    score -= 200
-                if SPELL_BARRIER in s:
-                    score -= 300
-                if SPELL_SMITE in s:
-                    score -= 5000
-
-            return score
-
-        def _assign_by_spells(team: list[dict]) -> list[dict]:
-            # Build role->candidate list sorted by score desc
-            remaining = list(team)
-            assigned: dict[str, dict] = {}
-
-            # 1) Lock jungle (smite-only)
-            jg = None
-            for r in remaining:
-                if SPELL_SMITE in _spells_set(r):
-                    jg = r
-                    break
-            if jg:
-                assigned["JG"] = jg
-                remaining.remove(jg)
-
-            # 2) Try to lock ADC by Barrier
-            adc = None
-            for r in remaining:
-                if SPELL_BARRIER in _spells_set(r):
-                    adc = r
-                    break
-            if adc:
-                assigned["ADC"] = adc
-                remaining.remove(adc)
-
-            # 3) Greedy fill the rest by highest score per role, avoiding duplicates
-            for role in ["TOP", "MID", "SPP", "ADC"]:
-                if role in assigned:
-                    continue
-                if not remaining:
-                    break
-                # pick best remaining by score for this role
-                best = max(remaining, key=lambda r: _score_for_role(r, role))
-                assigned[role] = best
-                remaining.remove(best)
+        # --- Lane ordering (TOP / JG / MID / ADC / SPP) ---
+        allies = _role_assigner.assign(allies, f"{match_id}:{our_team_id}" if match_id else None)
+        enemies = _role_assigner.assign(enemies, f"{match_id}:{enemy_team_id}" if match_id else None)
 
-            # Anything left (shouldn't happen), append
-            ordered = []
-            for role in ROLE_ORDER:
-                if role in assigned:
-                    ordered.append(assigned[role])
-            ordered.extend(remaining)
-            # Ensure length 5
-            return ordered[:5] + (["—"] * max(0, 5 - len(ordered)))
+        # Look up every rank the table needs at once (the Riot scheduler paces them).
+        if fetch_ranks:
+            need = [r.get('puuid') for r in enemies if isinstance(r, dict)]
+            if int(queue_id or 0) != 440:
+                need += [r.get('puuid') for r in allies if isinstance(r, dict) and not r.get('tracked_name')]
+            await asyncio.gather(*(
+                self._fetch_league_entries_by_puuid(http, api_key, platform, pu)
+                for pu in dict.fromkeys(pu for pu in need if pu)
+            ))
 
-        allies = _assign_by_spells(allies)
-        enemies = _assign_by_spells(enemies)
+        async def rank_entries(puuid: str) -> list[dict] | None:
+            if fetch_ranks:
+                return await self._fetch_league_entries_by_puuid(http, api_key, platform, puuid)
+            return self._cached_league_entries(puuid)
 
 
         # Build enemy display strings with rank
@@ -779,6 +3071,9 @@ class PredictionCog(commands.Cog):
         # Build enemy display strings with rank
         enemy_disp: list[str] = []
         for e in enemies:
+            if not e:
+                enemy_disp.append('—')
+                continue
             champ_full = e.get('champ') or '—'
             champ = champ7(champ_full)
 
@@ -787,7 +3082,10 @@ class PredictionCog(commands.Cog):
                 enemy_disp.append(f"{champ}\t(Anon)")
                 continue
 
-            entries = await self._fetch_league_entries_by_puuid(http, api_key, platform, puuid)
+            entries = await rank_entries(puuid)
+            if entries is None:
+                enemy_disp.append(f"{champ}\t…")
+                continue
             q_letter, cr = compact_rank(entries if isinstance(entries, list) else [])
 
             if not q_letter or not cr:
@@ -813,6 +3111,9 @@ class PredictionCog(commands.Cog):
         # - Otherwise (e.g., SoloQ) if ally is NOT tracked -> Champ (S/F)RANK (same as enemies)
         ally_disp: list[str] = []
         for a in allies:
+            if not a:
+                ally_disp.append('—')
+                continue
             champ_full = a.get('champ') or '—'
             champ = champ7(champ_full)
 
@@ -834,7 +3135,10 @@ class PredictionCog(commands.Cog):
                 ally_disp.append(f"{champ}\t(Anon)")
                 continue
 
-            entries = await self._fetch_league_entries_by_puuid(http, api_key, platform, puuid)
+            entries = await rank_entries(puuid)
+            if entries is None:
+                ally_disp.append(f"{champ}\t…")
+                continue
             q_letter, cr = compact_rank(entries if isinstance(entries, list) else [])
 
             if not q_letter or not cr:
@@ -916,19 +3220,9 @@ class PredictionCog(commands.Cog):
     # Riot API helpers (same method as predictor)
     # -----------------------------
 
-    def _cache_key(self, game_name: str, tag_line: str) -> str:
-        return f"{game_name}#{tag_line}".lower()
-
     async def _resolve_identity(self, session: aiohttp.ClientSession, api_key: str, game_name: str, tag_line: str) -> dict:
-        key = self._cache_key(game_name, tag_line)
-        cached = self._identity_cache.get(key)
-        if cached:
-            return cached
-        puuid = await _spectate_get_puuid(session, api_key, game_name, tag_line)
-        platform = await _spectate_find_lol_platform(session, api_key, puuid)
-        cached = {"puuid": puuid, "platform": platform}
-        self._identity_cache[key] = cached
-        return cached
+        # Shared, on-disk registry (no probes for known accounts after a restart).
+        return await _riot_identities.resolve(session, api_key, game_name, tag_line)
 
     def _get_queue_behavior(self, queue_id: int) -> dict:
         """Return per-queue routing/lifecycle config (easy to tweak later)."""
@@ -937,9 +3231,6 @@ class PredictionCog(commands.Cog):
         except Exception:
             return {}
 
-    async def _fetch_match_v5(self, session: aiohttp.ClientSession, api_key: str, region: str, match_id: str) -> tuple[int, object]:
-        url = f"https://{region}.api.riotgames.com/lol/match/v5/matches/{match_id}"
-        return await _spectate_http_get_json(session, url, api_key)
 
     # -----------------------------
     # Discord vote handling
@@ -964,24 +3255,90 @@ class PredictionCog(commands.Cog):
                 pass
             return
 
-        sess.votes[interaction.user.id] = choice
+        self._record_vote(sess, interaction.user.id, choice, interaction.user.display_name)
 
-        # Update counts live
-        try:
-            await self._update_prediction_message(sess)
-        except Exception:
-            pass
+        # Update counts live (debounced; a burst of votes becomes one edit)
+        self._request_message_edit(sess)
 
-    async def _update_prediction_message(self, sess: PredictionSession) -> None:
-        if not sess.message_id:
+    def _record_vote(self, sess: PredictionSession, user_id: int, choice: str, name: str | None = None) -> None:
+        previous = sess.votes.get(user_id)
+        if name and sess.voter_names.get(user_id) != name:
+            sess.voter_names[user_id] = name
+            if previous == choice:
+                self._journal.append("vote", sess.match_id, user_id=int(user_id), choice=choice, name=name)
+        if previous == choice:
             return
+        if previous == "WIN":
+            sess.win_votes -= 1
+        elif previous == "LOSE":
+            sess.lose_votes -= 1
+        if choice == "WIN":
+            sess.win_votes += 1
+        elif choice == "LOSE":
+            sess.lose_votes += 1
+        sess.votes[user_id] = choice
+        self._journal.append("vote", sess.match_id, user_id=int(user_id), choice=choice, name=sess.voter_names.get(user_id))
+
+    def _prediction_message(self, sess: PredictionSession):
+        """Message handle for the session's prediction post, without a fetch_message round-trip."""
+        if not sess.message_id:
+            return None
+        if sess.message is not None and sess.message.id == sess.message_id:
+            return sess.message
         channel = self.bot.get_channel(sess.channel_id)
-        if not isinstance(channel, discord.abc.Messageable):
-            return
-        msg = await channel.fetch_message(sess.message_id)
+        if not hasattr(channel, "get_partial_message"):
+            return None
+        sess.message = channel.get_partial_message(sess.message_id)
+        return sess.message
+
+    def _request_message_edit(self, sess: PredictionSession) -> None:
+        """Mark the prediction message dirty; one background task flushes the latest state."""
+        sess.edit_pending = True
+        if sess.edit_task is None or sess.edit_task.done():
+            sess.edit_task = asyncio.create_task(self._flush_message_edits(sess))
+
+    async def _flush_message_edits(self, sess: PredictionSession) -> None:
+        while sess.edit_pending and not sess.result_posted:
+            wait = PREDICTION_EDIT_MIN_INTERVAL_SECONDS - (time.time() - sess.last_edit_ts)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            sess.edit_pending = False
+            sess.last_edit_ts = time.time()
+            try:
+                await self._update_prediction_message(sess)
+            except Exception as e:
+                print(f"[Predict] prediction message edit failed for {sess.match_id}: {type(e).__name__}: {e}")
+
+    async def _cancel_message_edits(self, sess: PredictionSession) -> None:
+        """Stop pending vote edits before the message is replaced by a result/no-contest."""
+        sess.edit_pending = False
+        task = sess.edit_task
+        if task is not None and not task.done() and task is not asyncio.current_task():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        sess.edit_task = None
+
+    def _prediction_embed_for_session(self, sess: PredictionSession) -> discord.Embed:
+        return _prediction_embed_for_match(
+            title_line=sess.title_line,
+            team_id=sess.team_id,
+            game_start_ms=sess.game_start_time_ms,
+            voting_open=sess.voting_open,
+            voting_closed_at_ms=sess.voting_closed_at_ms,
+            win_votes=sess.win_votes,
+            lose_votes=sess.lose_votes,
+            tracked_names=[t["name"] for t in sess.tracked],
+            role_lines=getattr(sess, 'role_lines', None),
+            model_win_pct=sess.model_win_pct,
+        )
 
-        win_votes = sum(1 for v in sess.votes.values() if v == "WIN")
-        lose_votes = sum(1 for v in sess.votes.values() if v == "LOSE")
+    async def _update_prediction_message(self, sess: PredictionSession) -> None:
+        msg = self._prediction_message(sess)
+        if msg is None or sess.result_posted:
+            return
 
         # Refresh champ/role table if it's still empty (spectator role fields can populate late).
         try:
@@ -1002,28 +3359,16 @@ class PredictionCog(commands.Cog):
                 if api_key and sess.tracked:
                     tracked_puuid = sess.tracked[0].get("puuid")
                     if tracked_puuid:
-                        async with aiohttp.ClientSession() as http:
-                            in_game, info = await _spectate_check_active_game(http, api_key, sess.platform, tracked_puuid)
-                            if in_game and info:
-                                participants = info.get("participants") or []
-                                sess.role_lines = await self._build_champ_role_lines(http, api_key, sess.platform, participants, sess.team_id, tracked=sess.tracked, queue_id=sess.queue_id)
+                        http = _riot_http.session
+                        in_game, info = await _spectate_check_active_game(http, api_key, sess.platform, tracked_puuid)
+                        if in_game and info:
+                            participants = info.get("participants") or []
+                            sess.role_lines = await self._build_champ_role_lines(http, api_key, sess.platform, participants, sess.team_id, tracked=sess.tracked, queue_id=sess.queue_id, match_id=sess.match_id)
         except Exception:
             pass
 
-        embed = _prediction_embed_for_match(
-            title_line=sess.title_line,
-            team_id=sess.team_id,
-            game_start_ms=sess.game_start_time_ms,
-            voting_open=sess.voting_open,
-            voting_closed_at_ms=sess.voting_closed_at_ms,
-            win_votes=win_votes,
-            lose_votes=lose_votes,
-            tracked_names=[t["name"] for t in sess.tracked],
-            role_lines=getattr(sess, 'role_lines', None),
-        )
-
         view = PredictionView(self, sess.match_id) if sess.voting_open else None
-        await msg.edit(embed=embed, view=view)
+        await msg.edit(embed=self._prediction_embed_for_session(sess), view=view)
 
     # -----------------------------
     # Session lifecycle
@@ -1035,41 +3380,64 @@ class PredictionCog(commands.Cog):
             print("[Predict] Could not access prediction channel.")
             return
 
-        # Initial placeholder
-        msg = await channel.send(embed=discord.Embed(title="Prediction time!", description="Starting prediction…"), view=PredictionView(self, sess.match_id))
+        # Post the full embed straight away (one call; no placeholder + edit)
+        msg = await channel.send(embed=self._prediction_embed_for_session(sess), view=PredictionView(self, sess.match_id))
         sess.message_id = msg.id
-        await self._update_prediction_message(sess)
+        self._journal.append("message", sess.match_id, message_id=msg.id)
+        sess.message = msg
+        sess.last_edit_ts = time.time()
 
-        # Schedule voting close
-        asyncio.create_task(self._schedule_voting_close_and_score(sess.match_id))
+        self._schedule_voting_close(sess)
 
-    async def _schedule_voting_close_and_score(self, match_id: str) -> None:
-        sess = self._sessions.get(match_id)
-        if not sess:
-            return
+    def _resume_sessions(self) -> None:
+        """Rebuild open sessions from the journal: re-attach buttons to the existing
+        message and pick up the voting close / result wait where it left off."""
+        records = self._journal.replay()
+        now = time.time()
+        resumed: dict[str, dict] = {}
+        for mid, rec in records.items():
+            try:
+                sess = PredictionSession.from_record(rec)
+            except Exception as e:
+                print(f"[Predict] could not resume session {mid}: {type(e).__name__}: {e}")
+                continue
+            if now - sess.created_at_ms / 1000 > PREDICTION_RESULT_TIMEOUT_SECONDS + 3600:
+                continue
+            self._sessions[mid] = sess
+            self._recent_seen.set(mid, sess.created_at_ms / 1000, ttl=2 * 3600)
+            resumed[mid] = sess.to_record()
+
+            if sess.message_id and sess.voting_open:
+                self.bot.add_view(PredictionView(self, mid), message_id=int(sess.message_id))
+            if sess.voting_open:
+                self._schedule_voting_close(sess)
+            else:
+                asyncio.create_task(self._wait_for_match_and_score(mid))
+
+        self._journal.compact(resumed)
+        if resumed:
+            print(f"[Predict] resumed {len(resumed)} session(s) from journal: {', '.join(resumed)}")
 
-        close_at_ms = sess.game_start_time_ms + PREDICTION_VOTING_OPEN_SECONDS * 1000
-        delay = max(0.0, (close_at_ms - int(time.time() * 1000)) / 1000.0)
-        await asyncio.sleep(delay)
+    def _schedule_voting_close(self, sess: PredictionSession) -> None:
+        # Keyed per match, so re-scheduling on resume is a no-op.
+        close_at = (sess.game_start_time_ms + PREDICTION_VOTING_OPEN_SECONDS * 1000) / 1000.0
+        _timers.schedule_at("prediction_close", close_at, {"match_id": sess.match_id}, key=f"prediction_close:{sess.match_id}")
 
+    async def _on_voting_deadlines(self, payloads: list[dict]) -> None:
+        for p in payloads:
+            asyncio.create_task(self._close_voting_and_score(str(p.get("match_id"))))
+
+    async def _close_voting_and_score(self, match_id: str) -> None:
         # Close voting
         sess = self._sessions.get(match_id)
         if not sess or not sess.voting_open:
             return
         sess.voting_open = False
         sess.voting_closed_at_ms = int(time.time() * 1000)
+        self._journal.append("lock", sess.match_id, at_ms=sess.voting_closed_at_ms)
 
-        # Remove buttons
-        try:
-            if sess.message_id:
-                channel = self.bot.get_channel(sess.channel_id)
-                if isinstance(channel, discord.abc.Messageable):
-                    msg = await channel.fetch_message(sess.message_id)
-                    await msg.edit(view=None)
-        except Exception:
-            pass
-
-        # Update embed with "voting closed" line
+        # Update embed with "voting closed" line and remove buttons (one edit, goes out now)
+        await self._cancel_message_edits(sess)
         try:
             await self._update_prediction_message(sess)
         except Exception:
@@ -1077,9 +3445,10 @@ class PredictionCog(commands.Cog):
 
         # Delete the prediction message after the lock window (queue-dependent)
         if sess.message_id and bool(getattr(sess, 'delete_prediction_after_lock', True)):
-            asyncio.create_task(self._delete_message_later(sess.channel_id, sess.message_id, PREDICTION_VOTING_LOCK_SECONDS))
+            _schedule_message_delete(sess.channel_id, sess.message_id, PREDICTION_VOTING_LOCK_SECONDS)
             # Clear message_id since this message should no longer be used
             sess.message_id = None
+            self._journal.append("message", sess.match_id, message_id=None)
 
         # Wait for match result and score
         await self._wait_for_match_and_score(match_id)
@@ -1095,116 +3464,90 @@ class PredictionCog(commands.Cog):
             return
 
         deadline = time.time() + PREDICTION_RESULT_TIMEOUT_SECONDS
-        last_err = None
 
         # Use any tracked participant's puuid to determine win/team
         tracked_puuid = sess.tracked[0]["puuid"] if sess.tracked else None
         if not tracked_puuid:
             return
 
-        async with aiohttp.ClientSession() as http:
-            while time.time() < deadline:
-                try:
-                    code, payload = await self._fetch_match_v5(http, api_key, sess.region, sess.match_id)
-                    if code == 200 and isinstance(payload, dict):
-                        info = payload.get("info") or {}
-                        participants = info.get("participants") or []
-                        game_dur = int(info.get("gameDuration") or 0)
-
-                        # Remake / early end => void
-                        if 0 < game_dur < PREDICTION_REMAKE_THRESHOLD_SECONDS:
-                            await self._void_match(sess, reason=f"Remake/short game ({game_dur}s).")
-                            return
-
-                        # Determine result for the tracked team
-                        win = None
-                        team_id = None
-                        for p in participants:
-                            if p.get("puuid") == tracked_puuid:
-                                win = bool(p.get("win"))
-                                team_id = int(p.get("teamId") or 0)
-                                break
-                        if win is None or team_id not in (100, 200):
-                            last_err = "Match found but tracked participant missing."
-                            await asyncio.sleep(10)
-                            continue
+        # 1) Nothing to poll until spectator says the game is over.
+        if not await live_game_tracker.wait_game_ended(sess.match_id, timeout=deadline - time.time()):
+            await self._void_match(sess, reason="Timed out waiting for the game to end.")
+            return
 
-                        # Score voters
-                        await self._apply_scoring_and_post_result(sess, win=bool(win), final_team_id=int(team_id))
-                        return
+        # 2) Shared by-puuid/ids poll with backoff, then a single match-v5 fetch.
+        try:
+            payload = await _match_results.wait(
+                sess.region,
+                sess.match_id,
+                [t.get("puuid") for t in sess.tracked],
+                timeout=deadline - time.time(),
+            )
+        except RiotAPIError:
+            await self._void_match(sess, reason="Riot API key rejected (403); can't fetch the result.")
+            return
+        if not isinstance(payload, dict):
+            await self._void_match(sess, reason="Timed out waiting for match result.")
+            return
+
+        info = payload.get("info") or {}
+        participants = info.get("participants") or []
+        game_dur = int(info.get("gameDuration") or 0)
+
+        # Remake / early end => void
+        if 0 < game_dur < PREDICTION_REMAKE_THRESHOLD_SECONDS:
+            await self._void_match(sess, reason=f"Remake/short game ({game_dur}s).")
+            return
 
-                    if code == 404:
-                        last_err = "Match not found yet."
-                        await asyncio.sleep(10)
-                        continue
-                    if code == 429:
-                        last_err = "Rate limited (match-v5)."
-                        await asyncio.sleep(15)
-                        continue
-                    if code == 403:
-                        last_err = "403 Forbidden (Riot key invalid/expired)."
-                        break
+        try:
+            _win_model.observe(sess.match_id, payload)
+        except Exception as e:
+            print(f"[Model] update failed for {sess.match_id}: {type(e).__name__}: {e}")
 
-                    last_err = f"Unexpected match-v5 response: {code}"
-                    await asyncio.sleep(10)
-                except Exception as e:
-                    last_err = f"{type(e).__name__}: {e}"
-                    await asyncio.sleep(10)
+        # Determine result for the tracked team
+        win = None
+        team_id = None
+        for p in participants:
+            if p.get("puuid") == tracked_puuid:
+                win = bool(p.get("win"))
+                team_id = int(p.get("teamId") or 0)
+                break
+        if win is None or team_id not in (100, 200):
+            await self._void_match(sess, reason="Match found but tracked participant missing.")
+            return
 
-        # Timed out
-        await self._void_match(sess, reason=f"Timed out waiting for match result. ({last_err})")
+        # Score voters
+        await self._apply_scoring_and_post_result(sess, win=bool(win), final_team_id=int(team_id))
 
     async def _void_match(self, sess: PredictionSession, reason: str) -> None:
-        if not sess.message_id:
-            return
-        channel = self.bot.get_channel(sess.channel_id)
-        if not isinstance(channel, discord.abc.Messageable):
+        await self._cancel_message_edits(sess)
+        self._journal.append("end", sess.match_id, outcome="void", reason=reason)
+        msg = self._prediction_message(sess)
+        if msg is None:
             return
         try:
-            msg = await channel.fetch_message(sess.message_id)
             await msg.edit(embed=discord.Embed(description=f"**No contest**\n{reason}\n\nScores unchanged."), view=None)
         except Exception:
             pass
 
-        asyncio.create_task(self._delete_message_later(sess.channel_id, sess.message_id, PREDICTION_PREDICTION_MESSAGE_DELETE_AFTER_SECONDS))
+        _schedule_message_delete(sess.channel_id, sess.message_id, PREDICTION_PREDICTION_MESSAGE_DELETE_AFTER_SECONDS)
         sess.result_posted = True
         self._sessions.pop(sess.match_id, None)
 
     async def _apply_scoring_and_post_result(self, sess: PredictionSession, win: bool, final_team_id: int) -> None:
-        # WIN vote means the tracked team wins.
-        correct_ids: list[int] = []
-        wrong_ids: list[int] = []
-
-        async with self._scores_lock:
-            for uid, vote in list(sess.votes.items()):
-                is_correct = (vote == "WIN" and win) or (vote == "LOSE" and not win)
-                member = None
-                try:
-                    member = self.bot.get_user(uid) or await self.bot.fetch_user(uid)
-                except Exception:
-                    member = None
-
-                if member:
-                    entry = _prediction_upsert_user(self._scores, member)
-                    if is_correct:
-                        entry["correct"] += 1
-                        correct_ids.append(uid)
-                    else:
-                        entry["wrong"] += 1
-                        wrong_ids.append(uid)
-                else:
-                    # Still track by id if fetch failed
-                    users = self._scores.setdefault("users", {})
-                    entry = users.get(str(uid)) or {"name": f"User-{uid}", "correct": 0, "wrong": 0}
-                    if is_correct:
-                        entry["correct"] = int(entry.get("correct", 0)) + 1
-                        correct_ids.append(uid)
-                    else:
-                        entry["wrong"] = int(entry.get("wrong", 0)) + 1
-                        wrong_ids.append(uid)
-                    users[str(uid)] = entry
+        await self._cancel_message_edits(sess)
 
-            _prediction_save_scores(self._scores)
+        # WIN vote means the tracked team wins. One transaction for this match's voters only.
+        try:
+            correct_ids, wrong_ids = _prediction_ledger.record_match(
+                sess.match_id, sess.queue_id, dict(sess.votes), win, names=dict(sess.voter_names)
+            )
+        except Exception as e:
+            print(f"[Predict] ledger write failed for {sess.match_id}: {type(e).__name__}: {e}")
+            await self._void_match(sess, reason="Could not record scores.")
+            return
+        # Scores are saved: from here a restart must not score this match again.
+        self._journal.append("end", sess.match_id, outcome="win" if win else "loss")
         # Post result
         # - Flex (default): post a NEW message and delete it shortly after
         # - SoloQ: edit the original prediction message in-place and delete it after the game ends
@@ -1213,34 +3556,14 @@ class PredictionCog(commands.Cog):
         if not isinstance(channel, discord.abc.Messageable):
             return
 
-        # Build a top-6 leaderboard table (same formatting as /prediction_leaderboard) (same formatting as /prediction_leaderboard)
-        users = (self._scores.get("users") or {})
-        rows: list[dict] = []
-        for uid, entry in users.items():
-            try:
-                correct = int(entry.get("correct", 0))
-                wrong = int(entry.get("wrong", 0))
-            except Exception:
-                correct, wrong = 0, 0
-            total = correct + wrong
-            if total <= 0:
-                continue
-            score = correct - wrong
-            acc = (correct / total) * 100.0 if total else 0.0
-            name = str(entry.get("name") or f"User-{uid}")
-            rows.append({"name": name, "score": score, "correct": correct, "wrong": wrong, "acc": acc})
-        rows.sort(key=lambda r: (r["score"], r["acc"], r["correct"]), reverse=True)
-        leaderboard_text = self._format_prediction_leaderboard(rows[:6]) if rows else None
-
-        # Build display names for the non-ping initial result message
-        correct_plain: list[str] = []
-        wrong_plain: list[str] = []
-        for uid in correct_ids:
-            entry = (self._scores.get("users") or {}).get(str(uid)) or {}
-            correct_plain.append(str(entry.get("name") or f"User-{uid}"))
-        for uid in wrong_ids:
-            entry = (self._scores.get("users") or {}).get(str(uid)) or {}
-            wrong_plain.append(str(entry.get("name") or f"User-{uid}"))
+        # Top-6 leaderboard table (same formatting as /prediction_leaderboard)
+        rows = _prediction_ledger.leaderboard(6)
+        leaderboard_text = self._format_prediction_leaderboard(rows) if rows else None
+
+        # Display names for the non-ping initial result message (stored at vote time)
+        names = _prediction_ledger.names(list(correct_ids) + list(wrong_ids))
+        correct_plain = [names.get(uid) or f"User-{uid}" for uid in correct_ids]
+        wrong_plain = [names.get(uid) or f"User-{uid}" for uid in wrong_ids]
 
         # Send WITHOUT mentions first (so nobody is notified), then edit after 3s with mentions.
         embed_plain = _prediction_result_embed(
@@ -1269,7 +3592,7 @@ class PredictionCog(commands.Cog):
                 self._sessions.pop(sess.match_id, None)
                 return
             try:
-                msg = await channel.fetch_message(sess.message_id)
+                msg = self._prediction_message(sess)
                 await msg.edit(embed=embed_plain, view=None)
                 result_msg = msg
             except Exception:
@@ -1293,224 +3616,188 @@ class PredictionCog(commands.Cog):
         except Exception:
             pass
 
-        asyncio.create_task(self._delete_message_later(sess.channel_id, result_msg.id, int(getattr(sess, 'message_delete_after_game_seconds', PREDICTION_RESULT_MESSAGE_DELETE_AFTER_SECONDS))))
+        _schedule_message_delete(sess.channel_id, result_msg.id, int(getattr(sess, 'message_delete_after_game_seconds', PREDICTION_RESULT_MESSAGE_DELETE_AFTER_SECONDS)))
         sess.result_posted = True
         self._sessions.pop(sess.match_id, None)
 
-    async def _delete_message_later(self, channel_id: int, message_id: int, delay_seconds: int) -> None:
-        await asyncio.sleep(int(delay_seconds or 0))
-        try:
-            channel = self.bot.get_channel(channel_id)
-            if isinstance(channel, discord.abc.Messageable):
-                msg = await channel.fetch_message(message_id)
-                await msg.delete()
-        except Exception:
-            pass
-
     # -----------------------------
-    # Poll loop
+    # Game start (from live_game_tracker)
     # -----------------------------
 
-    @tasks.loop(seconds=PREDICTION_POLL_INTERVAL_SECONDS)
-    async def prediction_poll_loop(self):
+    def _add_profiles(self, profiles_dict: dict, allowed_queues: set[int]) -> None:
+        for display_name, riot in (profiles_dict or {}).items():
+            game_name = (riot.get("sumname") or "").strip()
+            tag_line = (riot.get("tag") or "").strip()
+            if not game_name or not tag_line:
+                continue
+            key = live_game_tracker.watch(game_name, tag_line)
+            entry = self._accounts.setdefault(key, {
+                "game_name": game_name,
+                "tag_line": tag_line,
+                "display_names": [],
+                "allowed_queues": set(),
+            })
+            entry["display_names"].append(display_name)
+            entry["allowed_queues"].update(allowed_queues)
+
+    async def _on_game_started(self, event: GameStarted):
         api_key = os.getenv("RIOT_API_KEY")
         if not api_key:
             return
 
-        # Prune seen map (keep 2 hours)
+        # Drop expired seen entries, and sessions stuck well past the result timeout
         now = time.time()
-        self._recent_seen = {k: v for k, v in self._recent_seen.items() if now - v < 2 * 3600}
-
-        # Build: match_id -> {platform, platform_id, region, game_id, queue_id, tracked:[...] , game_start_time_ms}
-        games: dict[str, dict] = {}
-
-        try:
-            async with aiohttp.ClientSession() as http:
-                                # Resolve and check active game for each tracked profile
-                                # Deduplicate Riot accounts across FLEX_PROFILES and SOLOQ_PROFILES:
-                                # If the same Riot ID is in both, we only spectate-check once.
-                                unique_accounts: dict[str, dict] = {}
-
-                                def _add_profiles(profiles_dict: dict, allowed_queues: set[int]) -> None:
-                                    for display_name, riot in (profiles_dict or {}).items():
-                                        game_name = (riot.get("sumname") or "").strip()
-                                        tag_line = (riot.get("tag") or "").strip()
-                                        if not game_name or not tag_line:
-                                            continue
-                                        key = f"{game_name}#{tag_line}".lower()
-                                        entry = unique_accounts.setdefault(key, {
-                                            "game_name": game_name,
-                                            "tag_line": tag_line,
-                                            "display_names": [],
-                                            "allowed_queues": set(),
-                                        })
-                                        entry["display_names"].append(display_name)
-                                        entry["allowed_queues"].update(allowed_queues)
-
-                                _add_profiles(FLEX_PROFILES, {440})
-                                _add_profiles(SOLOQ_PROFILES, {420})
-
-                                for _, acct in unique_accounts.items():
-                                    try:
-                                        game_name = acct["game_name"]
-                                        tag_line = acct["tag_line"]
-                                        allowed_queues = acct["allowed_queues"]
-                                        display_names = acct["display_names"]
-
-                                        ident = await self._resolve_identity(http, api_key, game_name, tag_line)
-                                        puuid = ident["puuid"]
-                                        platform = ident["platform"]
-
-                                        in_game, info = await _spectate_check_active_game(http, api_key, platform, puuid)
-                                        if not in_game or not info:
-                                            continue
-
-                                        queue_id = int(info.get("gameQueueConfigId") or 0)
-                                        if queue_id not in allowed_queues:
-                                            continue
-
-                                        platform_id = str(info.get("platformId") or platform).upper()
-                                        game_id = int(info.get("gameId"))
-                                        match_id = _prediction_make_match_id(platform_id, game_id)
-                                        region = _prediction_match_region_for_platform(platform)
-                                        gst = int(info.get("gameStartTime") or int(time.time() * 1000))
-
-                                        # Determine this player's team
-                                        team_id = None
-                                        for p in (info.get("participants") or []):
-                                            if p.get("puuid") == puuid:
-                                                team_id = int(p.get("teamId") or 0)
-                                                break
-                                        if team_id not in (100, 200):
-                                            continue
-
-                                        g = games.setdefault(match_id, {
-                                            "platform": platform,
-                                            "platform_id": platform_id,
-                                            "region": region,
-                                            "game_id": game_id,
-                                            "queue_id": queue_id,
-                                            "game_start_time_ms": gst,
-                                            "tracked": [],
-                                            "participants": info.get("participants") or [],
-                                        })
-                                        g["queue_id"] = queue_id
-                                        g["game_start_time_ms"] = min(int(g.get("game_start_time_ms") or gst), gst)
-
-                                        # Avoid duplicate tracked entries (in case of overlap)
-                                        existing_puuids = {t.get("puuid") for t in g["tracked"]}
-                                        if puuid not in existing_puuids:
-                                            # If the same Riot account is listed under multiple display names,
-                                            # include them all in the roster text.
-                                            # pick a single display name (first one)
-                                            dn = display_names[0]
-                                            g["tracked"].append({"name": dn, "puuid": puuid, "teamId": team_id})
-
-
-                                    except SpectateAPIError as e:
-                                        # Use one of the display names for logging (if available)
-                                        dn0 = (acct.get("display_names") or ["(unknown)"])[0]
-                                        print(f"[Predict] Riot error for {dn0}: {e}")
-                                        continue
-                                    except Exception as e:
-                                        dn0 = (acct.get("display_names") or ["(unknown)"])[0]
-                                        print(f"[Predict] Error checking {dn0}: {type(e).__name__}: {e}")
-                                        continue
-
-
-        except Exception as e:
-            print(f"[Predict] poll loop error: {e}")
-            return
-
-        # Create sessions for new games
-        for match_id, g in games.items():
-            if match_id in self._sessions:
+        self._recent_seen.prune()
+        for mid, old in list(self._sessions.items()):
+            if now - old.created_at_ms / 1000 > PREDICTION_RESULT_TIMEOUT_SECONDS + 3600:
+                print(f"[Predict] dropping stale session {mid}")
+                self._sessions.pop(mid, None)
+
+        tracked = []
+        for a in event.accounts:
+            acct = self._accounts.get(a["key"])
+            if not acct or event.queue_id not in acct["allowed_queues"]:
                 continue
-            if match_id in self._recent_seen:
+            if a["teamId"] not in (100, 200):
                 continue
+            # If the same Riot account is listed under multiple display names,
+            # pick a single display name (first one)
+            tracked.append({"name": acct["display_names"][0], "puuid": a["puuid"], "teamId": a["teamId"]})
+
+        g = {
+            "platform": event.platform,
+            "platform_id": event.platform_id,
+            "region": event.region,
+            "game_id": event.game_id,
+            "queue_id": event.queue_id,
+            "game_start_time_ms": event.game_start_time_ms,
+            "tracked": tracked,
+            "participants": event.participants,
+        }
+        await self._create_session(event.match_id, g, api_key)
 
-            tracked = g.get("tracked") or []
-            if not tracked:
-                continue
+    async def _create_session(self, match_id: str, g: dict, api_key: str):
+        if match_id in self._sessions:
+            return
+        if match_id in self._recent_seen:
+            return
 
-            # Determine display label
-            queue_id = int(g.get("queue_id") or 0)
-            title_line = ""
-            if queue_id == 440:
-                title_line = "Ranked Flex"
-            elif queue_id == 420:
-                # DuoQ if >=2 tracked on same team
-                by_team = {}
-                for t in tracked:
-                    by_team.setdefault(int(t.get("teamId") or 0), []).append(t)
-                duo_team = None
-                for tid, members in by_team.items():
-                    if tid in (100, 200) and len(members) >= 2:
-                        duo_team = tid
-                        break
-                if duo_team:
-                    title_line = "DuoQ (Ranked Solo/Duo)"
-                else:
-                    title_line = "SoloQ (Ranked Solo/Duo)"
+        tracked = g.get("tracked") or []
+        if not tracked:
+            return
+
+        # Determine display label
+        queue_id = int(g.get("queue_id") or 0)
+        title_line = ""
+        if queue_id == 440:
+            title_line = "Ranked Flex"
+        elif queue_id == 420:
+            # DuoQ if >=2 tracked on same team
+            by_team = {}
+            for t in tracked:
+                by_team.setdefault(int(t.get("teamId") or 0), []).append(t)
+            duo_team = None
+            for tid, members in by_team.items():
+                if tid in (100, 200) and len(members) >= 2:
+                    duo_team = tid
+                    break
+            if duo_team:
+                title_line = "DuoQ (Ranked Solo/Duo)"
             else:
-                continue
+                title_line = "SoloQ (Ranked Solo/Duo)"
+        else:
+            return
 
-            # Use the team of the first tracked member (for win/loss), unless SoloQ duo detected.
-            team_id = int(tracked[0].get("teamId") or 0)
-            if queue_id == 420:
-                # If duo detected, pin to that duo team
-                by_team = {}
-                for t in tracked:
-                    by_team.setdefault(int(t.get("teamId") or 0), []).append(t)
-                for tid, members in by_team.items():
-                    if tid in (100, 200) and len(members) >= 2:
-                        team_id = tid
-                        break
+        # Use the team of the first tracked member (for win/loss), unless SoloQ duo detected.
+        team_id = int(tracked[0].get("teamId") or 0)
+        if queue_id == 420:
+            # If duo detected, pin to that duo team
+            by_team = {}
+            for t in tracked:
+                by_team.setdefault(int(t.get("teamId") or 0), []).append(t)
+            for tid, members in by_team.items():
+                if tid in (100, 200) and len(members) >= 2:
+                    team_id = tid
+                    break
 
 
 
-            # Build matchup lines with enemy ranks (one-time per match)
+        # Build matchup lines from cached ranks only, so the poll posts right away;
+        # _fill_role_lines fetches the rest and edits them in.
 
-            role_lines = []
+        role_lines = []
 
-            try:
+        try:
 
-                async with aiohttp.ClientSession() as _http:
+            role_lines = await self._build_champ_role_lines(_riot_http.session, api_key, str(g.get('platform')), g.get('participants') or [], team_id, tracked=tracked, queue_id=queue_id, fetch_ranks=False, match_id=match_id)
 
-                    role_lines = await self._build_champ_role_lines(_http, api_key, str(g.get('platform')), g.get('participants') or [], team_id, tracked=tracked, queue_id=queue_id)
+        except Exception:
 
-            except Exception:
+            role_lines = []
 
-                role_lines = []
-
-            queue_cfg = self._get_queue_behavior(queue_id)
-            sess = PredictionSession(
-                match_id=match_id,
-                platform=str(g.get("platform")),
-                region=str(g.get("region")),
-                platform_id=str(g.get("platform_id")),
-                game_id=int(g.get("game_id")),
-                queue_id=queue_id,
-                title_line=title_line,
-                tracked=tracked,
-                team_id=team_id,
-                game_start_time_ms=int(g.get("game_start_time_ms")),
-                channel_id=int(queue_cfg.get('channel_id') or self._channel_id),
-                keep_message_until_game_end=bool(queue_cfg.get('keep_message_until_game_end') or False),
-                post_result_as_new_message=bool(queue_cfg.get('post_result_as_new_message') if "post_result_as_new_message" in queue_cfg else True),
-                delete_prediction_after_lock=bool(queue_cfg.get('delete_prediction_after_lock') if "delete_prediction_after_lock" in queue_cfg else True),
-                message_delete_after_game_seconds=int(queue_cfg.get('message_delete_after_game_seconds') or PREDICTION_RESULT_MESSAGE_DELETE_AFTER_SECONDS),
-                role_lines=role_lines,
-            )
-            self._sessions[match_id] = sess
-            self._recent_seen[match_id] = time.time()
+        queue_cfg = self._get_queue_behavior(queue_id)
+        sess = PredictionSession(
+            match_id=match_id,
+            platform=str(g.get("platform")),
+            region=str(g.get("region")),
+            platform_id=str(g.get("platform_id")),
+            game_id=int(g.get("game_id")),
+            queue_id=queue_id,
+            title_line=title_line,
+            tracked=tracked,
+            team_id=team_id,
+            game_start_time_ms=int(g.get("game_start_time_ms")),
+            channel_id=int(queue_cfg.get('channel_id') or self._channel_id),
+            keep_message_until_game_end=bool(queue_cfg.get('keep_message_until_game_end') or False),
+            post_result_as_new_message=bool(queue_cfg.get('post_result_as_new_message') if "post_result_as_new_message" in queue_cfg else True),
+            delete_prediction_after_lock=bool(queue_cfg.get('delete_prediction_after_lock') if "delete_prediction_after_lock" in queue_cfg else True),
+            message_delete_after_game_seconds=int(queue_cfg.get('message_delete_after_game_seconds') or PREDICTION_RESULT_MESSAGE_DELETE_AFTER_SECONDS),
+            role_lines=role_lines,
+            model_win_pct=_win_model.predict(g.get('participants') or [], team_id),
+        )
+        self._sessions[match_id] = sess
+        self._recent_seen.set(match_id, time.time(), ttl=2 * 3600)
+        self._journal.append("create", match_id, session=sess.to_record())
+
+        # Post poll
+        await self._post_prediction_message(sess)
+        asyncio.create_task(self._fill_role_lines(sess, g.get('participants') or [], api_key))
+
+    async def _fill_role_lines(self, sess: PredictionSession, participants: list[dict], api_key: str) -> None:
+        """Fetch roster ranks concurrently and edit them into the posted table as they land.
+        Stale cached ranks are already on the table; they're refetched here too."""
+        http = _riot_http.session
+        tracked_puuids = {t.get('puuid') for t in (sess.tracked or [])}
+        need = []
+        for p in participants:
+            pu = str(p.get('puuid') or '').strip()
+            if not pu or pu in tracked_puuids or self._cached_league_entries(pu, allow_stale=False) is not None:
+                continue
+            # Flex tables show summoner names (not ranks) for allies
+            if int(sess.queue_id or 0) == 440 and int(p.get('teamId') or 0) == int(sess.team_id or 0):
+                continue
+            need.append(pu)
+        if not need:
+            return
 
-            # Post poll
-            await self._post_prediction_message(sess)
+        async def rerender(fetch_ranks: bool) -> None:
+            lines = await self._build_champ_role_lines(http, api_key, sess.platform, participants, sess.team_id, tracked=sess.tracked, queue_id=sess.queue_id, fetch_ranks=fetch_ranks, match_id=sess.match_id)
+            if lines and lines != sess.role_lines and not sess.result_posted:
+                sess.role_lines = lines
+                self._request_message_edit(sess)
 
-    @prediction_poll_loop.before_loop
-    async def _before_prediction_poll_loop(self):
-        await self.bot.wait_until_ready()
+        try:
+            lookups = [asyncio.create_task(self._fetch_league_entries_by_puuid(http, api_key, sess.platform, pu, fresh=True)) for pu in need]
+            last_edit = time.time()
+            for fut in asyncio.as_completed(lookups):
+                await fut
+                if time.time() - last_edit >= PREDICTION_ROLE_FILL_EDIT_INTERVAL_SECONDS:
+                    last_edit = time.time()
+                    await rerender(fetch_ranks=False)
+            # Final pass: anything whose lookup failed is retried once and otherwise shown as (Anon).
+            await rerender(fetch_ranks=True)
+        except Exception as e:
+            print(f"[Predict] rank fill failed for {sess.match_id}: {type(e).__name__}: {e}")
 
     # -----------------------------
     # Slash command: /prediction_leaderboard
@@ -1581,36 +3868,49 @@ class PredictionCog(commands.Cog):
         return "\n".join(lines)
 
     @app_commands.command(name="prediction_leaderboard", description="View prediction leaderboard (+1 correct, -1 wrong).")
-    async def prediction_leaderboard(self, interaction: discord.Interaction):
-        data = _prediction_load_scores()
-        users = (data.get("users") or {})
-
-        rows = []
-        for uid, entry in users.items():
-            try:
-                correct = int(entry.get("correct", 0))
-                wrong = int(entry.get("wrong", 0))
-            except Exception:
-                correct, wrong = 0, 0
-            total = correct + wrong
-            if total <= 0:
-                continue
-            score = correct - wrong
-            acc = (correct / total) * 100.0 if total else 0.0
-            name = str(entry.get("name") or f"User-{uid}")
-            rows.append({"name": name, "score": score, "correct": correct, "wrong": wrong, "acc": acc})
+    @app_commands.describe(queue="Which queue's predictions to count", period="Only count predictions from this window")
+    @app_commands.choices(
+        queue=[
+            app_commands.Choice(name="All", value="all"),
+            app_commands.Choice(name="Flex", value="flex"),
+            app_commands.Choice(name="Solo/Duo", value="solo"),
+        ],
+        period=[
+            app_commands.Choice(name="All time", value="all"),
+            app_commands.Choice(name="Last 7 days", value="7d"),
+            app_commands.Choice(name="Last 30 days", value="30d"),
+        ],
+    )
+    async def prediction_leaderboard(self, interaction: discord.Interaction, queue: str = "all", period: str = "all"):
+        queue_id = {"flex": 440, "solo": 420}.get(queue)
+        days = {"7d": 7, "30d": 30}.get(period)
+        since_ts = int(time.time()) - days * 86400 if days else None
 
-        rows.sort(key=lambda r: (r["score"], r["acc"], r["correct"]), reverse=True)
+        rows = _prediction_ledger.leaderboard(25, queue_id=queue_id, since_ts=since_ts)
 
         if not rows:
             await interaction.response.send_message("No prediction history yet.", ephemeral=True)
             return
 
-        top = rows[:25]
         # IMPORTANT: send as a normal message (not an embed) so Discord doesn't wrap the table.
-        msg = self._format_prediction_leaderboard(top)
+        msg = self._format_prediction_leaderboard(rows)
         await interaction.response.send_message(msg)
 
+    @app_commands.command(name="prediction_train_model", description="Retrain the prediction win-chance model from stored matches.")
+    async def prediction_train_model(self, interaction: discord.Interaction):
+        await interaction.response.defer(thinking=True)
+        try:
+            report = await _win_model.train()
+        except Exception as e:
+            await interaction.followup.send(f"❌ Training failed: `{e}`")
+            return
+        weights = ", ".join(f"{k} {v:+.2f}" for k, v in report["weights"].items())
+        await interaction.followup.send(
+            f"Trained on **{report['games']}** stored games ({report['rows']} team rows).\n"
+            f"Held-out accuracy (newest 20%): **{report['holdout_accuracy'] * 100:.1f}%**\n"
+            f"Weights: `{weights}`"
+        )
+
 
 #$env:ENABLE_KEYSEQ_PRESS="1"
 
@@ -1661,9 +3961,6 @@ FLEX_PERSISTENT_MESSAGES_FILE = os.path.join(SCRIPT_DIR, "flex_persistent_messag
 JOSH_GUILD_ID = 753949534387961877
 JOSH_USER_ID = 187737483088232449
 
-# Josh's SoloQ is on NA1 (platform routing for summoner/league endpoints)
-JOSH_LOL_PLATFORM = "na1"
-
 # Persist last seen LP so restarts don't spam edits
 JOSH_SOLOQ_STATE_FILE = "josh_soloq_lp_state.json"
 
@@ -1676,7 +3973,43 @@ intents.message_content = True
 intents.members = True
 intents.guilds = True
 
-bot = commands.Bot(command_prefix='!!', intents=intents)
+# Optional: only spectator-poll players whose Discord presence shows League.
+# Needs the privileged presence intent enabled for the bot in the developer portal.
+PRESENCE_GATED_POLLING = os.getenv("PRESENCE_GATED_POLLING", "0").strip().lower() in ("1", "true", "yes")
+intents.presences = PRESENCE_GATED_POLLING
+
+
+class JeffBot(commands.Bot):
+    """commands.Bot that also owns the long-lived shared clients (Riot HTTP pool, OP.GG browser)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.riot_http = _riot_http
+        self.opgg_browser = _opgg_browser
+
+    async def close(self):
+        _timers.close()
+        _opgg_refresh.close()
+        prediction_cog = self.get_cog("PredictionCog")
+        if prediction_cog is not None:
+            prediction_cog._journal.close()
+        _match_store.close()
+        _reference_cache.close()
+        _prediction_ledger.close()
+        _opgg_cache_store.close()
+        try:
+            await self.riot_http.close()
+        except Exception as e:
+            print(f"[RiotHTTP] Error closing shared session: {type(e).__name__}: {e}")
+        try:
+            await _opgg_http.close()
+            await self.opgg_browser.close()
+        except Exception as e:
+            print(f"[OPGG][browser] Error closing Chromium: {type(e).__name__}: {e}")
+        await super().close()
+
+
+bot = JeffBot(command_prefix='!!', intents=intents)
 
 # A set to store message IDs to avoid duplicates
 collected_message_ids = set()
@@ -2086,18 +4419,6 @@ _spam_state = {"punished_until": {}, "recent": {}}  # punished_until: {str(user_
 
 JOSH_RIOT_GAME_NAME = "DrkCloak"
 JOSH_RIOT_TAG_LINE = "NA1"
-JOSH_ACCOUNT_ROUTING = "americas"  # for NA riot-id lookups
-
-async def _get_puuid_by_riot_id(session: aiohttp.ClientSession, api_key: str, game_name: str, tag_line: str) -> str:
-    url = (
-        f"https://{JOSH_ACCOUNT_ROUTING}.api.riotgames.com"
-        f"/riot/account/v1/accounts/by-riot-id/{quote(game_name)}/{quote(tag_line)}"
-    )
-    data = await _riot_get_json(session, url, api_key)
-    puuid = data.get("puuid")
-    if not puuid:
-        raise RuntimeError(f"[JoshLP] account-v1 missing puuid: {data}")
-    return puuid
 
 def _load_josh_soloq_state() -> dict:
     # shape: {"version": 1, "last_lp": int|None, "last_tier": str|None}
@@ -2124,44 +4445,35 @@ def _save_josh_soloq_state(last_lp: int | None, last_tier: str | None) -> None:
         print(f"[JoshLP] Error saving state: {e}")
 
 
-async def _get_josh_soloq_lp_and_tier(session: aiohttp.ClientSession, api_key: str) -> tuple[int | None, str | None]:
+def _josh_soloq_lp_and_tier(entry: dict | None) -> tuple[int | None, str | None]:
     """
-    Returns (lp, tier) for RANKED_SOLO_5x5, or (None, None) if no SoloQ entry.
+    Returns (lp, tier) for a RANKED_SOLO_5x5 league entry, or (None, None) if unranked.
     """
-    puuid = await _get_puuid_by_riot_id(session, api_key, JOSH_RIOT_GAME_NAME, JOSH_RIOT_TAG_LINE)
-
-    # IMPORTANT: quote the puuid to avoid URL issues
-    url = f"https://{JOSH_LOL_PLATFORM}.api.riotgames.com/lol/league/v4/entries/by-puuid/{quote(puuid, safe='')}"
-    entries = await _riot_get_json(session, url, api_key)
+    if not isinstance(entry, dict):
+        return None, None
 
-    if not isinstance(entries, list):
-        raise RuntimeError(f"[JoshLP] Unexpected league response: {entries}")
+    lp = entry.get("leaguePoints")
+    tier = entry.get("tier")
+    rank = entry.get("rank")
+    if rank == "I":
+        rank = "1"
+    if rank == "II":
+        rank = "2"
+    if rank == "III":
+        rank = "3"
+    if rank == "IV":
+        rank = "4"
+
+    if tier == "DIAMOND" or tier == "EMERALD":
+        tier = tier[:1] + f"{rank}"
 
-    for e in entries:
-        if isinstance(e, dict) and e.get("queueType") == "RANKED_SOLO_5x5":
-            lp = e.get("leaguePoints")
-            tier = e.get("tier")
-            rank = e.get("rank")
-            if rank == "I":
-                rank = "1"
-            if rank == "II":
-                rank = "2"
-            if rank == "III":
-                rank = "3"
-            if rank == "IV":
-                rank = "4"
-
-            if tier == "DIAMOND" or tier == "EMERALD":
-                tier = tier[:1] + f"{rank}"
-            
-            try:
-                lp = int(lp)
-            except Exception:
-                lp = None
-            tier = str(tier).upper() if tier else None
-            return lp, tier
+    try:
+        lp = int(lp)
+    except Exception:
+        lp = None
+    tier = str(tier).upper() if tier else None
+    return lp, tier
 
-    return None, None
 
 
 
@@ -2345,15 +4657,20 @@ def normalize_visible_ats(text: str) -> str:
     return text
 
 
-async def _riot_get_json(session: aiohttp.ClientSession, url: str, api_key: str) -> dict:
+class RiotAPIError(RuntimeError):
+    """Non-200 from Riot via _riot_get_json; .status is the HTTP status."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = int(status)
+
+
+async def _riot_get_json(session: aiohttp.ClientSession, url: str, api_key: str, *, priority: int | None = None) -> dict:
     """Tiny helper that does a Riot GET with basic error handling."""
-    headers = {"X-Riot-Token": api_key}
-    _ssl = ssl.create_default_context(cafile=certifi.where())
-    async with session.get(url, headers=headers, ssl=_ssl) as resp:
-        if resp.status != 200:
-            text = await resp.text()
-            raise RuntimeError(f"Riot API error {resp.status} for {url}: {text[:200]}")
-        return await resp.json()
+    status, payload = await _riot_request(session, url, api_key, priority=priority)
+    if status != 200:
+        raise RiotAPIError(status, f"Riot API error {status} for {url}: {str(payload)[:200]}")
+    return payload
     
 def _detroit_day_str_from_utc(dt_utc: datetime) -> str:
     # dt_utc should be aware UTC
@@ -2940,7 +5257,66 @@ def _opgg_compute_kda_ratio_from_stats(stats: dict) -> float | None:
 
 
 
-async def _fetch_opgg_flex_matches_from_url(context, opgg_url: str) -> list[dict]:
+# ---------- OP.GG direct RSC fetch ----------
+# The match list arrives as one React Server Components response (text/x-component).
+# When the browser path sees it, the request that produced it (url, method, RSC/router
+# headers, body) is remembered per profile as a "recipe"; later refreshes replay that
+# request over plain HTTP and only fall back to a browser page if the reply stops
+# looking like a match-list payload.
+
+OPGG_RSC_DIRECT = os.getenv("OPGG_RSC_DIRECT", "1").strip().lower() not in ("0", "false", "no")
+OPGG_RSC_RECIPE_TTL_SECONDS = 14 * 24 * 3600
+# Browser path: give up on a profile if the match-list payload hasn't arrived by then
+OPGG_PAYLOAD_TIMEOUT_SECONDS = 25
+# Cap on one profile's browser scrape, counted from page checkout (not from when it
+# started waiting for a pooled page); backfills get OPGG_PAYLOAD_TIMEOUT_SECONDS more per page.
+OPGG_BROWSER_SCRAPE_TIMEOUT_SECONDS = 60
+# opgg_url -> {path, direct_s, browser_s, page_wait_s, payload_s, rows, total_s, at} for the latest fetch
+_OPGG_FETCH_TIMINGS: dict[str, dict] = {}
+# Request headers worth replaying (cookies/UA come from the HTTP client itself)
+_OPGG_RSC_REPLAY_HEADERS = ("accept", "content-type", "rsc", "next-action", "next-router-state-tree", "next-url", "referer")
+
+_opgg_http = SharedHTTPClient(
+    limit_per_host=4,
+    headers={
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+        "Accept-Language": "en-US,en;q=0.9",
+    },
+)
+
+
+def _opgg_rsc_is_match_list(ctype: str, body: str) -> bool:
+    # The real payload is large and contains a "1:" JSON line (the tiny 53/215/693 ones are fragments)
+    return "text/x-component" in (ctype or "").lower() and len(body or "") > 50_000 and "\n1:" in body
+
+
+async def _opgg_fetch_rsc_direct(opgg_url: str, stop_at: tuple | None = None) -> list[dict] | None:
+    """Match rows via a plain HTTP RSC request; None means use the browser instead."""
+    recipe = _reference_cache.get(f"opgg:rsc:{opgg_url}")
+    if not isinstance(recipe, dict):
+        # Until the browser has shown us the real request, try a plain RSC navigation fetch.
+        recipe = {"method": "GET", "url": opgg_url, "headers": {"RSC": "1", "Accept": "text/x-component"}, "body": None}
+    # Same cache-bust query param the browser path adds, refreshed for this request.
+    url = re.sub(r"([?&])t=\d+", lambda m: f"{m.group(1)}t={int(time.time())}", str(recipe.get("url") or opgg_url))
+    try:
+        async with _opgg_http.session.request(
+            str(recipe.get("method") or "GET"),
+            url,
+            headers=dict(recipe.get("headers") or {}),
+            data=recipe.get("body"),
+        ) as resp:
+            ctype = resp.headers.get("Content-Type") or ""
+            body = await resp.text()
+            if resp.status != 200 or not _opgg_rsc_is_match_list(ctype, body):
+                return None
+        # A parse error means the payload shape moved; the browser path re-learns it.
+        return _opgg_matches_from_rsc_body(body, stop_at)
+    except Exception as e:
+        print(f"[OPGG] direct RSC fetch failed for {opgg_url}: {type(e).__name__}: {e}")
+        return None
+
+
+async def _fetch_opgg_flex_matches_from_url(opgg_url: str, *, stop_at: tuple | None = None, more_pages: int = 0) -> list[dict] | None:
     """
     Returns: [{
         "match_id": str,
@@ -2949,12 +5325,50 @@ async def _fetch_opgg_flex_matches_from_url(context, opgg_url: str) -> list[dict
         "kda_ratio": float|None,
         "laning_score": float|None,
     }, ...]
-    Grabs the first *large* RSC payload and returns immediately (no long scroll loops).
-    """
-    page = await context.new_page()
+    Tries the direct RSC request first and falls back to a pooled browser page.
+    Timing for each profile's last fetch lands in _OPGG_FETCH_TIMINGS.
 
+    [] means OP.GG answered and there is nothing new; None means we got no usable
+    match list at all (no payload, navigation error, unparseable payload).
+
+    Only the newest page is requested; stop_at (newest cached match) trims it to new
+    games. more_pages > 0 is the backfill mode: a browser page clicks "Show more" that
+    many times and returns everything it loaded.
+    """
+    t0 = time.perf_counter()
+    timing = {"path": "direct", "direct_s": None, "browser_s": None, "rows": 0, "at": datetime.now(timezone.utc).isoformat()}
+    rows = None
+    if OPGG_RSC_DIRECT and not more_pages:
+        rows = await _opgg_fetch_rsc_direct(opgg_url, stop_at)
+        timing["direct_s"] = round(time.perf_counter() - t0, 3)
+    if rows is None:
+        t1 = time.perf_counter()
+        timing["path"] = "browser"
+        rows = await _fetch_opgg_flex_matches_via_browser(opgg_url, timing, stop_at=stop_at, more_pages=more_pages)
+        timing["browser_s"] = round(time.perf_counter() - t1, 3)
+    if rows is None:
+        timing["path"] += ":failed"
+    timing["rows"] = len(rows or [])
+    timing["total_s"] = round(time.perf_counter() - t0, 3)
+    _OPGG_FETCH_TIMINGS[opgg_url] = timing
+    return rows
+
+
+async def _fetch_opgg_flex_matches_via_browser(
+    opgg_url: str, timing: dict | None = None, *, stop_at: tuple | None = None, more_pages: int = 0
+) -> list[dict] | None:
+    """
+    Grabs the first *large* RSC payload and returns immediately (no long scroll loops),
+    unless more_pages asks for a backfill (see _opgg_load_more_pages).
+    Runs on a page checked out of the shared headless browser pool, and remembers the
+    request that produced the payload for _opgg_fetch_rsc_direct. The scrape timeout
+    starts once the page is ours, so profiles queued behind a busy pool don't burn it.
+    None if no match-list payload arrived or it couldn't be parsed.
+    """
     best_body: str | None = None
     got_payload = asyncio.Event()
+    older_pages: list = []
+    got_page = asyncio.Event()
 
     async def on_response(resp):
         nonlocal best_body
@@ -2962,6 +5376,13 @@ async def _fetch_opgg_flex_matches_from_url(context, opgg_url: str) -> list[dict
             if "op.gg" not in (resp.url or ""):
                 return
             ctype = (resp.headers.get("content-type") or "").lower()
+            if more_pages and best_body and "json" in ctype:
+                # "Show more" pages come back as plain JSON match lists.
+                payload = await resp.json()
+                if isinstance(payload, dict) and isinstance(payload.get("data"), list):
+                    older_pages.append(payload)
+                    got_page.set()
+                return
             if "text/x-component" not in ctype:
                 return
             body = await resp.text()
@@ -2972,62 +5393,130 @@ async def _fetch_opgg_flex_matches_from_url(context, opgg_url: str) -> list[dict
 
             # Heuristic: the real payload is large and contains a "1:" JSON line
             # (the tiny 53/215/693 ones are fragments)
-            if len(body) > 50_000 and "\n1:" in body:
+            if _opgg_rsc_is_match_list(ctype, body):
                 # keep the biggest one we’ve seen
                 if best_body is None or len(body) > len(best_body):
                     best_body = body
+                    req = resp.request
+                    req_headers = await req.all_headers()
+                    _reference_cache.set(
+                        f"opgg:rsc:{opgg_url}",
+                        {
+                            "method": req.method,
+                            "url": req.url,
+                            "headers": {k: v for k, v in req_headers.items() if k.lower() in _OPGG_RSC_REPLAY_HEADERS},
+                            "body": req.post_data,
+                        },
+                        ttl=OPGG_RSC_RECIPE_TTL_SECONDS,
+                    )
                 got_payload.set()
         except Exception:
             pass
 
-    page.on("response", on_response)
+    async def scrape(page) -> None:
+        t1 = time.perf_counter()
+        await _opgg_wait_for_payload(page, opgg_url, got_payload)
+        timing["payload_s"] = round(time.perf_counter() - t1, 3)
+        if more_pages:
+            await _opgg_load_more_pages(page, more_pages, got_page)
+
+    timing = timing if timing is not None else {}
+    t0 = time.perf_counter()
+    async with _opgg_browser.page() as page:
+        timing["page_wait_s"] = round(time.perf_counter() - t0, 3)
+        page.on("response", on_response)
+        try:
+            await asyncio.wait_for(
+                scrape(page),
+                timeout=OPGG_BROWSER_SCRAPE_TIMEOUT_SECONDS + more_pages * OPGG_PAYLOAD_TIMEOUT_SECONDS,
+            )
+        except Exception as e:
+            # If we never got a big payload, bail cleanly
+            # (This prevents your gather wrapper from swallowing everything.)
+            if not best_body:
+                print(f"[OPGG] no match-list payload for {opgg_url}: {type(e).__name__}: {e}")
+                return None
+        finally:
+            page.remove_listener("response", on_response)
 
+    if not best_body:
+        return None
     try:
-        cache_bust = int(time.time())
-        sep = "&" if "?" in opgg_url else "?"
-        url = f"{opgg_url}{sep}t={cache_bust}"
-        await page.goto(url, wait_until="domcontentloaded", timeout=60_000)
+        rows = _opgg_matches_from_rsc_body(best_body, stop_at)
+    except ValueError as e:
+        print(f"[OPGG] unparseable match-list payload for {opgg_url}: {e}")
+        return None
+    seen = {r["match_id"] for r in rows}
+    for payload in older_pages:
+        try:
+            rows.extend(r for r in _opgg_matches_from_payload(payload) if r["match_id"] not in seen)
+        except ValueError:
+            continue
+        seen = {r["match_id"] for r in rows}
+    return rows
+
 
-        # Give the page time to kick off its RSC requests.
-        # OP.GG can be slow / bursty; a slightly longer settle helps a lot.
+async def _opgg_load_more_pages(page, pages: int, got_page: asyncio.Event) -> None:
+    """Backfill only: click OP.GG's "Show more" up to `pages` times, waiting for each page."""
+    button = page.get_by_role("button", name=re.compile(r"show\s*more", re.I)).first
+    for _ in range(int(pages)):
+        got_page.clear()
         try:
-            await page.wait_for_load_state("networkidle", timeout=20_000)
+            await button.click(timeout=10_000)
+            await asyncio.wait_for(got_page.wait(), timeout=OPGG_PAYLOAD_TIMEOUT_SECONDS)
         except Exception:
-            # networkidle isn't always achievable on SPAs; that's fine.
-            pass
+            break  # no more pages (button gone) or OP.GG stopped answering
 
-        await page.wait_for_timeout(1500)
 
-        # Wait up to 25s for the big payload
-        await asyncio.wait_for(got_payload.wait(), timeout=40)
+async def _opgg_wait_for_payload(page, opgg_url: str, got_payload: asyncio.Event) -> None:
+    """Navigate and return the moment the match-list RSC response has been read
+    (no networkidle / settle sleeps). Raises on navigation failure or timeout."""
+    cache_bust = int(time.time())
+    sep = "&" if "?" in opgg_url else "?"
+    url = f"{opgg_url}{sep}t={cache_bust}"
 
-    except Exception as e:
-        # If we never got a big payload, bail cleanly
-        # (This prevents your gather wrapper from swallowing everything.)
-        return []
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + OPGG_PAYLOAD_TIMEOUT_SECONDS
+    nav = asyncio.create_task(page.goto(url, wait_until="commit", timeout=OPGG_PAYLOAD_TIMEOUT_SECONDS * 1000))
+    nav.add_done_callback(lambda t: t.cancelled() or t.exception())
+    waiter = asyncio.create_task(got_payload.wait())
+    try:
+        done, _pending = await asyncio.wait({nav, waiter}, timeout=OPGG_PAYLOAD_TIMEOUT_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+        if waiter in done:
+            return
+        if nav in done and nav.exception() is not None:
+            raise nav.exception()
+        await asyncio.wait_for(waiter, timeout=max(0.0, deadline - loop.time()))
     finally:
-        try:
-            await page.close()
-        except Exception:
-            pass
+        for t in (nav, waiter):
+            if not t.done():
+                t.cancel()
+
+
+def _opgg_matches_from_rsc_body(body: str, stop_at: tuple | None = None) -> list[dict]:
+    """Parse a match-list RSC response into the rows _fetch_opgg_flex_matches_from_url returns."""
+    return _opgg_matches_from_payload(_parse_opgg_rsc_payload(body), stop_at)
 
-    if not best_body:
-        return []
 
-    # Parse the biggest captured payload
-    payload = _parse_opgg_rsc_payload(best_body)
+def _opgg_matches_from_payload(payload, stop_at: tuple | None = None) -> list[dict]:
+    """Rows from a parsed match-list payload (RSC "1:" line or the JSON "show more" pages).
 
+    stop_at=(match_id, created_at) is the newest match already cached: the list is newest
+    first, so parsing stops there. Raises ValueError if the payload isn't a match list.
+    """
     # OP.GG sometimes returns dict {"data":[...]} and sometimes returns the list directly.
     if isinstance(payload, dict):
         data = payload.get("data")
     elif isinstance(payload, list):
         data = payload
     else:
-        return []
+        data = None
 
     if not isinstance(data, list):
-        return []
+        raise ValueError("OP.GG payload is not a match list")
 
+    stop_id, stop_dt = stop_at or (None, None)
+    stop_dt = _coerce_dt_to_utc(stop_dt) if isinstance(stop_dt, datetime) else None
 
     out: list[dict] = []
     for m in data:
@@ -3047,6 +5536,10 @@ async def _fetch_opgg_flex_matches_from_url(context, opgg_url: str) -> list[dict
             except Exception:
                 created_dt = None
 
+        # Reached data we already have: everything after this is older.
+        if match_id == stop_id or (stop_dt and created_dt and _coerce_dt_to_utc(created_dt) <= stop_dt):
+            break
+
         me = _find_me_in_opgg_match(m)
         op_score = None
         kda_ratio = None
@@ -3105,10 +5598,129 @@ async def _fetch_opgg_flex_matches_from_url(context, opgg_url: str) -> list[dict
 # OP.GG Flex persistent cache
 # =========================
 
+# Legacy JSON cache; only read once, to seed the SQLite store.
 FLEX_OPGG_CACHE_FILE = os.path.join(os.path.dirname(__file__), "opgg_flex_cache.json")
+FLEX_OPGG_CACHE_DB = os.getenv(
+    "FLEX_OPGG_CACHE_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "opgg_flex_cache.sqlite3"),
+)
 
+# Working copy: {"updated_at", "refreshed_at", "profiles": {name: {match_id: row}}, "meta": {...}}
 _OPGG_FLEX_CACHE: dict | None = None
-_OPGG_FLEX_CACHE_LAST_REFRESH_UTC: datetime | None = None
+# (player, match_id) rows changed in memory since the last flush
+_OPGG_FLEX_CACHE_DIRTY: set[tuple[str, str]] = set()
+
+
+class OPGGFlexCacheStore:
+    """SQLite backing for the OP.GG flex cache: one row per (player, match) plus a small
+    header table (timestamps, per-profile refresh meta as JSON).
+
+    The bot works on the in-memory dict from load(); write() persists only the rows a
+    refresh touched, in a single transaction, and is meant to run in a worker thread.
+    """
+
+    _HEADER_KEYS = ("updated_at", "refreshed_at", "meta")
+
+    def __init__(self, path: str, legacy_json: str | None = None):
+        self._path = path
+        self._legacy_json = legacy_json
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self._path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS matches (
+                    player       TEXT NOT NULL,
+                    match_id     TEXT NOT NULL,
+                    created_at   TEXT,
+                    op_score     REAL,
+                    kda_ratio    REAL,
+                    laning_score REAL,
+                    PRIMARY KEY (player, match_id)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS header (key TEXT PRIMARY KEY, value TEXT);
+                """
+            )
+            self._conn = conn
+            self._migrate_json()
+        return self._conn
+
+    def _migrate_json(self) -> None:
+        db = self._conn
+        if db.execute("SELECT 1 FROM header WHERE key = 'migrated_json'").fetchone():
+            return
+        raw: dict = {}
+        try:
+            if self._legacy_json and os.path.exists(self._legacy_json):
+                with open(self._legacy_json, "r", encoding="utf-8") as f:
+                    raw = json.load(f) or {}
+        except Exception as e:
+            print(f"[OPGG][cache] could not read {self._legacy_json}: {type(e).__name__}: {e}")
+        rows = [
+            (name, mid, payload)
+            for name, bucket in (raw.get("profiles") or {}).items()
+            for mid, payload in (bucket or {}).items()
+            if isinstance(payload, dict)
+        ]
+        self._write(db, rows, {k: raw.get(k) for k in self._HEADER_KEYS})
+        with db:
+            db.execute("INSERT OR REPLACE INTO header VALUES ('migrated_json', ?)", (str(int(time.time())),))
+        if rows:
+            print(f"[OPGG][cache] imported {len(rows)} cached match(es) from {self._legacy_json}")
+
+    @staticmethod
+    def _write(db: sqlite3.Connection, rows: list[tuple[str, str, dict]], header: dict) -> None:
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (name, mid, p.get("created_at"), p.get("op_score"), p.get("kda_ratio"), p.get("laning_score"))
+                    for name, mid, p in rows
+                ],
+            )
+            db.executemany(
+                "INSERT OR REPLACE INTO header VALUES (?, ?)",
+                [(k, json.dumps(v, default=str)) for k, v in header.items()],
+            )
+
+    def load(self) -> dict:
+        with self._lock:
+            db = self._db()
+            cache = {"version": 1, "updated_at": None, "refreshed_at": None, "profiles": {}, "meta": {}}
+            for key, value in db.execute("SELECT key, value FROM header"):
+                if key in self._HEADER_KEYS:
+                    try:
+                        cache[key] = json.loads(value) if value else None
+                    except Exception:
+                        pass
+            cache["meta"] = cache.get("meta") or {}
+            profiles = cache["profiles"]
+            for name, mid, created, op_score, kda, laning in db.execute("SELECT * FROM matches"):
+                profiles.setdefault(name, {})[mid] = {
+                    "match_id": mid,
+                    "created_at": created,
+                    "op_score": op_score,
+                    "kda_ratio": kda,
+                    "laning_score": laning,
+                }
+            return cache
+
+    def write(self, rows: list[tuple[str, str, dict]], header: dict) -> None:
+        with self._lock:
+            self._write(self._db(), rows, header)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_opgg_cache_store = OPGGFlexCacheStore(FLEX_OPGG_CACHE_DB, legacy_json=FLEX_OPGG_CACHE_FILE)
 
 # Timezone helpers (keep internal math in UTC; interpret naive datetimes as America/Detroit for safety)
 def _get_detroit_tz():
@@ -3405,40 +6017,47 @@ def _coerce_dt_to_utc(dt: datetime) -> datetime:
 
 
 def _load_opgg_flex_cache() -> dict:
-    """Load cache from disk (best effort)."""
+    """Load the cache into memory once (SQLite; imports the old JSON file the first time)."""
     global _OPGG_FLEX_CACHE
     if _OPGG_FLEX_CACHE is not None:
         return _OPGG_FLEX_CACHE
 
-    base = {"version": 1, "updated_at": None, "profiles": {}}
     try:
-        if os.path.exists(FLEX_OPGG_CACHE_FILE):
-            with open(FLEX_OPGG_CACHE_FILE, "r", encoding="utf-8") as f:
-                raw = json.load(f) or {}
-            # normalize structure
-            profiles = raw.get("profiles") or {}
-            base["profiles"] = profiles
-            base["updated_at"] = raw.get("updated_at")
+        _OPGG_FLEX_CACHE = _opgg_cache_store.load()
     except Exception as e:
         print(f"[OPGG][cache] failed to load cache: {type(e).__name__}: {e}")
-
-    _OPGG_FLEX_CACHE = base
+        _OPGG_FLEX_CACHE = {"version": 1, "updated_at": None, "refreshed_at": None, "profiles": {}, "meta": {}}
     return _OPGG_FLEX_CACHE
 
 
-def _save_opgg_flex_cache(cache: dict) -> None:
-    """Persist cache to disk (best effort)."""
+async def _flush_opgg_flex_cache() -> None:
+    """Persist everything upserted since the last flush in one transaction, off the event
+    loop (best effort; rows stay dirty and go out with the next flush on failure)."""
+    cache = _load_opgg_flex_cache()
+    dirty = list(_OPGG_FLEX_CACHE_DIRTY)
+    _OPGG_FLEX_CACHE_DIRTY.clear()
+    profiles = cache.get("profiles") or {}
+    rows = [
+        (name, mid, dict(profiles[name][mid]))
+        for name, mid in dirty
+        if isinstance((profiles.get(name) or {}).get(mid), dict)
+    ]
+    header = {
+        "updated_at": cache.get("updated_at"),
+        "refreshed_at": cache.get("refreshed_at"),
+        "meta": copy.deepcopy(cache.get("meta") or {}),
+    }
     try:
-        tmp_path = FLEX_OPGG_CACHE_FILE + ".tmp"
-        with open(tmp_path, "w", encoding="utf-8") as f:
-            json.dump(cache, f, ensure_ascii=False, indent=2, default=str)
-        os.replace(tmp_path, FLEX_OPGG_CACHE_FILE)
+        await asyncio.to_thread(_opgg_cache_store.write, rows, header)
     except Exception as e:
+        _OPGG_FLEX_CACHE_DIRTY.update(dirty)
         print(f"[OPGG][cache] failed to save cache: {type(e).__name__}: {e}")
 
 
 def _cache_upsert_matches(player_name: str, matches: list[dict]) -> int:
-    """Insert new matches into cache for a player. Returns count inserted."""
+    """Insert new matches into the in-memory cache for a player. Returns count inserted.
+
+    Nothing is written here; call _flush_opgg_flex_cache once the whole batch is in."""
     cache = _load_opgg_flex_cache()
     profiles = cache.setdefault("profiles", {})
     player_bucket = profiles.setdefault(player_name, {})  # match_id -> payload
@@ -3454,14 +6073,18 @@ def _cache_upsert_matches(player_name: str, matches: list[dict]) -> int:
             existing = player_bucket.get(match_id)
             if isinstance(existing, dict):
                 # Prefer new values when the existing entry is missing them (None / key absent).
+                before = dict(existing)
                 if existing.get("created_at") in (None, "") and m.get("created_at") is not None:
-                    existing["created_at"] = m.get("created_at")
+                    created = m.get("created_at")
+                    existing["created_at"] = created.isoformat() if isinstance(created, datetime) else created
                 if existing.get("op_score") is None and m.get("op_score") is not None:
                     existing["op_score"] = m.get("op_score")
                 if existing.get("kda_ratio") is None and m.get("kda_ratio") is not None:
                     existing["kda_ratio"] = m.get("kda_ratio")
                 if existing.get("laning_score") is None and m.get("laning_score") is not None:
                     existing["laning_score"] = m.get("laning_score")
+                if existing != before:
+                    _OPGG_FLEX_CACHE_DIRTY.add((player_name, match_id))
             continue
 
         created = m.get("created_at")
@@ -3479,10 +6102,10 @@ def _cache_upsert_matches(player_name: str, matches: list[dict]) -> int:
             "kda_ratio": m.get("kda_ratio"),
             "laning_score": m.get("laning_score"),
         }
+        _OPGG_FLEX_CACHE_DIRTY.add((player_name, match_id))
         inserted += 1
 
     cache["updated_at"] = datetime.now(timezone.utc).isoformat()
-    _save_opgg_flex_cache(cache)
     return inserted
 
 
@@ -3499,107 +6122,466 @@ def _iter_cached_matches(player_name: str) -> list[dict]:
             except Exception:
                 created_dt = None
 
-        out.append(
-            {
-                "match_id": payload.get("match_id") or match_id,
-                "created_at": created_dt,
-                "op_score": payload.get("op_score"),
-                "kda_ratio": payload.get("kda_ratio"),
-                "laning_score": payload.get("laning_score"),
-            }
-        )
-    return out
+        out.append(
+            {
+                "match_id": payload.get("match_id") or match_id,
+                "created_at": created_dt,
+                "op_score": payload.get("op_score"),
+                "kda_ratio": payload.get("kda_ratio"),
+                "laning_score": payload.get("laning_score"),
+            }
+        )
+    return out
+
+
+def _opgg_profile_watermark(player_name: str) -> tuple[str | None, datetime | None]:
+    """(match_id, created_at) of the newest cached match for a player."""
+    newest = None
+    for m in _iter_cached_matches(player_name):
+        created = m.get("created_at")
+        if isinstance(created, datetime) and (newest is None or _coerce_dt_to_utc(created) > _coerce_dt_to_utc(newest["created_at"])):
+            newest = m
+    return (newest["match_id"], newest["created_at"]) if newest else (None, None)
+
+
+async def _opgg_riot_newest_flex(puuid: str | None) -> tuple[str, datetime | None] | None:
+    """Newest Flex match id (+ creation time) from Riot: the cheap "anything new?" check
+    before an OP.GG scrape. None if Riot can't tell us."""
+    api_key = os.getenv("RIOT_API_KEY")
+    if not api_key or not puuid:
+        return None
+    try:
+        session = _riot_http.session
+        ids = await _match_store.recent_ids(session, api_key, RIOT_ROUTING_REGION, puuid, 1, priority=RIOT_PRIORITY_BACKFILL, queue=440)
+        if not ids:
+            return None
+        status, payload = await _match_store.fetch(session, api_key, RIOT_ROUTING_REGION, ids[0], priority=RIOT_PRIORITY_BACKFILL)
+        created_ms = int(((payload or {}).get("info") or {}).get("gameCreation") or 0) if status == 200 else 0
+        return ids[0], (datetime.fromtimestamp(created_ms / 1000, tz=timezone.utc) if created_ms else None)
+    except Exception as e:
+        print(f"[OPGG][cache] Riot newest-match check failed: {type(e).__name__}: {e}")
+        return None
+
+
+async def refresh_opgg_flex_cache_best_effort(reason: str = "manual") -> dict:
+    """
+    Refresh the local OP.GG flex cache by scraping the most recent FLEXRANKED matches
+    for each tracked profile prove.
+
+    Incremental: a profile whose newest Riot Flex match hasn't changed since its last
+    confirmed scrape is skipped outright, and otherwise only the newest page is parsed,
+    up to the newest match already cached. Deep history is backfill_opgg_flex_cache's job.
+
+    Best-effort: a failure for one profile won't fail the whole refresh.
+
+    Call it through _opgg_refresh (the coordinator), which decides when a refresh is due
+    and lets concurrent callers share one.
+
+    Args:
+        reason: log tag
+
+    Returns:
+        {"total_inserted": int, "inserted_by_name": {name: int}, "timings": {name: timing dict},
+         "fetched": profiles scraped or confirmed unchanged (0 = OP.GG/Riot gave us nothing)}
+    """
+    async with _opgg_refresh_lock:
+        _load_opgg_flex_cache()
+
+        if not DPM_FLEX_PROFILES:
+            return {"total_inserted": 0, "inserted_by_name": {}}
+
+        total_inserted = 0
+        inserted_by_name: dict[str, int] = {}
+
+        meta = _OPGG_FLEX_CACHE.setdefault("meta", {})
+
+        # Pages come from the shared headless browser pool (no per-refresh Chromium launch).
+        async def fetch_one(name: str, opgg_url: str, puuid: str | None) -> tuple[str, list[dict] | None, tuple | None]:
+            t0 = time.perf_counter()
+            riot_newest = await _opgg_riot_newest_flex(puuid)
+            stop_at = _opgg_profile_watermark(name)
+            if riot_newest and stop_at[0] and (meta.get(name) or {}).get("riot_newest") == riot_newest[0]:
+                _OPGG_FETCH_TIMINGS[opgg_url] = {
+                    "path": "unchanged", "rows": 0, "total_s": round(time.perf_counter() - t0, 3),
+                    "at": datetime.now(timezone.utc).isoformat(),
+                }
+                return name, [], None
+            try:
+                # Bounded inside: the direct request by the HTTP client, the browser
+                # scrape from page checkout (OPGG_BROWSER_SCRAPE_TIMEOUT_SECONDS).
+                ms = await _fetch_opgg_flex_matches_from_url(opgg_url, stop_at=stop_at)
+                return name, ms, riot_newest
+            except Exception as e:
+                print(f"[OPGG][cache] scrape failed for {name}: {type(e).__name__}: {e}")
+                return name, None, None
+
+        tasks = []
+        for name, prof in DPM_FLEX_PROFILES.items():
+            opgg_url = prof.get("opgg_url")
+            if not opgg_url:
+                inserted_by_name[name] = 0
+                continue
+            tasks.append(fetch_one(name, opgg_url, prof.get("puuid")))
+
+        results = await asyncio.gather(*tasks, return_exceptions=False)
+
+        # Profiles we actually heard from (scraped, or confirmed unchanged via Riot)
+        fetched = sum(1 for _name, ms, _riot in results if ms is not None)
+
+        for name, ms, riot_newest in results:
+            if ms:
+                inserted = _cache_upsert_matches(name, ms)
+                inserted_by_name[name] = inserted
+                total_inserted += inserted
+            else:
+                inserted_by_name[name] = 0
+            # Only skip this profile next time once OP.GG has caught up with Riot's newest game
+            # (OP.GG can lag a few minutes behind the end of a match).
+            if riot_newest and riot_newest[1]:
+                _wm_id, wm_created = _opgg_profile_watermark(name)
+                if wm_created and _coerce_dt_to_utc(wm_created) >= riot_newest[1] - timedelta(minutes=5):
+                    meta.setdefault(name, {})["riot_newest"] = riot_newest[0]
+
+        timings = {
+            name: _OPGG_FETCH_TIMINGS.get(prof.get("opgg_url"))
+            for name, prof in DPM_FLEX_PROFILES.items()
+            if prof.get("opgg_url") in _OPGG_FETCH_TIMINGS
+        }
+        if timings:
+            per_profile = ", ".join(
+                f"{name}={t.get('total_s')}s/{t.get('path')}" for name, t in sorted(timings.items(), key=lambda kv: -(kv[1].get("total_s") or 0))
+            )
+            print(f"[OPGG][cache] fetch timings (slowest first): {per_profile}")
+
+        # One write per refresh. refreshed_at (what freshness SLAs are measured against) only
+        # moves when OP.GG answered for someone, so an outage doesn't look fresh.
+        if fetched:
+            _OPGG_FLEX_CACHE["refreshed_at"] = datetime.now(timezone.utc).isoformat()
+        else:
+            print(f"[OPGG][cache] refresh got nothing from any profile (reason={reason})")
+        await _flush_opgg_flex_cache()
+
+        print(f"[OPGG][cache] refresh done: inserted={total_inserted} reason={reason}")
+        return {"total_inserted": total_inserted, "inserted_by_name": inserted_by_name, "timings": timings, "fetched": fetched}
+
+
+# Deep backfills are slow (a browser page per profile, clicking "Show more"); keep one
+# profile's scrape short enough that refreshes queued on the lock aren't starved.
+OPGG_BACKFILL_MAX_PAGES = 20
+
+_opgg_backfill_task: asyncio.Task | None = None
+
 
+async def backfill_opgg_flex_cache(pages: int = 10) -> dict:
+    """Deliberate deep scrape: for every profile, load `pages` extra "Show more" pages in a
+    browser and merge everything (also fills fields missing from older cache entries).
 
-async def refresh_opgg_flex_cache_best_effort(reason: str = "manual", *, force: bool = False) -> dict:
+    Profiles go one at a time, each holding the refresh lock only for its own scrape, so
+    coordinator refreshes can run in between.
+
+    Returns:
+        {"total_inserted": int, "inserted_by_name": {name: int}}
     """
-    Refresh the local OP.GG flex cache by scraping the most recent FLEXRANKED matches
-    for each tracked profile prove.
+    pages = max(1, min(int(pages), OPGG_BACKFILL_MAX_PAGES))
+    inserted_by_name: dict[str, int] = {}
+    for name, prof in list(DPM_FLEX_PROFILES.items()):
+        opgg_url = prof.get("opgg_url")
+        if not opgg_url:
+            continue
+        async with _opgg_refresh_lock:
+            _load_opgg_flex_cache()
+            try:
+                ms = await _fetch_opgg_flex_matches_from_url(opgg_url, more_pages=pages)
+            except Exception as e:
+                print(f"[OPGG][backfill] scrape failed for {name}: {type(e).__name__}: {e}")
+                ms = []
+            inserted_by_name[name] = _cache_upsert_matches(name, ms) if ms else 0
+            await _flush_opgg_flex_cache()
+
+    total_inserted = sum(inserted_by_name.values())
+    print(f"[OPGG][backfill] done: pages={pages} inserted={total_inserted}")
+    return {"total_inserted": total_inserted, "inserted_by_name": inserted_by_name}
+
+# =========================
+# Flex game watcher (cheap change detection before a full OP.GG refresh)
+# =========================
+# Instead of scraping every profile over and over until a new 5-stack shows up, poll one
+# tracked member's newest Flex match id on Riot (one match-v5 ids call) with exponential
+# backoff. Only once Riot shows a new game do we run full refreshes, again backing off
+# while OP.GG catches up.
+FLEX_WATCH_TIMEOUT_SECONDS = int(os.getenv("FLEX_WATCH_TIMEOUT_SECONDS", str(30 * 60)))
+# /refresh_flex answers through its interaction, whose token dies after 15 minutes; stop
+# early enough that a refresh still running at the deadline can finish and report back.
+FLEX_WATCH_INTERACTIVE_TIMEOUT_SECONDS = 12 * 60
+FLEX_WATCH_BACKOFF_START_SECONDS = 10.0
+FLEX_WATCH_BACKOFF_MAX_SECONDS = 120.0
+
+# match_id -> task, so several GameEnded events for one game start a single watch
+_flex_watch_tasks: dict[str, asyncio.Task] = {}
+
+
+def _flex_watch_probe(preferred_names: list[str] | None = None) -> tuple[str, str] | None:
+    """(name, puuid) of the tracked member whose newest Flex match we poll: the first of
+    `preferred_names` that's tracked, else whoever played most recently."""
+    for name in preferred_names or []:
+        puuid = (DPM_FLEX_PROFILES.get(name) or {}).get("puuid")
+        if puuid:
+            return name, puuid
+
+    best = None
+    for name, prof in DPM_FLEX_PROFILES.items():
+        if not prof.get("puuid"):
+            continue
+        _mid, created = _opgg_profile_watermark(name)
+        created_utc = _coerce_dt_to_utc(created) if isinstance(created, datetime) else None
+        if best is None or (created_utc is not None and (best[0] is None or created_utc > best[0])):
+            best = (created_utc, name, prof["puuid"])
+    return (best[1], best[2]) if best else None
 
-    Best-effort: a failure for one profile won't fail the whole refresh.
+
+async def watch_for_new_flex_game(
+    *,
+    min_group_size: int = 5,
+    probe_names: list[str] | None = None,
+    riot_match: tuple[str, datetime | None] | None = None,
+    timeout: float = FLEX_WATCH_TIMEOUT_SECONDS,
+    on_progress=None,
+) -> tuple[str, datetime | None] | None:
+    """Wait for a NEW qualifying flex game to land in the OP.GG cache.
 
     Args:
-        reason: log tag
-        force: if True, bypass the 20s anti-storm throttle and wait for the refresh lock
-               (instead of bailing) so repeated refresh attempts can be run in sequence.
+        min_group_size: tracked players that must share the match
+        probe_names: tracked member(s) to poll on Riot (default: most recently active)
+        riot_match: (riot match id, created) already known to be new, e.g. from a GameEnded
+                    event; skips straight to refreshing
+        timeout: give up after this many seconds
+        on_progress: optional async callable(str) for status updates
 
     Returns:
-        {"total_inserted": int, "inserted_by_name": {name: int}}
+        (match_id, created_at_utc) of the new qualifying match, or None on timeout.
     """
-    global _OPGG_FLEX_CACHE_LAST_REFRESH_UTC
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max(1.0, float(timeout))
 
-    now_utc = datetime.now(timezone.utc)
+    async def progress(text: str) -> None:
+        if on_progress is None:
+            return
+        try:
+            await on_progress(text)
+        except Exception:
+            pass
 
-    # Avoid refresh storms: skip if we refreshed very recently (unless forced).
-    if (not force) and _OPGG_FLEX_CACHE_LAST_REFRESH_UTC and (now_utc - _OPGG_FLEX_CACHE_LAST_REFRESH_UTC).total_seconds() < 20:
-        return {"total_inserted": 0, "inserted_by_name": {}}
+    async def sleep_until_next(delay: float) -> bool:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return False
+        await asyncio.sleep(min(delay, remaining))
+        return True
 
-    # If another refresh is running, either bail (normal) or wait our turn (force=True).
-    if _opgg_refresh_lock.locked() and not force:
-        return {"total_inserted": 0, "inserted_by_name": {}}
+    before_mid, before_t = _latest_qualifying_flex_match_info_from_cache(min_group_size=min_group_size)
+    probe = _flex_watch_probe(probe_names)
+
+    pending = riot_match
+    baseline = None
+    if pending is None and probe:
+        baseline = await _opgg_riot_newest_flex(probe[1])
+        # The game may already be over on Riot and just not on OP.GG yet.
+        if baseline and baseline[1] and (before_t is None or baseline[1] > _coerce_dt_to_utc(before_t)):
+            pending = baseline
+
+    while True:
+        # 1) Cheap signal: one Riot call per check, backing off while nothing changes.
+        #    Without a probe (no puuid / no Riot key) we can only keep refreshing.
+        delay = FLEX_WATCH_BACKOFF_START_SECONDS
+        checks = 0
+        while pending is None and probe:
+            checks += 1
+            await progress(
+                f"👀 Watching **{probe[0]}**'s newest flex game on Riot (check {checks}, next in {int(delay)}s)"
+            )
+            if not await sleep_until_next(delay):
+                return None
+            delay = min(delay * 2, FLEX_WATCH_BACKOFF_MAX_SECONDS)
+            current = await _opgg_riot_newest_flex(probe[1])
+            if current and (baseline is None or current[0] != baseline[0]):
+                pending = current
+
+        # 2) Something new on Riot: full refreshes until OP.GG publishes it.
+        delay = FLEX_WATCH_BACKOFF_START_SECONDS * 2
+        attempt = 0
+        while True:
+            attempt += 1
+            if probe and pending and pending[1] is None:
+                current = await _opgg_riot_newest_flex(probe[1])
+                if current and current[0] == pending[0]:
+                    pending = current
+            label = pending[0] if pending else "?"
+            await progress(f"🔄 New game on Riot ({label}); refreshing OP.GG (attempt {attempt})…")
+            await _opgg_refresh.refresh(f"flex_watch_{attempt}", fresh=True)
+
+            after_mid, after_t = _latest_qualifying_flex_match_info_from_cache(min_group_size=min_group_size)
+            if after_mid is not None and after_mid != before_mid:
+                return after_mid, after_t
+
+            # OP.GG has the probe's game but it didn't make a new qualifying match (not a
+            # full stack): go back to watching for the next one.
+            if probe and pending and pending[1]:
+                _wm_id, wm_created = _opgg_profile_watermark(probe[0])
+                if wm_created and _coerce_dt_to_utc(wm_created) >= pending[1] - timedelta(minutes=5):
+                    baseline, pending = pending, None
+                    break
 
-    async with _opgg_refresh_lock:
-        # Re-check convince: if we waited for the lock, another refresh may have just happened.
-        now_utc = datetime.now(timezone.utc)
-        if (not force) and _OPGG_FLEX_CACHE_LAST_REFRESH_UTC and (now_utc - _OPGG_FLEX_CACHE_LAST_REFRESH_UTC).total_seconds() < 20:
-            return {"total_inserted": 0, "inserted_by_name": {}}
+            await progress(
+                f"⏳ OP.GG hasn't published it yet; retrying in {int(delay)}s (attempt {attempt})"
+            )
+            if not await sleep_until_next(delay):
+                return None
+            delay = min(delay * 2, FLEX_WATCH_BACKOFF_MAX_SECONDS)
 
-        _OPGG_FLEX_CACHE_LAST_REFRESH_UTC = now_utc
-        _load_opgg_flex_cache()
 
-        if not DPM_FLEX_PROFILES:
-            return {"total_inserted": 0, "inserted_by_name": {}}
+async def _flex_watch_on_game_ended(event: GameEnded) -> None:
+    """Live tracker saw a Flex game end: watch for it on OP.GG and update the boards."""
+    if int(event.queue_id or 0) != 440 or not DPM_FLEX_PROFILES:
+        return
+    by_puuid = {p.get("puuid"): name for name, p in DPM_FLEX_PROFILES.items() if p.get("puuid")}
+    names = [by_puuid[a["puuid"]] for a in event.accounts if a.get("puuid") in by_puuid]
+    required = min(5, len(DPM_FLEX_PROFILES))
+    if len(names) < required:
+        return
+    running = _flex_watch_tasks.get(event.match_id)
+    if running is not None and not running.done():
+        return
 
+    async def run() -> None:
         try:
-            from playwright.async_api import async_playwright
+            found = await watch_for_new_flex_game(
+                min_group_size=required,
+                probe_names=names,
+                riot_match=(event.match_id, None),
+            )
+            if found:
+                # The coordinator already updated the persistent leaderboards.
+                print(f"[OPGG][watch] {event.match_id} published as {found[0]}")
+            else:
+                print(f"[OPGG][watch] gave up waiting for {event.match_id} on OP.GG")
         except Exception as e:
-            print(f"[OPGG][cache] playwright import failed: {type(e).__name__}: {e}")
-            return {"total_inserted": 0, "inserted_by_name": {}}
+            print(f"[OPGG][watch] watch for {event.match_id} failed: {type(e).__name__}: {e}")
+        finally:
+            _flex_watch_tasks.pop(event.match_id, None)
 
-        total_inserted = 0
-        inserted_by_name: dict[str, int] = {}
+    _flex_watch_tasks[event.match_id] = asyncio.create_task(run())
 
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=False)
-            context = await browser.new_context(locale="en-US")
 
-            async def fetch_one(name: str, opgg_url: str) -> tuple[str, list[dict] | None]:
-                try:
-                    ms = await asyncio.wait_for(
-                        _fetch_opgg_flex_matches_from_url(context, opgg_url),
-                        timeout=90,
-                    )
-                    return name, (ms or [])
-                except Exception as e:
-                    print(f"[OPGG][cache] scrape failed for {name}: {type(e).__name__}: {e}")
-                    return name, None
-
-            tasks = []
-            for name, prof in DPM_FLEX_PROFILES.items():
-                opgg_url = prof.get("opgg_url")
-                if not opgg_url:
-                    inserted_by_name[name] = 0
-                    continue
-                tasks.append(fetch_one(name, opgg_url))
+# =========================
+# OP.GG refresh coordinator
+# =========================
+# The one place that decides when to scrape OP.GG. Consumers say how stale the cache may be
+# for them (freshness SLA, seconds); demand (a leaderboard asked for while stale, a tracked
+# Flex game ending) triggers a refresh, and a jittered background pass is only a safety net
+# for games the live tracker didn't see. Concurrent requests share one in-flight refresh.
+OPGG_FRESHNESS_SLA_SECONDS = {
+    "background": int(os.getenv("OPGG_BACKGROUND_REFRESH_SECONDS", str(3 * 60 * 60))),
+    "leaderboard": 30 * 60,  # slash-command leaderboards
+    "weekly_post": 5 * 60,   # Monday auto-post
+}
+OPGG_REFRESH_JITTER_SECONDS = 90.0
+# After a refresh that got nothing from any profile, SLA-driven refreshes wait this long
+# before trying again (explicit refreshes still go through).
+OPGG_REFRESH_RETRY_SECONDS = 5 * 60
+
+
+class OPGGRefreshCoordinator:
+    def __init__(self):
+        self._inflight: asyncio.Task | None = None
+        self._task: asyncio.Task | None = None
+        self._retry_at = 0.0  # time.monotonic() before which a failed refresh isn't retried
 
-            results = await asyncio.gather(*tasks, return_exceptions=False)
+    def last_refresh(self) -> datetime | None:
+        raw = _load_opgg_flex_cache().get("refreshed_at")
+        try:
+            return _coerce_dt_to_utc(datetime.fromisoformat(raw)) if raw else None
+        except Exception:
+            return None
+
+    def age_seconds(self) -> float | None:
+        last = self.last_refresh()
+        return (datetime.now(timezone.utc) - last).total_seconds() if last else None
+
+    def is_stale(self, consumer: str) -> bool:
+        age = self.age_seconds()
+        return age is None or age > OPGG_FRESHNESS_SLA_SECONDS.get(consumer, 0)
+
+    async def ensure_fresh(self, consumer: str, *, reason: str | None = None) -> dict | None:
+        """Refresh only if the cache is older than `consumer`'s SLA (and we're not backing
+        off after a failed refresh)."""
+        if not self.is_stale(consumer) or time.monotonic() < self._retry_at:
+            return None
+        return await self.refresh(reason or consumer)
+
+    async def refresh(self, reason: str, *, fresh: bool = False) -> dict:
+        """Run one refresh now, or join the one already in flight.
 
-            for name, ms in results:
-                if not ms:
-                    inserted_by_name[name] = 0
+        fresh=True waits out an in-flight refresh and runs another: its scrape may have
+        started before whatever the caller just learned (e.g. a game ending).
+        """
+        running = self._inflight
+        if running is not None and not running.done():
+            if not fresh:
+                return await asyncio.shield(running)
+            try:
+                await asyncio.shield(running)
+            except Exception:
+                pass
+            return await self.refresh(reason)
+        self._inflight = asyncio.create_task(self._run(reason))
+        return await asyncio.shield(self._inflight)
+
+    async def _run(self, reason: str) -> dict:
+        result = await refresh_opgg_flex_cache_best_effort(reason=reason)
+        if DPM_FLEX_PROFILES and not (result or {}).get("fetched"):
+            self._retry_at = time.monotonic() + OPGG_REFRESH_RETRY_SECONDS
+            return result
+        self._retry_at = 0.0
+        if int((result or {}).get("total_inserted", 0)) > 0 or reason == "background":
+            await _update_all_persistent_flex_messages(bot, reason=reason)
+        return result
+
+    def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._background())
+
+    async def _background(self) -> None:
+        sla = OPGG_FRESHNESS_SLA_SECONDS["background"]
+        while True:
+            try:
+                age = self.age_seconds()
+                due_in = 0.0 if age is None else sla * random.uniform(0.85, 1.0) - age
+                # Last attempt failed: try again soon rather than a full interval later.
+                due_in = max(due_in, self._retry_at - time.monotonic())
+                if due_in > 0:
+                    # Demand refreshes in the meantime push this out; re-check when it's due.
+                    await asyncio.sleep(due_in)
                     continue
-                inserted = _cache_upsert_matches(name, ms)
-                inserted_by_name[name] = inserted
-                total_inserted += inserted
+                # Jitter so we don't land on top of startup / other hourly work.
+                await asyncio.sleep(random.uniform(5.0, OPGG_REFRESH_JITTER_SECONDS))
+                if self.is_stale("background"):
+                    await self.refresh("background")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[OPGG][refresh] background refresh failed: {type(e).__name__}: {e}")
+                await asyncio.sleep(OPGG_REFRESH_JITTER_SECONDS)
 
-            await context.close()
-            await browser.close()
+    def close(self) -> None:
+        for task in (self._task, self._inflight):
+            if task is not None:
+                task.cancel()
+        self._task = None
+        self._inflight = None
 
-        if total_inserted > 0:
-            _save_opgg_flex_cache(_OPGG_FLEX_CACHE)
 
-        print(f"[OPGG][cache] refresh done: inserted={total_inserted} reason={reason}")
-        return {"total_inserted": total_inserted, "inserted_by_name": inserted_by_name}
+_opgg_refresh = OPGGRefreshCoordinator()
 
 
 async def compute_recent_flex_leaderboard_from_opgg_cache(hours: int = 18) -> tuple[list[dict], datetime, datetime]:
@@ -3791,42 +6773,31 @@ async def compute_weekly_flex_leaderboard_from_opgg() -> tuple[list[dict], datet
     # 1) Pull match lists for each profile
     results_by_name: dict[str, list[dict]] = {}
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False)
-        context = await browser.new_context(locale="en-US")
-
-        async def fetch_one(name: str, url: str) -> list[dict]:
-            # hard cap each profile scrape to 25s
-            return await asyncio.wait_for(
-                _fetch_opgg_flex_matches_from_url(context, url),
-                timeout=90,
-            )
-
-        tasks = []
-        names = []
-        for name, prof in DPM_FLEX_PROFILES.items():
-            opgg_url = prof.get("opgg_url")
-            if not opgg_url:
-                results_by_name[name] = []
-                continue
-            names.append(name)
-            tasks.append(fetch_one(name, opgg_url))
-
-        # Run all profile scrapes in parallel
-        done = await asyncio.gather(*tasks, return_exceptions=True)
+    async def fetch_one(name: str, url: str) -> list[dict] | None:
+        # each scrape is capped from page checkout, so queueing for the pool doesn't count
+        return await _fetch_opgg_flex_matches_from_url(url)
 
-        for name, res in zip(names, done):
-            if isinstance(res, Exception):
-                print(f"[OPGG] scrape failed for {name}: {type(res).__name__}: {res}")
-                results_by_name[name] = []
-            else:
-                results_by_name[name] = res
-        for name, ms in results_by_name.items():
-            print(f"[OPGG] {name}: matches scraped = {len(ms or [])}")
+    tasks = []
+    names = []
+    for name, prof in DPM_FLEX_PROFILES.items():
+        opgg_url = prof.get("opgg_url")
+        if not opgg_url:
+            results_by_name[name] = []
+            continue
+        names.append(name)
+        tasks.append(fetch_one(name, opgg_url))
 
+    # Run all profile scrapes in parallel (the browser pool bounds concurrent pages)
+    done = await asyncio.gather(*tasks, return_exceptions=True)
 
-        await context.close()
-        await browser.close()
+    for name, res in zip(names, done):
+        if isinstance(res, Exception):
+            print(f"[OPGG] scrape failed for {name}: {type(res).__name__}: {res}")
+            results_by_name[name] = []
+        else:
+            results_by_name[name] = res or []
+    for name, ms in results_by_name.items():
+        print(f"[OPGG] {name}: matches scraped = {len(ms or [])}")
 
     # 2) Build match_id -> set(names) for matches in the week window
     match_to_profiles: dict[str, set[str]] = {}
@@ -4158,31 +7129,21 @@ async def fetch_schmort_match_basic(n: int = 1) -> tuple[str, dict, str]:
     if n < 1:
         n = 1
 
-    async with aiohttp.ClientSession() as session:
-        # 1) Account info
-        account_url = (
-            f"https://{RIOT_ROUTING_REGION}.api.riotgames.com/riot/account/v1/"
-            f"accounts/by-riot-id/{quote(RIOT_GAME_NAME)}/{quote(RIOT_TAGLINE)}"
-        )
-        account_data = await _riot_get_json(session, account_url, api_key)
-        puuid = account_data["puuid"]
-
-        # 2) Match list
-        count = max(n, 1)
-        matches_url = (
-            f"https://{RIOT_ROUTING_REGION}.api.riotgames.com/lol/match/v5/"
-            f"matches/by-puuid/{puuid}/ids?start=0&count={count}"
-        )
-        match_ids = await _riot_get_json(session, matches_url, api_key)
-        if len(match_ids) < n:
-            raise RuntimeError(f"Player only has {len(match_ids)} matches available.")
-        match_id = match_ids[n - 1]
-
-        # 3) Match data
-        match_url = (
-            f"https://{RIOT_ROUTING_REGION}.api.riotgames.com/lol/match/v5/matches/{match_id}"
-        )
-        match_data = await _riot_get_json(session, match_url, api_key)
+    session = _riot_http.session
+    # 1) Account info (identity registry; no account-v1 call once known)
+    puuid = (await _riot_identities.resolve(session, api_key, RIOT_GAME_NAME, RIOT_TAGLINE))["puuid"]
+
+    # 2) Match list (briefly cached; a new game is the only thing that changes it)
+    count = max(n, 1)
+    match_ids = await _match_store.recent_ids(session, api_key, RIOT_ROUTING_REGION, puuid, count)
+    if len(match_ids) < n:
+        raise RuntimeError(f"Player only has {len(match_ids)} matches available.")
+    match_id = match_ids[n - 1]
+
+    # 3) Match data (local store after the first download)
+    status, match_data = await _match_store.fetch(session, api_key, RIOT_ROUTING_REGION, match_id)
+    if status != 200 or not isinstance(match_data, dict):
+        raise RuntimeError(f"Riot API error {status}: {str(match_data)[:200]}")
 
     return match_id, match_data, puuid
 
@@ -5164,7 +8125,8 @@ async def generate_lenny_gif_unique(tag: str) -> Path:
 #   Automating a user's personal Discord client ("self-bot") is not supported by Discord ToS,
 #   so this implementation intentionally does NOT attempt to control your personal account.
 
-SPECTATE_POLL_INTERVAL_MINUTES = 1
+# Auto-spectate reacts to live_game_tracker events; off unless AUTO_SPECTATE_ENABLED=1.
+AUTO_SPECTATE_ENABLED = os.getenv("AUTO_SPECTATE_ENABLED", "0").strip().lower() in ("1", "true", "yes")
 SPECTATE_VOICE_CHANNEL_ID = 760820005226283018  # join/leave this voice channel when spectating
 
 # Riot IDs to watch (gameName#tagLine)
@@ -5189,9 +8151,6 @@ class SpectateAPIError(RuntimeError):
     pass
 
 
-# Cache (Riot ID -> puuid/platform) so we don't probe every loop
-_spectate_identity_cache: dict[str, dict] = {}
-
 # Single active spectate session at a time (as requested)
 _spectate_state = {
     "active": False,
@@ -5209,18 +8168,8 @@ def _spectate_cache_key(game_name: str, tag_line: str) -> str:
     return f"{game_name}#{tag_line}".lower()
 
 
-async def _spectate_http_get_json(session: aiohttp.ClientSession, url: str, api_key: str):
-    headers = {"X-Riot-Token": api_key}
-    _ssl = ssl.create_default_context(cafile=certifi.where())
-    async with session.get(url, headers=headers, ssl=_ssl, timeout=aiohttp.ClientTimeout(total=20)) as resp:
-        try:
-            payload = await resp.json()
-        except Exception:
-            payload = await resp.text()
-
-        if resp.status == 200:
-            return 200, payload
-        return resp.status, payload
+async def _spectate_http_get_json(session: aiohttp.ClientSession, url: str, api_key: str, *, priority: int | None = None):
+    return await _riot_request(session, url, api_key, priority=priority)
 
 
 async def _spectate_get_puuid(session: aiohttp.ClientSession, api_key: str, game_name: str, tag_line: str) -> str:
@@ -5237,23 +8186,52 @@ async def _spectate_get_puuid(session: aiohttp.ClientSession, api_key: str, game
     raise SpectateAPIError(f"Could not resolve Riot ID to PUUID. Last errors: {last_err}")
 
 
-async def _spectate_find_lol_platform(session: aiohttp.ClientSession, api_key: str, puuid: str) -> str:
-    # Same logic as spectatetest.py: probe summoner-v4/by-puuid until we find the right platform.
-    for platform in _SPECTATE_LOL_PLATFORMS_TO_TRY:
+async def _spectate_find_lol_platform(
+    session: aiohttp.ClientSession, api_key: str, puuid: str, *, preferred: str | None = None
+) -> str:
+    """Find the LoL platform a PUUID plays on (summoner-v4/by-puuid returns 200 there).
+
+    The last known platform (if any) is checked first; otherwise every platform is probed
+    concurrently and the remaining probes are cancelled on the first 200. A probe that
+    errors out (timeout, connection error) only counts as that platform's failure.
+    """
+    async def probe(platform: str) -> tuple[str, int | None, object]:
         url = f"https://{platform}.api.riotgames.com/lol/summoner/v4/summoners/by-puuid/{quote(puuid, safe='')}"
-        code, _payload = await _spectate_http_get_json(session, url, api_key)
+        try:
+            code, payload = await _spectate_http_get_json(session, url, api_key)
+        except Exception as e:
+            return platform, None, f"{type(e).__name__}: {e}"
+        return platform, code, payload
 
+    if preferred:
+        _p, code, _payload = await probe(preferred)
         if code == 200:
-            return platform
-        if code == 404:
-            continue
+            return preferred
         if code == 403:
             raise SpectateAPIError("403 Forbidden (key expired/invalid or not authorized).")
-        if code == 429:
-            raise SpectateAPIError("429 Rate limited while probing platforms. Try again shortly.")
 
-        raise SpectateAPIError(f"Unexpected error probing {platform}: {code} {str(_payload)[:200]}")
+    pending = [asyncio.create_task(probe(p)) for p in _SPECTATE_LOL_PLATFORMS_TO_TRY if p != preferred]
+    last_err = None
+    try:
+        for fut in asyncio.as_completed(pending):
+            platform, code, payload = await fut
+            if code == 200:
+                return platform
+            if code == 404:
+                continue
+            if code == 403:
+                raise SpectateAPIError("403 Forbidden (key expired/invalid or not authorized).")
+            if code is None:
+                last_err = f"{platform}: {payload}"
+                continue
+            last_err = f"{platform}: {code} {str(payload)[:200]}"
+    finally:
+        for t in pending:
+            if not t.done():
+                t.cancel()
 
+    if last_err:
+        raise SpectateAPIError(f"Could not probe every LoL platform. Last error: {last_err}")
     raise SpectateAPIError("PUUID not found on any known LoL platform.")
 
 
@@ -5275,6 +8253,224 @@ async def _spectate_check_active_game(
     raise SpectateAPIError(f"Unexpected spectator error: {code} {str(payload)[:200]}")
 
 
+# ----------------------------------------------------------------------------
+# Riot identity registry (Riot ID -> puuid + platform), shared by every subsystem
+#
+# Persisted to disk so a restart makes zero account/platform probes for known
+# accounts. Entries older than RIOT_IDENTITY_TTL_SECONDS are still served but get
+# re-verified in the background (known platform first, so usually 2 calls).
+# ----------------------------------------------------------------------------
+
+RIOT_IDENTITY_REGISTRY_FILE = os.getenv(
+    "RIOT_IDENTITY_REGISTRY_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "riot_identity_registry.json"),
+)
+RIOT_IDENTITY_TTL_SECONDS = 7 * 24 * 3600
+
+
+class RiotIdentityRegistry:
+    def __init__(self, path: str):
+        self._path = path
+        self._entries: dict[str, dict] | None = None
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._refreshing: set[str] = set()
+
+    def _load(self) -> dict[str, dict]:
+        if self._entries is not None:
+            return self._entries
+        entries: dict[str, dict] = {}
+        try:
+            if os.path.exists(self._path):
+                with open(self._path, "r", encoding="utf-8") as f:
+                    raw = json.load(f) or {}
+                for key, entry in (raw.get("identities") or {}).items():
+                    if isinstance(entry, dict) and entry.get("puuid") and entry.get("platform"):
+                        entries[str(key)] = entry
+        except Exception as e:
+            print(f"[RiotID] failed to load registry: {type(e).__name__}: {e}")
+        self._entries = entries
+        return entries
+
+    def _save(self) -> None:
+        try:
+            tmp_path = self._path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "identities": self._load()}, f, ensure_ascii=False, indent=2, sort_keys=True)
+            os.replace(tmp_path, self._path)
+        except Exception as e:
+            print(f"[RiotID] failed to save registry: {type(e).__name__}: {e}")
+
+    def get(self, game_name: str, tag_line: str) -> dict | None:
+        """Known identity (possibly stale) without any network call."""
+        return self._load().get(_spectate_cache_key(game_name, tag_line))
+
+    async def resolve(self, session: aiohttp.ClientSession, api_key: str, game_name: str, tag_line: str) -> dict:
+        """Return {"puuid", "platform", ...}; only hits Riot for unknown accounts."""
+        key = _spectate_cache_key(game_name, tag_line)
+        entry = self._load().get(key)
+        if entry:
+            age = time.time() - float(entry.get("verified_at") or 0)
+            if age > RIOT_IDENTITY_TTL_SECONDS and key not in self._refreshing:
+                self._refreshing.add(key)
+                asyncio.create_task(self._refresh_in_background(session, api_key, game_name, tag_line))
+            return entry
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._load().get(key)
+            if entry:
+                return entry
+            return await self._lookup(session, api_key, game_name, tag_line)
+
+    async def _lookup(self, session: aiohttp.ClientSession, api_key: str, game_name: str, tag_line: str) -> dict:
+        key = _spectate_cache_key(game_name, tag_line)
+        previous = self._load().get(key) or {}
+        puuid = await _spectate_get_puuid(session, api_key, game_name, tag_line)
+        preferred = previous.get("platform") if previous.get("puuid") == puuid else None
+        platform = await _spectate_find_lol_platform(session, api_key, puuid, preferred=preferred)
+        entry = {
+            "game_name": game_name,
+            "tag_line": tag_line,
+            "puuid": puuid,
+            "platform": platform,
+            "verified_at": int(time.time()),
+        }
+        self._load()[key] = entry
+        self._save()
+        return entry
+
+    async def _refresh_in_background(self, session: aiohttp.ClientSession, api_key: str, game_name: str, tag_line: str) -> None:
+        key = _spectate_cache_key(game_name, tag_line)
+        try:
+            async with self._locks.setdefault(key, asyncio.Lock()):
+                await self._lookup(session, api_key, game_name, tag_line)
+        except Exception as e:
+            print(f"[RiotID] background refresh failed for {game_name}#{tag_line}: {type(e).__name__}: {e}")
+        finally:
+            self._refreshing.discard(key)
+
+
+_riot_identities = RiotIdentityRegistry(RIOT_IDENTITY_REGISTRY_FILE)
+
+
+# ----------------------------------------------------------------------------
+# Discord presence gating (PRESENCE_GATED_POLLING)
+#
+# Tracked Riot accounts are mapped to Discord users (profile display names that
+# match USER_ID_MAPPING names, plus PRESENCE_RIOT_ACCOUNT_OVERRIDES). A mapped
+# account is only spectator-checked while one of its users shows "League of
+# Legends" in presence, or once per PRESENCE_FALLBACK_SWEEP_SECONDS (covers people
+# with presence hidden). Unmapped accounts are never gated.
+# ----------------------------------------------------------------------------
+
+PRESENCE_FALLBACK_SWEEP_SECONDS = 15 * 60
+PRESENCE_LEAGUE_ACTIVITY_NAMES = ("league of legends",)
+
+# Extra Discord user -> profile display names where the names don't line up (smurfs etc.)
+PRESENCE_RIOT_ACCOUNT_OVERRIDES: dict[int, list[str]] = {
+    133017322800545792: ["ParkySmurf"],
+}
+
+
+def _presence_riot_keys_by_user() -> dict[int, set[str]]:
+    profiles: dict[str, dict] = {}
+    for profiles_dict in (FLEX_PROFILES, SOLOQ_PROFILES):
+        for display_name, riot in (profiles_dict or {}).items():
+            profiles.setdefault(display_name.lower(), riot)
+
+    out: dict[int, set[str]] = {}
+    for user_id, names in list(USER_ID_MAPPING.items()) + list(PRESENCE_RIOT_ACCOUNT_OVERRIDES.items()):
+        for name in names:
+            riot = profiles.get(str(name).lower())
+            if not riot:
+                continue
+            game_name = (riot.get("sumname") or "").strip()
+            tag_line = (riot.get("tag") or "").strip()
+            if game_name and tag_line:
+                out.setdefault(int(user_id), set()).add(_spectate_cache_key(game_name, tag_line))
+    return out
+
+
+def _presence_is_league(member) -> bool:
+    for activity in (getattr(member, "activities", None) or ()):
+        name = str(getattr(activity, "name", "") or "").lower()
+        if any(n in name for n in PRESENCE_LEAGUE_ACTIVITY_NAMES):
+            return True
+    return False
+
+
+class PresenceGate:
+    def __init__(self):
+        self._users_by_key: dict[str, set[int]] = {}
+        for user_id, keys in _presence_riot_keys_by_user().items():
+            for key in keys:
+                self._users_by_key.setdefault(key, set()).add(user_id)
+        self._in_league: set[int] = set()
+        # (consumer, riot key) -> last fallback sweep
+        self._last_sweep: dict[tuple[str, str], float] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return PRESENCE_GATED_POLLING
+
+    def keys_for_user(self, user_id: int) -> list[str]:
+        return [key for key, users in self._users_by_key.items() if user_id in users]
+
+    def update(self, member) -> bool:
+        """Record a member's presence; True if they just opened League."""
+        user_id = int(member.id)
+        if not any(user_id in users for users in self._users_by_key.values()):
+            return False
+        was = user_id in self._in_league
+        if _presence_is_league(member):
+            self._in_league.add(user_id)
+            return not was
+        self._in_league.discard(user_id)
+        return False
+
+    def allows(self, consumer: str, key: str, now: float) -> bool:
+        if not self.enabled:
+            return True
+        users = self._users_by_key.get(key)
+        if not users or users & self._in_league:
+            return True
+        last = self._last_sweep.get((consumer, key)) or 0.0
+        if now - last >= PRESENCE_FALLBACK_SWEEP_SECONDS:
+            self._last_sweep[(consumer, key)] = now
+            return True
+        return False
+
+
+_presence_gate = PresenceGate()
+
+
+@bot.event
+async def on_presence_update(before: discord.Member, after: discord.Member):
+    if not _presence_gate.enabled:
+        return
+    try:
+        if not _presence_gate.update(after):
+            return
+        keys = _presence_gate.keys_for_user(after.id)
+        print(f"[Presence] {after.display_name} opened League; polling {', '.join(keys)}")
+        for key in keys:
+            live_game_tracker.poke(key)
+    except Exception as e:
+        print(f"[Presence] on_presence_update error: {type(e).__name__}: {e}")
+
+
+def _presence_seed_from_guilds() -> None:
+    """Pick up members who already had League open when the bot connected."""
+    if not _presence_gate.enabled:
+        return
+    seen = 0
+    for guild in bot.guilds:
+        for member in guild.members:
+            if _presence_gate.update(member):
+                seen += 1
+    print(f"[Presence] gating enabled; {seen} tracked member(s) currently in League")
+
+
 def _spectate_build_command(game_info: dict):
     platform_id = game_info.get("platformId")
     game_id = game_info.get("gameId")
@@ -5610,7 +8806,7 @@ async def _start_spectate_session(target_label: str, platform: str, puuid: str,
     _spectate_state["screenshare_task"] = screenshare_task
 
     # IMPORTANT: do NOT wait on proc.wait() here; League often stays open on the post-game screen.
-    # auto_spectate_loop() will poll Riot's spectator API and call _stop_spectate_session() when the match ends.
+    # live_game_tracker's GameEnded event calls _stop_spectate_session() when the match ends.
     return
 
 
@@ -5636,123 +8832,73 @@ async def _stop_screenshare_best_effort():
     _spectate_state["screenshare_task"] = None
 
 
-@tasks.loop(minutes=SPECTATE_POLL_INTERVAL_MINUTES)
-async def auto_spectate_loop():
-    """Every 3 minutes:
-    - If NOT currently spectating: check targets in order; spectate the first one found in-game.
-    - If currently spectating: keep spectating until that target is out of game (then stop + leave voice).
+async def _auto_spectate_on_game_started(event: GameStarted):
+    """Spectate the first SPECTATE_TARGETS account (in list order) that starts a game.
+
+    While spectating, only the current target matters: if they start a NEW game the
+    spectator is restarted with the new args.
     """
-    api_key = os.getenv("RIOT_API_KEY")
-    if not api_key:
-        print("[Spectate] RIOT_API_KEY not set; skipping.")
+    if _spectate_state.get("active"):
+        puuid = _spectate_state.get("puuid")
+        if puuid not in {a["puuid"] for a in event.accounts}:
+            return
+        if event.game_id == _spectate_state.get("game_id") and _is_proc_running(_spectate_state.get("proc")):
+            return
+        label = _spectate_state.get("target_label")
+        print(f"[Spectate] {label} started a new game (old={_spectate_state.get('game_id')}, new={event.game_id}); restarting spectator.")
+        await _stop_spectate_session()
+        await _start_spectate_session(label, event.platform, puuid, event.info)
         return
 
-    try:
-        async with aiohttp.ClientSession() as session:
-            # If we're already spectating: only monitor the current target
-            if _spectate_state.get("active"):
-                platform = _spectate_state.get("platform")
-                puuid = _spectate_state.get("puuid")
-                label = _spectate_state.get("target_label")
-
-                if not platform or not puuid:
-                    # Defensive: reset if state is corrupt
-                    _stop_spectate_session()
-                    await _leave_voice_if_joined()
-                    return
-
-                in_game, _info = await _spectate_check_active_game(session, api_key, platform, puuid)
-
-                current_game_id = _spectate_state.get("game_id")
-                new_game_id = (_info or {}).get("gameId")
-
-                if in_game and _is_proc_running(_spectate_state.get("proc")):
-                    # If they started a NEW game, restart spectator with new args
-                    if new_game_id and current_game_id and new_game_id != current_game_id:
-                        print(f"[Spectate] {label} started a new game (old={current_game_id}, new={new_game_id}); restarting spectator.")
-                        await _stop_spectate_session()
-                        await _start_spectate_session(label, platform, puuid, _info)
-                    return
-
-
-                # Out of game (or League proc died)
-                print(f"[Spectate] {label} is no longer in game; stopping spectate.")
-                await _stop_spectate_session()
-                await _leave_voice_if_joined()
-                return
-
-            # Not currently spectating: scan targets
-            for t in SPECTATE_TARGETS:
-                label = t["label"]
-                game_name = t["game_name"]
-                tag_line = t["tag_line"]
-
-                key = _spectate_cache_key(game_name, tag_line)
-                cached = _spectate_identity_cache.get(key)
-
-                if not cached:
-                    puuid = await _spectate_get_puuid(session, api_key, game_name, tag_line)
-                    platform = await _spectate_find_lol_platform(session, api_key, puuid)
-                    cached = {"puuid": puuid, "platform": platform}
-                    _spectate_identity_cache[key] = cached
-
-                puuid = cached["puuid"]
-                platform = cached["platform"]
-
-                in_game, game_info = await _spectate_check_active_game(session, api_key, platform, puuid)
-                if not in_game or not game_info:
-                    continue
+    # ------------------------------------------------------------
+    # OPTIONAL GAME-TYPE FILTER (edit here if you want):
+    # queue ids: 420=SoloQ, 440=Flex, 400=Normal Draft, etc.
+    # Example: ONLY spectate SoloQ (420):
+    if event.queue_id != 420:
+        return
+    # ------------------------------------------------------------
 
-                # ------------------------------------------------------------
-                # OPTIONAL GAME-TYPE FILTER (edit here if you want):
-                #
-                # The spectator payload includes:
-                #   - gameQueueConfigId (queue id: 420=SoloQ, 440=Flex, 400=Normal Draft, etc.)
-                #   - gameType / gameMode
-                #
-                # Example: ONLY spectate SoloQ (420):
-                if game_info.get("gameQueueConfigId") != 420:
-                    continue
-                #
-                # Example: ONLY spectate Flex (440):
-                #   if game_info.get("gameQueueConfigId") != 440:
-                #       continue
-                # ------------------------------------------------------------
+    in_game = {a["key"]: a for a in event.accounts}
+    for t in SPECTATE_TARGETS:
+        a = in_game.get(_spectate_cache_key(t["game_name"], t["tag_line"]))
+        if a:
+            await _start_spectate_session(t["label"], event.platform, a["puuid"], event.info)
+            return
 
-                await _start_spectate_session(label, platform, puuid, game_info)
-                return
 
-    except SpectateAPIError as e:
-        print(f"[Spectate] Riot API error: {e}")
-    except Exception as e:
-        print(f"[Spectate] Error in auto_spectate_loop: {type(e).__name__}: {e}")
+async def _auto_spectate_on_game_ended(event: GameEnded):
+    if not _spectate_state.get("active"):
+        return
+    if _spectate_state.get("puuid") not in {a["puuid"] for a in event.accounts}:
+        return
+    print(f"[Spectate] {_spectate_state.get('target_label')} is no longer in game; stopping spectate.")
+    await _stop_spectate_session()
+    await _leave_voice_if_joined()
 
 
-@auto_spectate_loop.before_loop
-async def _before_auto_spectate_loop():
-    await bot.wait_until_ready()
+def _auto_spectate_subscribe() -> None:
+    for t in SPECTATE_TARGETS:
+        live_game_tracker.watch(t["game_name"], t["tag_line"])
+    live_game_tracker.subscribe(GameStarted, _auto_spectate_on_game_started)
+    live_game_tracker.subscribe(GameEnded, _auto_spectate_on_game_ended)
 
 _ready_synced = False
 
-@tasks.loop(minutes=10)
-async def josh_soloq_lp_nickname_loop():
+async def _josh_on_rank_changed(event: RankChanged):
     """
-    Every 30 minutes:
-      - fetch Josh SoloQ LP
-      - if LP changed since last check, update nickname in guild
+    On a SoloQ rank change for Josh (from live_game_tracker):
+      - if LP changed since last saved, update nickname in guild
     """
-    api_key = os.getenv("RIOT_API_KEY")
-    if not api_key:
-        print("[JoshLP] RIOT_API_KEY not set; skipping.")
+    if event.key != _spectate_cache_key(JOSH_RIOT_GAME_NAME, JOSH_RIOT_TAG_LINE):
+        return
+    if event.queue_type != "RANKED_SOLO_5x5":
         return
 
     state = _load_josh_soloq_state()
     last_lp = state.get("last_lp")
-    last_tier = state.get("last_tier")
 
     try:
-        async with aiohttp.ClientSession() as session:
-            lp, tier = await _get_josh_soloq_lp_and_tier(session, api_key)
+        lp, tier = _josh_soloq_lp_and_tier(event.entry)
 
         # Only update when LP changes (as requested).
         # (If you also want tier changes to update, change this condition to: if lp != last_lp or tier != last_tier)
@@ -5785,24 +8931,8 @@ async def josh_soloq_lp_nickname_loop():
     except discord.HTTPException as e:
         print(f"[JoshLP] Discord HTTPException: {e}")
     except Exception as e:
-        print(f"[JoshLP] Error in loop: {e}")
-
-
-@josh_soloq_lp_nickname_loop.before_loop
-async def _before_josh_soloq_lp_nickname_loop():
-    await bot.wait_until_ready()
-
-
-@tasks.loop(minutes=30)
-async def opgg_cache_refresh_loop():
-    # Best-effort periodic refresh of OP.GG cache, then update any persistent leaderboard posts demostrar.
-    await refresh_opgg_flex_cache_best_effort(reason="loop_30m")
-    await _update_all_persistent_flex_messages(bot, reason="loop_30m")
+        print(f"[JoshLP] Error handling rank change: {e}")
 
-@opgg_cache_refresh_loop.before_loop
-async def _before_opgg_cache_refresh_loop():
-    await bot.wait_until_ready()
-    
 
 @bot.event
 async def on_ready():
@@ -5822,15 +8952,24 @@ async def on_ready():
     await bot.add_cog(RPSCog(bot))
     await bot.add_cog(CustomsCog(bot))
     await bot.add_cog(PredictionCog(bot))
+    _presence_seed_from_guilds()
 
-    if not opgg_cache_refresh_loop.is_running():
-        opgg_cache_refresh_loop.start()
-        
-    josh_soloq_lp_nickname_loop.start()
-
+    # Message expiry / voting deadlines (PredictionCog registered its kinds above)
+    _timers.register("delete_message", lambda payloads: _timer_delete_messages(bot, payloads))
+    _timers.start()
 
-    #if not auto_spectate_loop.is_running():
-    #    auto_spectate_loop.start()
+    # OP.GG cache: background safety-net refreshes (demand refreshes come from commands/games)
+    _opgg_refresh.start()
+        
+    # Riot polling: PredictionCog registered its accounts above; Josh LP and
+    # auto-spectate are just more subscribers on the same tracker.
+    live_game_tracker.watch(JOSH_RIOT_GAME_NAME, JOSH_RIOT_TAG_LINE, ranks=True)
+    live_game_tracker.subscribe(RankChanged, _josh_on_rank_changed)
+    if AUTO_SPECTATE_ENABLED:
+        _auto_spectate_subscribe()
+    # A tracked Flex stack finishing is the cue to pull the game from OP.GG.
+    live_game_tracker.subscribe(GameEnded, _flex_watch_on_game_ended)
+    live_game_tracker.start()
 
     
 
@@ -6492,22 +9631,15 @@ class GeneralCog(commands.Cog):
         self.bot = bot
 
         # Start the weekly Flex leaderboard task (auto-post)
+        # (OP.GG cache refreshes are _opgg_refresh's job.)
         self.flex_weekly_leaderboard_task.start()
 
-        # Keep OP.GG cache warm so slash commands don't depend on a live scrape.
-        # Runs every 30 minutes (headless; no browser window).
-        self.flex_opgg_cache_refresh_task.start()
-
     def cog_unload(self):
         # Stop background tasks cleanly
         try:
             self.flex_weekly_leaderboard_task.cancel()
         except Exception:
             pass
-        try:
-            self.flex_opgg_cache_refresh_task.cancel()
-        except Exception:
-            pass
 
     @app_commands.command(name="ask", description="Ask the bot a question (optional: '(2hrs) question...' for context)")
     async def ask(self, interaction: Interaction, question: str):
@@ -7014,9 +10146,11 @@ class GeneralCog(commands.Cog):
         # You can add permission checks here if you want
         await interaction.response.defer(thinking=True)
 
-        # Only refresh if explicitly requested
+        # Refresh first if explicitly requested, or if the cache is staler than a leaderboard allows
         if refresh == "1":
-            await refresh_opgg_flex_cache_best_effort(reason="command")
+            await _opgg_refresh.refresh("command")
+        else:
+            await _opgg_refresh.ensure_fresh("leaderboard")
         await _update_all_persistent_flex_messages(self.bot, reason="weekly_flex_leaderboard")
 
         entries, week_start, now = await compute_weekly_flex_leaderboard_from_opgg_cache()
@@ -7046,23 +10180,6 @@ class GeneralCog(commands.Cog):
                 pass
 
 
-    # -------------------------------
-    # OP.GG cache refresher
-    # -------------------------------
-    @tasks.loop(minutes=60)
-    async def flex_opgg_cache_refresh_task(self):
-        await self.bot.wait_until_ready()
-        await refresh_opgg_flex_cache_best_effort(reason="loop")
-
-    
-
-    @flex_opgg_cache_refresh_task.before_loop
-    async def before_flex_opgg_cache_refresh_task(self):
-        await self.bot.wait_until_ready()
-        # Prime the cache once at startup so /weekly_flex_leaderboard works immediately.
-        await refresh_opgg_flex_cache_best_effort(reason="startup")
-        await _update_all_persistent_flex_messages(self.bot, reason="startup")
-
     # Runs every day at local midnight; only posts on Monday 00:00 local
     # which is effectively "Sunday night at midnight".
     @tasks.loop(time=dtime(hour=0, minute=0, tzinfo=LOCAL_TIMEZONE))
@@ -7073,7 +10190,7 @@ class GeneralCog(commands.Cog):
         # Monday is 0; we only post at Monday 00:00
         if now_local.weekday() != 0:
             return
-        await refresh_opgg_flex_cache_best_effort(reason="command")
+        await _opgg_refresh.ensure_fresh("weekly_post")
         entries, week_start, now = await compute_weekly_flex_leaderboard_from_opgg_cache()
         msg = format_flex_leaderboard(entries, week_start, now)
 
@@ -7098,11 +10215,12 @@ class GeneralCog(commands.Cog):
     async def flex_leaderboard_recent(self, interaction: discord.Interaction, refresh: str | None = None):
         await interaction.response.defer()
 
-        # Uses the OP.GG cache (auto-refreshed every 30 minutes) so we don't
+        # Uses the OP.GG cache (kept fresh by _opgg_refresh) so we don't
         # depend on the DPM site being up and we can accumulate >20 matches over time.
-        # Only refresh if explicitly requested
         if refresh == "1":
-            await refresh_opgg_flex_cache_best_effort(reason="post_leaderboard")
+            await _opgg_refresh.refresh("post_leaderboard")
+        else:
+            await _opgg_refresh.ensure_fresh("leaderboard")
         await _update_all_persistent_flex_messages(self.bot, reason="flex_leaderboard_session")
 
         entries, start_utc, end_utc = await compute_recent_flex_leaderboard_from_opgg_cache(hours=18)
@@ -7223,11 +10341,48 @@ class GeneralCog(commands.Cog):
         await interaction.followup.send("✅ Posted a new **persistent session** leaderboard (I’ll keep editing it).", ephemeral=True)
 
 
+    @app_commands.command(
+        name="backfill_flex",
+        description="Deep-scrape older OP.GG flex history for every tracked profile (slow).",
+    )
+    @app_commands.describe(pages='How many extra OP.GG "Show more" pages to load per profile (default 10, max 20).')
+    async def backfill_flex(self, interaction: discord.Interaction, pages: int = 10):
+        global _opgg_backfill_task
+        if _opgg_backfill_task is not None and not _opgg_backfill_task.done():
+            await interaction.response.send_message("⏳ A backfill is already running.", ephemeral=True)
+            return
+
+        # Runs far longer than an interaction token lives: report to the channel instead.
+        pages = max(1, min(int(pages), OPGG_BACKFILL_MAX_PAGES))
+        channel = interaction.channel
+        bot = self.bot
+
+        async def run() -> None:
+            try:
+                result = await backfill_opgg_flex_cache(pages=pages)
+                await _update_all_persistent_flex_messages(bot, reason="backfill_flex")
+                per_name = ", ".join(f"{name} +{n}" for name, n in (result.get("inserted_by_name") or {}).items() if n)
+                text = f"✅ Flex backfill done. Inserted **{int(result.get('total_inserted', 0))}** older matches." + (f"\n{per_name}" if per_name else "")
+            except Exception as e:
+                print(f"[OPGG][backfill] failed: {type(e).__name__}: {e}")
+                text = f"❌ Flex backfill failed: {type(e).__name__}"
+            try:
+                if channel is not None:
+                    await channel.send(text)
+            except Exception as e:
+                print(f"[OPGG][backfill] could not report: {type(e).__name__}: {e}")
+
+        _opgg_backfill_task = asyncio.create_task(run())
+        await interaction.response.send_message(
+            f"🔄 Backfilling {pages} page(s) per profile in the background; I'll post here when it's done.",
+            ephemeral=True,
+        )
+
     @app_commands.command(
         name="refresh_flex",
-        description="Refresh flex history, optionally spam refresh until new game",
+        description="Refresh flex history, optionally wait for a new game",
     )
-    @app_commands.describe(wait_for_new="0 = refresh once (default). 1 = keep refreshing until a new qualifying game appears.")
+    @app_commands.describe(wait_for_new="0 = refresh once (default). 1 = watch Riot and refresh once a new qualifying game appears.")
     async def refresh_flex(self, interaction: discord.Interaction, wait_for_new: int = 0):
         await interaction.response.defer(ephemeral=True, thinking=True)
 
@@ -7235,8 +10390,7 @@ class GeneralCog(commands.Cog):
 
         # Default: refresh once
         if int(wait_for_new) != 1:
-            result = await refresh_opgg_flex_cache_best_effort(reason="refresh_flex_once", force=True)
-            await _update_all_persistent_flex_messages(self.bot, reason="refresh_flex_once")
+            result = await _opgg_refresh.refresh("refresh_flex_once", fresh=True)
 
             _mid, t_utc = _latest_qualifying_flex_match_info_from_cache(min_group_size=required)
             inserted_total = int((result or {}).get("total_inserted", 0))
@@ -7246,43 +10400,31 @@ class GeneralCog(commands.Cog):
             )
             return
 
-        # Optional: keep refreshing until a NEW qualifying game appears
+        # Optional: watch a cheap Riot signal, and refresh OP.GG only once a new game shows up
         before_mid, before_t = _latest_qualifying_flex_match_info_from_cache(min_group_size=required)
-
-        max_attempts = 90
-        sleep_seconds = 4
-
-        status_msg = await interaction.followup.send(
-            f"🔄 Waiting for OP.GG… (need a NEW qualifying flex game with ≥{required} tracked players)\nCurrent qualifying match: **{_format_dt_et_short(before_t)}**",
-            ephemeral=True,
+        header = (
+            f"🔄 Waiting for a NEW qualifying flex game (≥{required} tracked players)\n"
+            f"Current qualifying match: **{_format_dt_et_short(before_t)}**"
         )
+        status_msg = await interaction.followup.send(header, ephemeral=True)
 
-        for attempt in range(1, max_attempts + 1):
-            await refresh_opgg_flex_cache_best_effort(reason=f"refresh_flex_attempt_{attempt}", force=True)
-
-            after_mid, after_t = _latest_qualifying_flex_match_info_from_cache(min_group_size=required)
-            changed = (after_mid is not None and after_mid != before_mid)
-
-            try:
-                await status_msg.edit(
-                    content=(
-                        f"🔄 Waiting for OP.GG… (need a NEW qualifying flex game with ≥{required} tracked players)\nAttempt **{attempt}/{max_attempts}**. Newest qualifying match: **{_format_dt_et_short(after_t)}**"
-                    )
-                )
-            except Exception:
-                pass
+        async def on_progress(text: str) -> None:
+            await status_msg.edit(content=f"{header}\n{text}")
 
-            if changed:
-                await _update_all_persistent_flex_messages(self.bot, reason="refresh_flex")
-                await interaction.followup.send(
-                    f"✅ New qualifying flex game detected: **{_format_dt_et_short(after_t)}** — cache refreshed.",
-                    ephemeral=True,
-                )
-                return
+        found = await watch_for_new_flex_game(
+            min_group_size=required,
+            probe_names=USER_ID_MAPPING.get(interaction.user.id),
+            timeout=FLEX_WATCH_INTERACTIVE_TIMEOUT_SECONDS,
+            on_progress=on_progress,
+        )
 
-            await asyncio.sleep(sleep_seconds)
+        if found:
+            await interaction.followup.send(
+                f"✅ New qualifying flex game detected: **{_format_dt_et_short(found[1])}** — cache refreshed.",
+                ephemeral=True,
+            )
+            return
 
-        await _update_all_persistent_flex_messages(self.bot, reason="refresh_flex_timeout")
         await interaction.followup.send(
             "⚠️ Timed out waiting for OP.GG to publish the new 5-man flex game. Try again in a minute.",
             ephemeral=True,